@@ -0,0 +1,59 @@
+"""Compare serverly's routing engines with the plain loop over all patterns (the pre-router behaviour).
+
+Usage: python benchmarks/routing.py [number of lookups per measurement]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serverly.routing import CombinedRegexRouter, TrieRouter  # noqa: E402
+
+
+def literal_routes(n: int):
+    return [f"^/api/v1/resource{i}/items$" for i in range(n)]
+
+
+def regex_routes(n: int):
+    return [f"^/api/v1/resource{i}/[0-9]+$" for i in range(n)]
+
+
+def loop(patterns):
+    def match(path):
+        for pattern in patterns:
+            if re.match(pattern, path):
+                return pattern
+        return None
+    return match
+
+
+def bench(name: str, patterns: list, paths: list, number: int):
+    engines = {
+        "loop": loop(patterns),
+        "trie": TrieRouter(patterns).match,
+        "regex": CombinedRegexRouter(patterns).match
+    }
+    results = []
+    for engine, match in engines.items():
+        for path in paths:  # warm up caches (re, lazy compilation)
+            assert match(path) != None
+        t = timeit.timeit(lambda: [match(p) for p in paths], number=number)
+        results.append(
+            f"{engine}: {t / (number * len(paths)) * 1000000:8.2f} µs")
+    print(f"{name:>8} {len(patterns):>5} routes | " + " | ".join(results))
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for n in (10, 100, 1000):
+        # first, middle and last route to average out first-match-wins
+        paths = [f"/api/v1/resource{i}/items" for i in (0, n // 2, n - 1)]
+        bench("literal", literal_routes(n), paths, number)
+        paths = [f"/api/v1/resource{i}/42" for i in (0, n // 2, n - 1)]
+        bench("regex", regex_routes(n), paths, number)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,10 @@ Attributes
 
 `logger: fileloghelper.Logger = Logger()` The logger used for logging (surprise!!). See the docs of fileloghelper for reference.
 
+`handler_threads: int = 32` Number of threads sync functions are run in, so they don't block the server. Functions defined with `async def` are awaited directly instead. Needs to be set before running start()
+
+`worker_shutdown_timeout: float = 10` Seconds worker processes (see `start(workers=...)`) get to finish their requests when stopped/restarted before they're killed.
+
 
 Methods
 --
@@ -18,14 +22,20 @@ Methods
 
 `register(func, path: str)`
 
+`use_router(router: str)` change the routing engine ('trie' or 'regex')
+
+`set_route_cache_size(size: int)` set the maximum number of cached route resolutions
+
 `unregister(method: str, path: str)`unregister any page (static or dynamic). Only affect the `method`-path (GET / POST)
 
-`start(superpath: str="/")` start the server after applying all relevant attributes like address. `superpath` will replace every occurence of SUPERPATH/ or /SUPERPATH/ with `superpath`. Especially useful for servers orchestrating other servers.
+`start(superpath: str="/", workers: int=1)` start the server (with `workers` worker processes) after applying all relevant attributes like address. `superpath` will replace every occurence of SUPERPATH/ or /SUPERPATH/ with `superpath`. Especially useful for servers orchestrating other servers.
 
 
 Decorators (technically methods)
 --
-`serves(method: str, path: str)` Register the function to serve a specific path.
+`stream_body(func)` Let the function consume the request body as a stream (`request.stream`) instead of buffering it.
+
+`serves(method: str, path: str)` Register the function to serve a specific path. Use the method 'websocket' for WebSocket endpoints (see `serverly.websocket`).
 Example:
 ```
 @serves_get("/hello(world)?")
@@ -36,24 +46,40 @@ This will return "Hello World!" with a status code of 200, as plain text to the
 """
 
 
+import asyncio
+import collections.abc
+import concurrent.futures
+import contextvars
 import importlib
+import inspect
 import multiprocessing
+import multiprocessing.connection
 import os
 import re
+import signal
 import time
 import urllib.parse as parse
 import warnings
 from functools import wraps
 from typing import Union
 
+import serverly.bandwidth
+import serverly.compression
 import serverly.err
+import serverly.objects
 import serverly.plugins
+import serverly.ranges
+import serverly.routing
+import serverly.slowlog
+import serverly.staticfiles
 import serverly.stater
 import serverly.statistics
+import serverly.tracing
+import serverly.websocket
 import uvicorn
 from fileloghelper import Logger
 from serverly import default_sites
-from serverly.objects import Request, Response, StaticSite
+from serverly.objects import FileResponse, Request, Response, StaticSite
 from serverly.utils import *
 
 description = "A really simple-to-use HTTP-server"
@@ -65,69 +91,312 @@ logger.header(True, True, description, fileloghelper_version=True,
               program_version="serverly v" + version)
 error_response_templates = {}
 https_redirect_url: str = None
+handler_threads = 32
+worker_shutdown_timeout = 10
 
 
-async def _read_body(receive):
+async def _iter_body(receive):
     """
-    Read and return the entire body from an incoming ASGI message.
+    Yield the body of an incoming ASGI message chunk by chunk (bytes).
     http://www.uvicorn.org/#http-scope
     """
-    body = b''
     more_body = True
 
     while more_body:
         message = await receive()
-        body += message.get('body', b'')
+        if message["type"] == "http.disconnect":
+            return
+        yield message.get('body', b'')
         more_body = message.get('more_body', False)
 
-    return body.decode("utf-8")
+
+async def _read_body(receive):
+    """
+    Read and return the entire (raw) body from an incoming ASGI message.
+    http://www.uvicorn.org/#http-scope
+    """
+    return b''.join([chunk async for chunk in _iter_body(receive)])
+
+
+_NOT_MODIFIED_HEADERS = ("cache-control", "content-location",
+                         "date", "etag", "expires", "last-modified", "vary")
+
+
+def _not_modified(response: Response):
+    """Return a bodiless 304 - Not Modified response carrying the validators & caching headers of `response`."""
+    r = Response(304, {k: v for k, v in response.headers.items()
+                       if k in _NOT_MODIFIED_HEADERS})
+    r.headers.pop("content-type", None)
+    return r
+
+
+def _prepare_response(request: Request, response: Response):
+    """Return the response to actually send for `request` (conditional requests, ranges & compression applied), its body (bytes, None for FileResponses & streamed bodies) and the encoding the file/stream is to be compressed with while sending (or None)."""
+    streamed = getattr(response, "stream", None) != None
+    serialized = not streamed and response._body is serverly.objects._NOT_COMPUTED
+    body = None if streamed or isinstance(
+        response, FileResponse) else response.body_bytes
+    if serialized and b"SUPERPATH/" in body:  # object bodies are only serialized now (text bodies in Sitemap._get_response)
+        superpath = bytes(_sitemap.superpath, "utf-8")
+        body = body.replace(b"/SUPERPATH/", superpath).replace(b"SUPERPATH/", superpath)
+    if getattr(response, "etag", False) and body != None and not "etag" in response.headers:
+        response.headers["etag"] = serverly.utils.content_etag(body)
+    if not isinstance(request, Request):
+        return response, body, None
+    etag = response.headers.get("etag", None)  # likely to be sent again if set
+    if etag != None and etag.startswith("W/"):  # doesn't identify the exact bytes
+        etag = None
+    size = response.headers.get("content-length", None) if body == None else len(body)
+    encoding = serverly.compression.prepare(
+        request.headers, response, None if size == None else int(size))
+    if request.method == "get":
+        if response.code == 200 and serverly.utils.is_not_modified(request.headers, response.headers):
+            return _not_modified(response), b"", None
+        if not streamed:
+            response, body = serverly.ranges.partial_response(
+                request.headers, response, body)
+    if encoding != None and body != None:
+        return response, serverly.compression.compress(body, encoding, etag), None
+    return response, body, encoding
+
+
+async def _send_chunks(send, chunks):
+    """Send the (bytes) iterable `chunks` as the body of a response via the ASGI `send` callable."""
+    pending = b""
+    for chunk in chunks:
+        if pending:
+            await send({"type": "http.response.body", "body": pending, "more_body": True})
+        pending = chunk
+    await send({"type": "http.response.body", "body": pending, "more_body": False})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_stream(send, stream, encoding: str = None, bandwidth: int = None, receive=None):
+    """Send the chunks (bytes or str) of the (async) iterator `stream` as the body of a response via the ASGI `send` callable, compressed with `encoding` and regulated to `bandwidth` (if not None). Sync iterators are advanced in the handler thread pool, as producing a chunk might block.
+
+    A chunk is only produced after the previous one was sent (backpressure). If `receive` is given, the stream is closed as soon as the client disconnects."""
+    compressor = serverly.compression.Compressor(
+        encoding) if encoding != None else None
+    buckets = serverly.bandwidth.get_buckets(
+        bandwidth) if bandwidth != None else []
+    is_async = isinstance(stream, collections.abc.AsyncIterator)
+    disconnected = asyncio.ensure_future(
+        _wait_for_disconnect(receive)) if receive != None else None
+    done = object()
+
+    async def next_chunk():
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return done
+    try:
+        while disconnected == None or not disconnected.done():
+            if not is_async:
+                chunk = await _sitemap._run_in_thread(next, stream, done)
+            elif disconnected == None:
+                chunk = await next_chunk()
+            else:  # e.g. waiting for events, so don't wait for the next chunk to notice
+                fetch = asyncio.ensure_future(next_chunk())
+                await asyncio.wait({fetch, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not fetch.done():
+                    fetch.cancel()
+                    try:
+                        await fetch
+                    except (asyncio.CancelledError, Exception):
+                        pass
+                    return
+                chunk = fetch.result()
+            if chunk is done:
+                break
+            if type(chunk) == str:
+                chunk = chunk.encode("utf-8")
+            if compressor != None:
+                chunk = compressor.compress(chunk)
+            if not chunk:
+                continue
+            for bucket in buckets:
+                await bucket.consume(len(chunk))
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            return
+        await send({
+            "type": "http.response.body",
+            "body": compressor.flush() if compressor != None else b"",
+            "more_body": False
+        })
+    finally:
+        if disconnected != None:
+            disconnected.cancel()
+        if is_async and hasattr(stream, "aclose"):
+            await stream.aclose()
+        elif not is_async and hasattr(stream, "close"):
+            stream.close()
+
+
+def _get_url(scope):
+    """[internal] Return the parsed URL (path & query) of the request in ASGI `scope`."""
+    return parse.urlparse(scope["path"] + "?" + str(scope["query_string"], "utf-8"))
+
+
+def _get_headers(scope):
+    """[internal] Return the headers of the request in ASGI `scope` as a dict."""
+    headers = {}
+    for hl in scope["headers"]:
+        if hl[0] != "authorization":
+            v = str(hl[1], "utf-8")
+        else:
+            v = hl[1]
+        headers[str(hl[0], "utf-8")] = v
+    return headers
+
+
+def _apply_header_plugins(request: Request, response: Response):
+    """[internal] Return `response` as manipulated by the header plugins not excluded for the path of `request`."""
+    new_response = response
+    for plugin in serverly.plugins._plugin_manager.header_plugins:
+        try:
+            for e in plugin.exceptions:
+                if re.match(e, request.path.path):
+                    raise serverly.err._BrakeException()
+        except serverly.err._BrakeException:
+            continue
+        try:
+            new_response = plugin.manipulateHeaders(response)
+        except Exception as e:
+            logger.handle_exception(e)
+            new_response = None
+        if new_response == None:
+            new_response = response
+            break
+    return new_response
+
+
+async def _deny_websocket(scope, send, ws, response: Response):
+    """[internal] Reject the handshake of WebSocket `ws` with `response`, if the server supports that, else close it with code 1008 (policy violation)."""
+    if not "websocket.http.response" in (scope.get("extensions", None) or {}):
+        await ws.close(1008)
+        return
+    response = _apply_header_plugins(ws, response)
+    body = response.body_bytes
+    response.headers["content-length"] = str(len(body))
+    ws.closed = True
+    await send({
+        "type": "websocket.http.response.start",
+        "status": response.code,
+        "headers": [[bytes(k, "utf-8"), serverly.utils.get_bytes(v)] for k, v in response.headers.items()]
+    })
+    await send({"type": "websocket.http.response.body", "body": body})
+
+
+async def _serve_websocket(scope, receive, send):
+    """[internal] Serve a WebSocket connection: call the function registered for 'websocket' & the path with a `serverly.websocket.WebSocket`. Deny the handshake if it returns a Response before accepting, close the connection afterwards."""
+    if (await receive())["type"] != "websocket.connect":
+        return
+    ws = None
+    try:
+        site = _sitemap.get_site("websocket", scope["path"])
+        ws = serverly.websocket.WebSocket(_get_url(scope), _get_headers(
+            scope), scope.get("client", None), receive, send, scope.get("subprotocols", []))
+        code = 1000
+        if site == None or isinstance(site, StaticSite):
+            content = error_response(404)
+        else:
+            try:
+                if inspect.iscoroutinefunction(site):
+                    content = _sitemap._call_site(site, ws)
+                else:  # e.g. wrapped by an auth decorator
+                    content = await _sitemap._run_in_thread(_sitemap._call_site, site, ws)
+                if inspect.isawaitable(content):
+                    content = await content
+            except serverly.err.WebSocketDisconnect:
+                content = None
+            except Exception as e:
+                content = _sitemap._handle_site_exception(site, e)
+                code = 1011
+        if ws.closed:
+            return
+        if not ws.accepted and isinstance(content, Response):
+            await _deny_websocket(scope, send, ws, content)
+        else:
+            await ws.close(code)
+    except Exception as e:
+        logger.handle_exception(e)
+        if ws != None and not ws.closed:
+            await ws.close(1011)
 
 
 async def _uvicorn_server(scope, receive, send):
     t1 = time.perf_counter()
+    t2 = None
     func = "some_error"
     if scope["type"].startswith("lifespan"):
         event = await receive()
         s = event["type"].replace("lifespan.", "")
         _update_status(s)
     elif scope["type"] == "http":
+        started = False
+        code = 500
+        slow = serverly.slowlog.start(
+            scope) if serverly.slowlog.threshold != None else None
+        timing = serverly.statistics.Timing(
+            t1) if serverly.statistics.stages or slow != None else None
+        span = serverly.tracing.start_request(
+            scope) if serverly.tracing.enabled else None
+        serverly.statistics.request_started()
         try:
-            b = await _read_body(receive)
-            full_url = scope["path"] + "?" + \
-                str(scope["query_string"], "utf-8")
-            headers = {}
-            for hl in scope["headers"]:
-                if hl[0] != "authorization":
-                    v = str(hl[1], "utf-8")
-                else:
-                    v = hl[1]
-                headers[str(hl[0], "utf-8")] = v
+            method = scope["method"].lower()
+            route_span = serverly.tracing.start_span(
+                "route", activate=False) if span != None else None
+            try:
+                # 'websocket' is no HTTP method, only used to register WebSocket endpoints
+                site = _sitemap.get_site(
+                    method, scope["path"]) if method != "websocket" else None
+            except KeyError:  # unsupported method
+                site = None
+            if route_span != None:
+                route_span.end()
+            if timing != None:
+                timing.lap(serverly.statistics.ROUTE)
+            if getattr(site, "stream_body", False):
+                b = ""
+                stream = _iter_body(receive)
+            else:
+                b = await _read_body(receive)
+                stream = None
             try:
-                request = Request(scope["method"], parse.urlparse(full_url),
-                                  headers, b, scope["client"])
+                request = Request(scope["method"], _get_url(scope),
+                                  _get_headers(scope), b, scope["client"], stream)
             except serverly.err.UnsupportedHTTPMethod:
                 request = error_response(943)
-            func, response = _sitemap.get_content(request)
-
-            new_response = response
-
-            for plugin in serverly.plugins._plugin_manager.header_plugins:
-                try:
-                    for e in plugin.exceptions:
-                        if re.match(e, request.path.path):
-                            raise serverly.err._BrakeException()
-                except serverly.err._BrakeException:
-                    continue
-                try:
-                    new_response = plugin.manipulateHeaders(response)
-                except Exception as e:
-                    logger.handle_exception(e)
-                    new_response = None
-                if new_response == None:
-                    new_response = response
-                    break
-
-            response = new_response
+            if timing != None:
+                timing.lap(serverly.statistics.PARSE)
+                if isinstance(request, Request):
+                    request.timing = timing
+            if site == None:
+                func, response = "unknown_error", error_response(404)
+            else:
+                func, response = await _sitemap.get_func_or_site_response_async(site, request)
+            if timing != None:
+                timing.lap(serverly.statistics.HANDLER)
+                timing.stop()
+            response = _apply_header_plugins(request, response)
+            if timing != None:
+                timing.lap(serverly.statistics.PLUGINS)
+                if serverly.statistics.server_timing:
+                    response.headers["server-timing"] = timing.header()
+            if span != None:
+                if site != None:
+                    span.name = scope["method"] + " " + func
+                span.set_attribute("http.status_code", response.code)
+                if response.code >= 500:
+                    span.set_error(f"HTTP {response.code}")
+                response.headers["traceresponse"] = span.traceparent
+            response, body, encoding = _prepare_response(request, response)
+            code = response.code
             response_headers = []
             for k, v in response.headers.items():
                 response_headers.append(
@@ -138,42 +407,62 @@ async def _uvicorn_server(scope, receive, send):
                 "status": response.code,
                 "headers": response_headers
             })
-            mimetype = response.headers.get("content-type", None)
-            if response.bandwidth == None:
+            started = True
+            if isinstance(response, FileResponse):
+                extensions = scope.get("extensions", None) or {}
+                if encoding != None:
+                    await _send_chunks(send, serverly.compression.compress_chunks(
+                        serverly.staticfiles.iter_file(response.file_path), encoding))
+                elif response.parts == None:
+                    await serverly.staticfiles.send_file(send, response.file_path, extensions)
+                elif len(response.parts) == 1 and type(response.parts[0]) == tuple:
+                    await serverly.staticfiles.send_file(send, response.file_path, extensions, *response.parts[0])
+                else:
+                    await serverly.staticfiles.send_file_parts(send, response.file_path, response.parts)
+            elif getattr(response, "stream", None) != None:
+                # a streamed request body is read by the handler, not watched here
+                await _send_stream(send, response.stream, encoding, response.bandwidth, receive if stream == None else None)
+            elif response.bandwidth == None:
                 await send({
                     "type": "http.response.body",
-                    "body": serverly.utils.get_bytes(response.body, mimetype)
+                    "body": body
                 })
             else:
-                chunks = serverly.utils.get_chunked_response(response)
-                need_to_regulate = len(chunks) > 1
-                for chunk in chunks[:-1]:
-                    await send({"type": "http.response.body",
-                                "body": serverly.utils.get_bytes(chunk, mimetype),
-                                "more_body": True
-                                })
-                    if need_to_regulate:
-                        time.sleep(1)
-                await send({
-                    "type": "http.response.body",
-                    "body": serverly.utils.get_bytes(chunks[-1], mimetype)
-                })
+                await serverly.bandwidth.send_regulated(send, body, response.bandwidth)
         except Exception as e:
             logger.handle_exception(e)
-            if scope["type"] != "lifespan":
+            if span != None:
+                span.set_error(e)
+            # once the response has started (e.g. a stream or file failing midway), it can't be replaced anymore.
+            # It's left incomplete, so the server aborts the connection and the client doesn't take the truncated body for complete.
+            if not started:
                 c = bytes(
                     "Sorry, but serverly made a mistake sending the response. Please inform the administrator.", "utf-8")
-                await send({
-                    "type": "http.response.start",
-                    "status": 500,
-                    "headers": [[b"content-type", b"text/html"], [b"content-length", bytes(str(len(c)), "utf-8")]]
-                })
-                await send({
-                    "type": "http.response.body",
-                    "body": c
-                })
-        serverly.statistics.new_statistic(func, t2 - t1)
-
+                try:
+                    await send({
+                        "type": "http.response.start",
+                        "status": 500,
+                        "headers": [[b"content-type", b"text/html"], [b"content-length", bytes(str(len(c)), "utf-8")]]
+                    })
+                    await send({
+                        "type": "http.response.body",
+                        "body": c
+                    })
+                except Exception as e:  # e.g. client disconnected
+                    logger.handle_exception(e)
+        finally:
+            serverly.statistics.request_finished()
+            if span != None:
+                span.end()
+            if timing != None:
+                timing.lap(serverly.statistics.SEND)
+            if slow != None:
+                serverly.slowlog.finish(slow, func, code, timing)
+        serverly.statistics.new_statistic(
+            func, (t2 if t2 != None else time.perf_counter()) - t1, timing if serverly.statistics.stages else None)
+
+    elif scope["type"] == "websocket":
+        await _serve_websocket(scope, receive, send)
     else:
         try:
             raise NotImplementedError(
@@ -229,7 +518,7 @@ class Server:
         logger.context = "startup"
         logger.success("Server initialized", False)
 
-    def run(self, ssl_key_file: str = None, ssl_cert_file: str = None, redirect_to_https_from_port: int = None):
+    def run(self, ssl_key_file: str = None, ssl_cert_file: str = None, redirect_to_https_from_port: int = None, workers: int = 1):
         try:
             serverly.stater.set(0)
         except Exception as e:
@@ -257,10 +546,92 @@ class Server:
             kwargs["ssl_keyfile"] = ssl_key_file
         if ssl_cert_file != None:
             kwargs["ssl_certfile"] = ssl_cert_file
-        uvicorn.run(_uvicorn_server,
-                    host=address[0], port=address[1], log_level=log_level, lifespan="on", **kwargs)
+        if workers > 1:
+            self._run_workers(workers, uvicorn.Config(_uvicorn_server,
+                                                      host=address[0], port=address[1], log_level=log_level, lifespan="on", **kwargs))
+        else:
+            uvicorn.run(_uvicorn_server,
+                        host=address[0], port=address[1], log_level=log_level, lifespan="on", **kwargs)
         self.close()
 
+    def _run_workers(self, workers: int, config: uvicorn.Config):
+        """[internal] Bind the listening socket and serve with `workers` forked worker processes sharing it. Workers which exit are restarted (without affecting the others), SIGHUP restarts all of them one by one, SIGINT/SIGTERM shut the server down."""
+        self._config = config
+        self._socket = config.bind_socket()
+        # two stripes per worker (0 for this process), so a replacement worker never writes to the stripe
+        # of the one it replaces while that one is still finishing its requests
+        serverly.statistics._init_shared(2 * workers + 1)
+        self._n_workers = workers
+        self._stripes = {}
+        self._workers = {}
+        self._stopping = False
+        self._restart_requested = False
+
+        def stop(signum, frame):
+            self._stopping = True
+
+        def restart(signum, frame):
+            self._restart_requested = True
+
+        signal.signal(signal.SIGTERM, stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, restart)
+        for i in range(workers):
+            self._start_worker(i)
+        _update_status("startup")
+        try:
+            while not self._stopping:
+                multiprocessing.connection.wait(
+                    [p.sentinel for p, _ in self._workers.values()], 1)
+                if self._restart_requested:
+                    self._restart_requested = False
+                    self._restart_workers()
+                for i, (p, started) in list(self._workers.items()):
+                    if not p.is_alive() and not self._stopping:
+                        logger.context = "workers"
+                        logger.warning(
+                            f"Worker {i} (pid {p.pid}) exited with code {p.exitcode}. Restarting it.")
+                        if time.monotonic() - started < 1:  # crashing on startup, don't spin
+                            time.sleep(1)
+                        self._start_worker(i)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop_workers()
+            self._socket.close()
+
+    def _start_worker(self, worker: int):
+        # alternate between the worker's two stripes
+        stripe = 1 + worker + (self._n_workers if self._stripes.get(worker, None) == 1 + worker else 0)
+        self._stripes[worker] = stripe
+        p = multiprocessing.Process(target=_run_worker, args=(
+            worker, stripe, self._config, self._socket), name=f"serverly-worker-{worker}")
+        p.start()
+        self._workers[worker] = (p, time.monotonic())
+
+    def _restart_workers(self):
+        """[internal] Replace the workers one after another, starting the new one before stopping the old one, so the server keeps serving."""
+        logger.context = "workers"
+        for i in list(self._workers.keys()):
+            old = self._workers[i][0]
+            self._start_worker(i)
+            old.terminate()  # uvicorn finishes the requests in progress
+            old.join(worker_shutdown_timeout)
+            if old.is_alive():
+                old.kill()
+        logger.success(f"Restarted {len(self._workers)} workers.", False)
+
+    def _stop_workers(self):
+        for p, _ in self._workers.values():
+            if p.is_alive():
+                p.terminate()
+        deadline = time.monotonic() + worker_shutdown_timeout
+        for p, _ in self._workers.values():
+            p.join(max(0, deadline - time.monotonic()))
+            if p.is_alive():
+                p.kill()
+                p.join()
+
     def close(self):
         for plugin in plugins._plugin_manager.server_lifespan_plugins:
             try:
@@ -274,7 +645,8 @@ class Server:
                 logger.handle_exception(e)
         logger.context = "shutdown"
         logger.debug("Shutting down server…", True)
-        self.redirect_server.terminate()
+        if self.redirect_server_port != None:
+            self.redirect_server.terminate()
         try:
             serverly.stater.set(3)
         except Exception as e:
@@ -293,19 +665,62 @@ class Server:
                     f"Plugin '{plugin.__class__.__name__}' raised the following exception in 'onServerShutdown'.")
                 logger.handle_exception(e)
         serverly.statistics.print_stats()
+        serverly.tracing.flush()
         exit(0)
 
 
 _server: Server = None
+_worker: int = None
+
+
+def _run_worker(worker: int, stripe: int, config: uvicorn.Config, sock):
+    """[internal] Target of the worker processes: serve on the (inherited) listening socket `sock`."""
+    global _worker
+    _worker = worker
+    serverly.statistics._set_stripe(stripe)
+
+    def exit_worker(signum, frame):  # uvicorn re-raises the signal after shutting down gracefully
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, exit_worker)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _update_status("shutdown")
+        serverly.tracing.flush()
+
+
+def _run_worker_plugins(hook: str):
+    """[internal] Call the per-worker lifespan `hook` of all ServerLifespanPlugins."""
+    for plugin in plugins._plugin_manager.server_lifespan_plugins:
+        try:
+            getattr(plugin, hook)(_worker)
+        except Exception as e:
+            logger.warning(
+                f"Plugin '{plugin.__class__.__name__}' raised the following exception in '{hook}'.")
+            logger.handle_exception(e)
 
 
 def _update_status(new_status: str):
-    """[internal] Update status of the server and act/log accordingly. Accepts status str as specified a ASGI lifespan."""
+    """[internal] Update status of the server and act/log accordingly. Accepts status str as specified a ASGI lifespan. In worker processes, only the per-worker plugin hooks are called, as the master process manages the server."""
+    if _worker != None:
+        logger.context = f"worker {_worker}"
+        if new_status == "startup":
+            logger.success(f"Worker {_worker} started (pid {os.getpid()}).", False)
+            _run_worker_plugins("onWorkerStart")
+        elif new_status == "shutdown":
+            _run_worker_plugins("onWorkerShutdown")
+        return
     if new_status == "startup":
         logger.context = "startup"
         prefix = "https" if _server.ssl_cert_file != None and _server.ssl_key_file != None else "http"
+        workers = len(getattr(_server, "_workers", {}))
         logger.success(
-            f"Server started {prefix}://{address[0]}:{address[1]} with superpath '{_sitemap.superpath}'")
+            f"Server started {prefix}://{address[0]}:{address[1]} with superpath '{_sitemap.superpath}'" + (f" and {workers} workers" if workers > 1 else ""))
         for plugin in plugins._plugin_manager.server_lifespan_plugins:
             try:
                 plugin.onServerStart()
@@ -377,14 +792,18 @@ def _reset_password_for_real(req: Request):
 
 
 class Sitemap:
-    def __init__(self, superpath: str = "/", error_page: dict = None, debug=False):
+    def __init__(self, superpath: str = "/", error_page: dict = None, debug=False, router="trie", route_cache_size=1024):
         """[internal]
 
         :param superpath: path which will replace every occurence of '/SUPERPATH/' or 'SUPERPATH/'. Great for accessing multiple servers from one domain and forwarding the requests to this server.
         :param error_page: default error page
+        :param router: routing engine used to find the site for a path. 'trie' (default) or 'regex' (one combined regex per method; for apps with mostly regex routes)
+        :param route_cache_size: maximum number of (method, path) -> site resolutions (including 404s) to cache. 0 disables the cache.
 
         :type superpath: str
         :type error_page: StaticPage
+        :type router: str
+        :type route_cache_size: int
         """
         check_relative_path(superpath)
         self.superpath = superpath
@@ -393,8 +812,48 @@ class Sitemap:
             "get": {r"^/verify/[\w0-9]+$": _verify_user, r"^/reset-password/[\w0-9]+$": _reset_password_user_endpoint, r"^/confirm/[\w0-9]+$": _confirm_user},
             "post": {"^/api/resetpassword/?$": _reset_password_for_real},
             "put": {},
-            "delete": {}
+            "delete": {},
+            "websocket": {}
         }
+        self.route_cache_size = route_cache_size
+        self._executor = None
+        self._route_cache = collections.OrderedDict()
+        self.router = router
+
+    @property
+    def router(self):
+        return self._router
+
+    @router.setter
+    def router(self, router: str):
+        try:
+            router_class = serverly.routing.routers[router]
+        except KeyError:
+            raise ValueError(
+                f"Router '{router}' not supported. Supported are " + ", ".join(serverly.routing.routers.keys()) + ".")
+        self._router = router
+        self._routers = {}
+        for method, sites in self.methods.items():
+            self._routers[method] = router_class(sites.keys())
+        self._route_cache.clear()
+
+    def _resolve(self, method: str, path: str):
+        """[internal] Return the pattern serving `path` (or None), using the LRU route cache."""
+        key = (method, path)
+        try:
+            pattern = self._route_cache[key]
+            self._route_cache.move_to_end(key)
+            serverly.statistics.new_route_cache_access(True)
+            return pattern
+        except KeyError:
+            pass
+        pattern = self._routers[method].match(path)
+        serverly.statistics.new_route_cache_access(False)
+        if self.route_cache_size > 0:
+            self._route_cache[key] = pattern
+            while len(self._route_cache) > self.route_cache_size:
+                self._route_cache.popitem(last=False)
+        return pattern
 
     def register_site(self, method: str, site: StaticSite, path=None):
         logger.context = "registration"
@@ -402,6 +861,8 @@ class Sitemap:
         if issubclass(site.__class__, StaticSite):
             p = site.path if not path else path
             self.methods[method][p] = site
+            self._routers[method].add(p)
+            self._route_cache.clear()
             logger.success(
                 f"Registered {method.upper()} static site for path '{site.path}'.", False)
         elif callable(site):
@@ -411,6 +872,8 @@ class Sitemap:
             if path[-1] != "$":
                 path = path + "$"
             self.methods[method][path] = site
+            self._routers[method].add(path)
+            self._route_cache.clear()
             logger.success(
                 f"Registered {method.upper()} function '{site.__name__}' for path '{path}'.", False)
         else:
@@ -422,13 +885,12 @@ class Sitemap:
             path = "^" + path
         if path[-1] != "$":
             path = path + "$"
-        found = False
-        for key in self.methods[method].keys():
-            if path == key:
-                found = True
+        found = path in self.methods[method].keys()
         logger.context = "registration"
         if found:
-            del self.methods[method][key]
+            del self.methods[method][path]
+            self._routers[method].remove(path)
+            self._route_cache.clear()
             logger.debug(
                 f"Unregistered site/function for path '{path}'")
             return True
@@ -437,77 +899,119 @@ class Sitemap:
                 f"Site for path '{path}' not found. Cannot be unregistered.")
             return False
 
-    def get_func_or_site_response(self, site, request: Request):
+    def _call_site(self, site, request: Request):
+        """[internal] Call function `site`. Return its content, which is awaitable for async functions."""
         try:
-            s = "unknown"
-            response = Response()
-            if isinstance(site, StaticSite):
-                response = site.get_content()
-                s = str(site)
-            else:
-                s = site.__name__
-                try:
-                    content = site(request)
-                except TypeError as e:  # makes debugging easier
-                    serverly.logger.handle_exception(e)
-                    try:
-                        content = site()
-                    except TypeError as e:
-                        logger.handle_exception(e)
-                        raise TypeError(
-                            f"Function '{site.__name__}' either takes to many arguments (only object of type Request provided) or raises a TypeError")
-                except Exception as e:
-                    serverly.logger.debug("Site: " + site.__name__, self.debug)
-                    logger.handle_exception(e)
-                    response = error_response(500)
-                if isinstance(content, Response):
-                    response = content
-                else:
-                    try:
-                        raise UserWarning(
-                            f"Function for '{request.path.path}' ({site.__name__}) needs to return a Response object. Website will be a warning message (not your content but serverly's).")
-                    except Exception as e:
-                        logger.handle_exception(e)
-                    response = error_response(942)
-            headers = response.headers
-            for k, v in headers.items():
-                try:
-                    headers[k] = v.replace(
-                        "/SUPERPATH/", self.superpath).replace("SUPERPATH/", self.superpath)
-                except:
-                    pass
-            response.headers = headers
+            return site(request)
+        except TypeError as e:  # makes debugging easier
+            serverly.logger.handle_exception(e)
+            try:
+                return site()
+            except TypeError as e:
+                logger.handle_exception(e)
+                raise TypeError(
+                    f"Function '{site.__name__}' either takes to many arguments (only object of type Request provided) or raises a TypeError")
+
+    def _handle_site_exception(self, site, e: Exception):
+        """[internal] Log exception raised by function `site` and return the appropriate response."""
+        serverly.logger.debug("Site: " + site.__name__, self.debug)
+        logger.handle_exception(e)
+        serverly.stater.error(logger)
+        return error_response(500)
+
+    def _get_response(self, site, request: Request, content):
+        """[internal] Validate `content` returned by `site` and replace SUPERPATH in headers & body."""
+        if isinstance(site, StaticSite) or isinstance(content, Response):
+            response = content
+        else:
             try:
-                response.body = response.body.replace(
+                raise UserWarning(
+                    f"Function for '{request.path.path}' ({site.__name__}) needs to return a Response object. Website will be a warning message (not your content but serverly's).")
+            except Exception as e:
+                logger.handle_exception(e)
+            response = error_response(942)
+        headers = response.headers
+        for k, v in headers.items():
+            try:
+                headers[k] = v.replace(
                     "/SUPERPATH/", self.superpath).replace("SUPERPATH/", self.superpath)
             except:
                 pass
-            return (s, response)
+        response.headers = headers
+        # objects aren't serialized just to look for SUPERPATH, but when sent (see _prepare_response)
+        body = response._body
+        if type(body) == str and "SUPERPATH/" in body:
+            response.body = body.replace(
+                "/SUPERPATH/", self.superpath).replace("SUPERPATH/", self.superpath)
+        return response
+
+    def get_func_or_site_response(self, site, request: Request):
+        """Return tuple (name, response) for `site`. Async functions are run to completion in a new event loop, so this must not be called from a running one (see `get_func_or_site_response_async`)."""
+        try:
+            if isinstance(site, StaticSite):
+                return (str(site), self._get_response(site, request, site.get_content()))
+            try:
+                content = self._call_site(site, request)
+                if inspect.isawaitable(content):
+                    content = asyncio.run(_await(content))
+            except Exception as e:
+                content = self._handle_site_exception(site, e)
+            return (site.__name__, self._get_response(site, request, content))
         except Exception as e:
             logger.handle_exception(e)
-            return error_response(500, str(e))
+            return ("unknown_error", error_response(500, str(e)))
 
-    def get_content(self, request: Request):
-        site = None
-        response = None
-        func = "unknown_error"
-        for pattern in self.methods[request.method].keys():
-            if re.match(pattern, request.path.path):
-                site = self.methods[request.method][pattern]
-                break
-        if site == None:
-            response = error_response(404)
-            return (func, response)
+    async def get_func_or_site_response_async(self, site, request: Request):
+        """Return tuple (name, response) for `site`. `async def` functions are awaited directly, everything else (sync functions, file access) runs in a thread pool with `handler_threads` threads so it doesn't block the event loop."""
         try:
-            func, response = self.get_func_or_site_response(
-                site, request)
+            if isinstance(site, StaticSite):
+                content = await self._run_in_thread(site.get_content)
+                return (str(site), self._get_response(site, request, content))
+            try:
+                if inspect.iscoroutinefunction(site):
+                    content = self._call_site(site, request)
+                else:
+                    content = await self._run_in_thread(self._call_site, site, request)
+                if inspect.isawaitable(content):  # e.g. async function wrapped by a sync decorator
+                    content = await content
+            except Exception as e:
+                content = self._handle_site_exception(site, e)
+            return (site.__name__, self._get_response(site, request, content))
         except Exception as e:
             logger.handle_exception(e)
-            site = error_response(500)
-            response = self.get_func_or_site_response(
-                site, "")
-            serverly.stater.error(logger)
-        return (func, response)
+            return ("unknown_error", error_response(500, str(e)))
+
+    async def _run_in_thread(self, func, *args):
+        """[internal] Run `func(*args)` in the handler thread pool (created lazily, as threads don't survive forking into the server process), in a copy of the current context."""
+        if self._executor == None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                handler_threads, "serverly-handler")
+        # in the context of the request (e.g. its span, see serverly.tracing; its record in serverly.slowlog)
+        return await asyncio.get_event_loop().run_in_executor(self._executor, contextvars.copy_context().run, serverly.slowlog.in_thread, func, *args)
+
+    def get_site(self, method: str, path: str):
+        """Return the site (StaticSite or function) serving `path` for `method`, or None."""
+        pattern = self._resolve(method, path)
+        if pattern == None:
+            return None
+        return self.methods[method][pattern]
+
+    def get_content(self, request: Request):
+        site = self.get_site(request.method, request.path.path)
+        if site == None:
+            return ("unknown_error", error_response(404))
+        return self.get_func_or_site_response(site, request)
+
+    async def get_content_async(self, request: Request):
+        """Like `get_content`, but without blocking the event loop."""
+        site = self.get_site(request.method, request.path.path)
+        if site == None:
+            return ("unknown_error", error_response(404))
+        return await self.get_func_or_site_response_async(site, request)
+
+
+async def _await(awaitable):
+    return await awaitable
 
 
 _sitemap = Sitemap()
@@ -524,6 +1028,24 @@ def serves(method: str, path: str):
     return wrapper_function
 
 
+def stream_body(func):
+    """Decorator specifying that `func` consumes the request body as a stream instead of serverly reading (and buffering) it completely beforehand. The body is available as `request.stream`, an async iterator of bytes chunks, so `func` should be an `async def` function.
+
+    Example:
+    ```
+    @serves("POST", "/upload")
+    @stream_body
+    async def upload(request):
+        with open("upload", "wb") as f:
+            async for chunk in request.stream:
+                f.write(chunk)
+        return Response()
+    ```
+    """
+    func.stream_body = True
+    return func
+
+
 def static_page(file_path: str, path: str):
     """Register a static page where the file is located under `file_path` and will serve `path`"""
     check_relative_file_path(file_path)
@@ -539,22 +1061,36 @@ def register_function(method: str, path: str, function):
         raise TypeError("'function' not callable.")
 
 
+def use_router(router: str):
+    """Change the routing engine. 'trie' (default) or 'regex' (one combined regex per method; for apps with mostly regex routes)."""
+    _sitemap.router = router
+
+
+def set_route_cache_size(size: int):
+    """Set the maximum number of cached route resolutions (0 disables the cache). Hits & misses are counted in `serverly.statistics.route_cache`."""
+    _sitemap.route_cache_size = int(size)
+    _sitemap._route_cache.clear()
+
+
 def unregister(method: str, path: str):
     """Unregister any page (static or dynamic). Return bool whether successful (found page)."""
     return _sitemap.unregister_site(method, path)
 
 
-def _start_server(superpath: str, debug=False, ssl_key_file: str = None, ssl_cert_file: str = None, redirect_to_https_from_port: int = None):
+def _start_server(superpath: str, debug=False, ssl_key_file: str = None, ssl_cert_file: str = None, redirect_to_https_from_port: int = None, workers: int = 1):
     global _sitemap, _server
     _sitemap.superpath = superpath
     _sitemap.debug = debug
     _server = Server(address)
-    _server.run(ssl_key_file, ssl_cert_file, redirect_to_https_from_port)
+    _server.run(ssl_key_file, ssl_cert_file,
+                redirect_to_https_from_port, workers)
 
 
-def start(superpath: str = '/', mail_active=False, debug=False, ssl_key_file: str = None, ssl_cert_file: str = None, redirect_to_https_from_port: int = None):
+def start(superpath: str = '/', mail_active=False, debug=False, ssl_key_file: str = None, ssl_cert_file: str = None, redirect_to_https_from_port: int = None, workers: int = 1):
     """Start the server after applying all relevant attributes like address. `superpath` will replace every occurence of SUPERPATH/ or /SUPERPATH/ with `superpath`. Especially useful for servers orchestrating other servers.
 
+    With `workers` > 1, the server process binds the socket and forks that many worker processes accepting connections on it, so requests are served on several CPU cores. Workers which exit are restarted, sending SIGHUP to the server process restarts them one by one. Note that module state (e.g. caches, WebSocket connections) is per worker.
+
     Note: this function will not be 'alive' over the lifespan of the server, it finishes mid-startup."""
     for plugin in plugins._plugin_manager.server_lifespan_plugins:
         try:
@@ -588,7 +1124,7 @@ def start(superpath: str = '/', mail_active=False, debug=False, ssl_key_file: st
     try:
         logger.verbose = debug
         args = tuple([superpath, debug, ssl_key_file,
-                      ssl_cert_file, redirect_to_https_from_port])
+                      ssl_cert_file, redirect_to_https_from_port, workers])
         server = multiprocessing.Process(
             target=_start_server, args=args)
         if mail_active:
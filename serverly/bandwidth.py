@@ -0,0 +1,81 @@
+"""
+serverly.bandwidth
+---
+Non-blocking regulation of responses with a `bandwidth` (bytes per second). Bodies are sent in chunks paced by token buckets using `asyncio.sleep`, so regulated responses never block other clients.
+
+Configuration
+--
+Attribute | Description
+- | -
+interval = 0.1 | Seconds between chunks (the granularity of regulation).
+max_bandwidth: int = None | Server-wide cap (bytes per second) shared by all regulated responses. None for no cap.
+"""
+import asyncio
+import time
+
+interval = 0.1
+max_bandwidth: int = None
+
+_shared_bucket = None
+
+
+class TokenBucket:
+    """Token bucket refilling with `rate` tokens (bytes) per second up to `capacity`. Consumers may go into debt and sleep until it is paid off, so bursts are never larger than `capacity`."""
+
+    def __init__(self, rate: int, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("rate expected to be positive.")
+        self.rate = rate
+        self.capacity = capacity if capacity != None else rate * interval
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self._last) * self.rate)
+        self._last = now
+
+    async def consume(self, n: int):
+        """Take `n` tokens, sleeping (without blocking the event loop) until they are available."""
+        self._refill()
+        self.tokens -= n
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+def _get_shared_bucket():
+    global _shared_bucket
+    if max_bandwidth == None:
+        return None
+    if _shared_bucket == None or _shared_bucket.rate != max_bandwidth:
+        _shared_bucket = TokenBucket(max_bandwidth)
+    return _shared_bucket
+
+
+def get_buckets(bandwidth: int):
+    """Return the token buckets a response with `bandwidth` (bytes per second, None for unregulated) has to consume from: its own one and the one shared by all responses (see `max_bandwidth`)."""
+    buckets = [TokenBucket(bandwidth)] if bandwidth != None else []
+    shared = _get_shared_bucket()
+    if shared != None:
+        buckets.append(shared)
+    return buckets
+
+
+async def send_regulated(send, body: bytes, bandwidth: int):
+    """Send `body` via the ASGI `send` callable with at most `bandwidth` bytes per second (and within `max_bandwidth`)."""
+    buckets = get_buckets(bandwidth)
+    chunk_size = max(1, int(min(b.rate for b in buckets) * interval))
+    length = len(body)
+    if length == 0:
+        await send({"type": "http.response.body", "body": b""})
+        return
+    for i in range(0, length, chunk_size):
+        chunk = body[i:i + chunk_size]
+        for bucket in buckets:
+            await bucket.consume(len(chunk))
+        await send({
+            "type": "http.response.body",
+            "body": chunk,
+            "more_body": i + chunk_size < length
+        })
@@ -0,0 +1,184 @@
+"""
+serverly.compression
+---
+Transparent compression of responses with gzip (and brotli if the `brotli` package is installed), negotiated via the client's `Accept-Encoding` header. Only bodies of a compressible content-type and at least `min_size` bytes are compressed; such responses get a `Vary: Accept-Encoding` header and an ETag per encoding.
+
+Bodies of responses with an ETag (e.g. `StaticSite`s) are compressed once and cached by their ETag (so serving them from the cache doesn't even hash the body), streamed files (`FileResponse`) are compressed chunk by chunk. Range requests are answered uncompressed. Bodies known in advance (e.g. the admin console's assets) can be compressed with the highest settings once using `precompress`.
+
+Configuration
+--
+Attribute | Description
+- | -
+enabled = True | Compress responses at all.
+min_size = 1024 | Bodies smaller than this (bytes) are sent uncompressed.
+content_types = [...] | Compressible content-types (prefixes), e.g. 'text/' or 'application/json'.
+gzip_level = 6 | gzip (zlib) compression level (1-9).
+brotli_quality = 5 | brotli quality (0-11).
+cache_size = 8388608 | Maximum total size (bytes) of cached compressed bodies. 0 disables the cache.
+"""
+import collections
+import re
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+enabled = True
+min_size = 1024
+content_types = ["text/", "application/json", "application/javascript", "application/xml",
+                 "application/xhtml+xml", "application/rss+xml", "application/atom+xml", "application/wasm", "image/svg+xml"]
+gzip_level = 6
+brotli_quality = 5
+cache_size = 8 * 1024 * 1024
+
+_cache = collections.OrderedDict()
+_cache_bytes = 0
+_precompressed = {}
+_lock = threading.Lock()
+
+_CODING = re.compile(r"^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$")
+
+
+def encodings():
+    """Return the supported content-codings, most preferred first."""
+    return ["br", "gzip"] if brotli != None else ["gzip"]
+
+
+def negotiate(accept_encoding: str):
+    """Return the best supported content-coding acceptable according to `accept_encoding` (value of the Accept-Encoding header) or None."""
+    if not accept_encoding:
+        return None
+    q = {}
+    for coding in accept_encoding.split(","):
+        m = _CODING.match(coding)
+        if m == None:
+            continue
+        try:
+            q[m.group(1).lower()] = float(m.group(2)) if m.group(2) else 1.0
+        except ValueError:
+            continue
+    best, best_q = None, 0
+    for e in encodings():
+        value = q.get(e, q.get("*", 0))
+        if value > best_q:
+            best, best_q = e, value
+    return best
+
+
+def is_compressible(headers: dict, size: int = None):
+    """Return whether a response with (lowercase) `headers` and a body of `size` bytes (None if unknown, e.g. streamed) is worth compressing."""
+    if not enabled or "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+        return False
+    if size != None and size < min_size:
+        return False
+    content_type = headers.get("content-type", None) or ""
+    return any(content_type.startswith(t) for t in content_types)
+
+
+def variant_etag(etag: str, encoding: str):
+    """Return the ETag of the `encoding`-compressed representation with ETag `etag`."""
+    if etag.endswith('"'):
+        return etag[:-1] + "-" + encoding + '"'
+    return etag + "-" + encoding
+
+
+def _add_vary(headers: dict):
+    vary = headers.get("vary", "")
+    if not "accept-encoding" in vary.lower():
+        headers["vary"] = vary + ", Accept-Encoding" if vary else "Accept-Encoding"
+
+
+def prepare(request_headers: dict, response, size: int = None):
+    """Mark `response` (a body of `size` bytes) to be sent compressed if it's compressible and the client (`request_headers`) accepts a supported encoding: set Content-Encoding, Vary & the ETag of the variant. Return the encoding or None. Call `compress` on the body afterwards."""
+    if response.code != 200 or not is_compressible(response.headers, size):
+        return None
+    headers = response.headers
+    _add_vary(headers)
+    if "range" in request_headers and headers.get("accept-ranges", None) == "bytes":
+        return None  # ranges refer to the uncompressed content
+    encoding = negotiate(request_headers.get("accept-encoding", None))
+    if encoding == None:
+        return None
+    headers["content-encoding"] = encoding
+    headers.pop("content-length", None)
+    if "etag" in headers:
+        headers["etag"] = variant_etag(headers["etag"], encoding)
+    return encoding
+
+
+class Compressor:
+    """Incremental compressor for `encoding` ('gzip' or 'br'). If `best`, the highest (slowest) compression level is used instead of `gzip_level`/`brotli_quality`."""
+
+    def __init__(self, encoding: str, best: bool = False):
+        if encoding == "gzip":
+            c = zlib.compressobj(9 if best else gzip_level, zlib.DEFLATED, 31)
+            self._process, self._finish = c.compress, c.flush
+        elif encoding == "br" and brotli != None:
+            c = brotli.Compressor(quality=11 if best else brotli_quality)
+            self._process, self._finish = c.process, c.finish
+        else:
+            raise ValueError(f"Encoding '{encoding}' not supported.")
+
+    def compress(self, data: bytes):
+        """Return compressed data for `data` (possibly empty)."""
+        return self._process(data)
+
+    def flush(self):
+        """Return the remaining compressed data. Don't compress afterwards."""
+        return self._finish()
+
+
+def compress(body: bytes, encoding: str, etag: str = None):
+    """Return `body` compressed with `encoding`. If `etag` (the ETag of the uncompressed `body`) is given, the result is cached by it, so the same body is only compressed once (or taken from the bodies compressed by `precompress`)."""
+    global _cache_bytes
+    if etag == None:
+        c = Compressor(encoding)
+        return c.compress(body) + c.flush()
+    key = (etag, encoding)
+    with _lock:
+        compressed = _precompressed.get(key, None) or _cache.get(key, None)
+        if compressed != None:
+            if key in _cache:
+                _cache.move_to_end(key)
+            return compressed
+    c = Compressor(encoding)
+    compressed = c.compress(body) + c.flush()
+    if len(compressed) <= cache_size:
+        with _lock:
+            if not key in _cache:
+                _cache[key] = compressed
+                _cache_bytes += len(compressed)
+            while _cache_bytes > cache_size:
+                _cache_bytes -= len(_cache.popitem(last=False)[1])
+    return compressed
+
+
+def precompress(body: bytes, etag: str):
+    """Compress `body` (with ETag `etag`) with all supported encodings with the highest settings and keep the results (not subject to `cache_size`), so it's never compressed when sent (as body of a response with ETag `etag`)."""
+    for encoding in encodings():
+        if not (etag, encoding) in _precompressed:
+            c = Compressor(encoding, True)
+            compressed = c.compress(body) + c.flush()
+            with _lock:
+                _precompressed[(etag, encoding)] = compressed
+
+
+def compress_chunks(chunks, encoding: str):
+    """Yield the compressed data of the (bytes) iterable `chunks`, e.g. of a streamed file. Empty pieces are skipped."""
+    c = Compressor(encoding)
+    for chunk in chunks:
+        data = c.compress(bytes(chunk))
+        if data:
+            yield data
+    yield c.flush()
+
+
+def clear():
+    """Remove all compressed bodies from the cache."""
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _cache_bytes = 0
@@ -4,10 +4,10 @@ console_index = r"""<!DOCTYPE html>
     <meta charset="UTF-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1.0" />
     <title>serverly admin console</title>
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css"/>
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/consoleIndex.css"/>
-    <script src="SUPERPATH/console/static/js/main.js"></script>
-    <script src="SUPERPATH/console/static/js/consoleIndex.js"></script>
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css?v=$_console_static_version"/>
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/consoleIndex.css?v=$_console_static_version"/>
+    <script src="SUPERPATH/console/static/js/main.js?v=$_console_static_version"></script>
+    <script src="SUPERPATH/console/static/js/consoleIndex.js?v=$_console_static_version"></script>
   </head>
   <body>
     <nav>
@@ -28,7 +28,7 @@ console_index = r"""<!DOCTYPE html>
       </div>
     </div>
   </body>
-  <script src="SUPERPATH/console/static/js/consoleIndexLoaded.js"></script>
+  <script src="SUPERPATH/console/static/js/consoleIndexLoaded.js?v=$_console_static_version"></script>
 </html>
 """
 
@@ -38,10 +38,10 @@ console_users = r"""<!DOCTYPE html>
     <meta charset="UTF-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1.0" />
     <title>serverly admin console</title>
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css"/>
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/consoleUsers.css"/>
-    <script src="SUPERPATH/console/static/js/main.js"></script>
-    <script src="SUPERPATH/console/static/js/consoleUsers.js"></script>
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css?v=$_console_static_version"/>
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/consoleUsers.css?v=$_console_static_version"/>
+    <script src="SUPERPATH/console/static/js/main.js?v=$_console_static_version"></script>
+    <script src="SUPERPATH/console/static/js/consoleUsers.js?v=$_console_static_version"></script>
   </head>
   <body>
     <nav>
@@ -66,7 +66,7 @@ console_users = r"""<!DOCTYPE html>
       </div>
     </div>
   </body>
-  <script src="SUPERPATH/console/static/js/consoleUsersLoaded.js"></script>
+  <script src="SUPERPATH/console/static/js/consoleUsersLoaded.js?v=$_console_static_version"></script>
 </html>
 """
 
@@ -76,8 +76,8 @@ console_user_change_or_create = r"""<!DOCTYPE html>
     <meta charset="UTF-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1.0" />
     <title>serverly admin console</title>
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css" />
-    <script src="SUPERPATH/console/static/js/main.js"></script>
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css?v=$_console_static_version" />
+    <script src="SUPERPATH/console/static/js/main.js?v=$_console_static_version"></script>
     <style>
       #attributeContainer {
         display: grid;
@@ -235,11 +235,11 @@ console_endpoints = r"""<!DOCTYPE html>
   <head>
     <meta charset="UTF-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css" />
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css?v=$_console_static_version" />
     <title>serverly admin console</title>
-    <script src="/console/static/js/main.js"></script>
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/consoleEndpoints.css"/>
-    <script src="SUPERPATH/console/static/js/consoleEndpoints.js"></script>
+    <script src="/console/static/js/main.js?v=$_console_static_version"></script>
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/consoleEndpoints.css?v=$_console_static_version"/>
+    <script src="SUPERPATH/console/static/js/consoleEndpoints.js?v=$_console_static_version"></script>
   </head>
   <body>
     <nav>
@@ -255,7 +255,7 @@ console_endpoints = r"""<!DOCTYPE html>
     </div>
     <div id="endpointsContainer"></div>
   </body>
-  <script src="SUPERPATH/console/static/js/consoleEndpointsLoaded.js"></script>
+  <script src="SUPERPATH/console/static/js/consoleEndpointsLoaded.js?v=$_console_static_version"></script>
 </html>
 """
 
@@ -264,11 +264,11 @@ console_statistics = r"""<!DOCTYPE html>
   <head>
     <meta charset="UTF-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css"/>
-    <link rel="stylesheet" href="SUPERPATH/console/static/css/consoleStatistics.css"/>
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/main.css?v=$_console_static_version"/>
+    <link rel="stylesheet" href="SUPERPATH/console/static/css/consoleStatistics.css?v=$_console_static_version"/>
     <title>serverly admin console</title>
-    <script src="SUPERPATH/console/static/js/main.js"></script>
-    <script src="SUPERPATH/console/static/js/consoleStatistics.js"></script>
+    <script src="SUPERPATH/console/static/js/main.js?v=$_console_static_version"></script>
+    <script src="SUPERPATH/console/static/js/consoleStatistics.js?v=$_console_static_version"></script>
   </head>
   <body>
     <nav>
@@ -289,6 +289,10 @@ console_statistics = r"""<!DOCTYPE html>
             <th>mean</th>
             <th>min</th>
             <th>max</th>
+            <th>p50</th>
+            <th>p90</th>
+            <th>p99</th>
+            <th>p99.9</th>
             <th>length</th>
           </tr>
         </thead>
@@ -297,7 +301,7 @@ console_statistics = r"""<!DOCTYPE html>
       </table>
     </div>
   </body>
-  <script src="SUPERPATH/console/static/js/consoleStatisticsLoaded.js"></script>
+  <script src="SUPERPATH/console/static/js/consoleStatisticsLoaded.js?v=$_console_static_version"></script>
 </html>
 """
 
@@ -789,12 +793,18 @@ console_statistics_js = """function sortOnKeys(dict) {
 
         return tempDict;
       }
+      function formatTime(t) {
+        return t === undefined ? "-" : t.toFixed(3);
+      }
       function drawStatistics(stats) {
         let table = document.getElementById("statsTable");
         var result = "";
         for(let [func, data] of Object.entries(sortOnKeys(stats))){
-          result += "<tr><td>" + func + "</td><td>" + data.mean.toFixed(3) + "</td><td>" + data.min.toFixed(
-              3) + "</td><td>" + data.max.toFixed(3) + "</td><td>" + data.len + "</td></tr>";
+          result += "<tr><td>" + func + "</td>";
+          for(let key of ["mean", "min", "max", "p50", "p90", "p99", "p999"]){
+            result += "<td>" + formatTime(data[key]) + "</td>";
+          }
+          result += "<td>" + data.len + "</td></tr>";
         }
         table.innerHTML = result;
       }
@@ -812,6 +822,14 @@ console_statistics_js = """function sortOnKeys(dict) {
         req.open("GET", "SUPERPATH$_console_api_statistics_get");
         req.send(null);
       }
+      function subscribeStats() {
+        var url = "SUPERPATH$_console_api_statistics_events";
+        if (!window.EventSource || url.indexOf("$_") !== -1) {
+          return;
+        }
+        var source = new EventSource(url);
+        source.onmessage = (e) => drawStatistics(JSON.parse(e.data));
+      }
       function resetStatistics() {
         var req = new XMLHttpRequest();
         req.onreadystatechange = () => {
@@ -824,6 +842,7 @@ console_statistics_js = """function sortOnKeys(dict) {
 """
 
 console_statistics_js_loaded = """loadStats();
+subscribeStats();
 document.getElementById("btnReset").onclick = resetStatistics;
 document.getElementById("btnRefresh").onclick = loadStats;
 """
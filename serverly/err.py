@@ -22,5 +22,13 @@ class UnsupportedHTTPMethod(Exception):
     pass
 
 
+class WebSocketDisconnect(Exception):
+    """Raised when receiving from/sending to a WebSocket which is closed. `code` is the close code."""
+
+    def __init__(self, code: int = 1000):
+        super().__init__(f"WebSocket closed with code {code}.")
+        self.code = code
+
+
 class _BrakeException(Exception):
     pass
@@ -0,0 +1,78 @@
+"""
+serverly.jsoncodec
+---
+JSON encoding/decoding used by serverly for request & response bodies, DBObjects and statistics. Uses the fastest backend installed (orjson, ujson or the standard library's json), or the one set with `use()`.
+
+Values the fast backends can't handle (e.g. integers > 64 bit) are encoded with the standard library instead.
+"""
+import json as _json
+from typing import Union
+
+backends = ["orjson", "ujson", "json"]
+backend: str = None
+
+_dumps = None
+_dumpb = None
+_loads = None
+
+
+def _stdlib_dumps(obj):
+    return _json.dumps(obj)
+
+
+def _stdlib_dumpb(obj):
+    return _json.dumps(obj).encode("utf-8")
+
+
+def use(name: str = None):
+    """Use backend `name` ('orjson', 'ujson' or 'json'). None for the fastest one installed. Raise ImportError if it's not installed."""
+    global backend, _dumps, _dumpb, _loads
+    if name == None:
+        for b in backends:
+            try:
+                return use(b)
+            except ImportError:
+                pass
+    if name == "orjson":
+        import orjson
+        option = orjson.OPT_NON_STR_KEYS
+        _dumpb = lambda obj: orjson.dumps(obj, option=option)
+        _dumps = lambda obj: orjson.dumps(obj, option=option).decode("utf-8")
+        _loads = orjson.loads
+    elif name == "ujson":
+        import ujson
+        _dumps = lambda obj: ujson.dumps(obj, escape_forward_slashes=False)
+        _dumpb = lambda obj: _dumps(obj).encode("utf-8")
+        _loads = ujson.loads
+    elif name == "json":
+        _dumps = _stdlib_dumps
+        _dumpb = _stdlib_dumpb
+        _loads = _json.loads
+    else:
+        raise ValueError(
+            f"JSON backend '{name}' not supported. Supported are " + ", ".join(backends) + ".")
+    backend = name
+
+
+def dumps(obj) -> str:
+    """Serialize `obj` to a JSON str."""
+    try:
+        return _dumps(obj)
+    except (TypeError, OverflowError):
+        return _stdlib_dumps(obj)
+
+
+def dumpb(obj) -> bytes:
+    """Serialize `obj` to UTF-8 encoded JSON (bytes), without an intermediate str if the backend supports it."""
+    try:
+        return _dumpb(obj)
+    except (TypeError, OverflowError):
+        return _stdlib_dumpb(obj)
+
+
+def loads(s: Union[str, bytes]):
+    """Deserialize JSON `s`. Raise ValueError if `s` isn't valid JSON."""
+    return _loads(s)
+
+
+use()
@@ -0,0 +1,147 @@
+"""
+serverly.metrics
+---
+The server's metrics in the OpenMetrics text format (https://openmetrics.io), to be scraped by Prometheus & co. Register the endpoint with `serverly.user.api.use("metrics", "GET", "/metrics")`.
+
+Metric | Type | Description
+- | - | -
+serverly_requests | counter | Requests served
+serverly_requests_in_flight | gauge | Requests currently being served
+serverly_request_duration_seconds | histogram | Calculation times by function (see `serverly.statistics`)
+serverly_route_cache_lookups | counter | Route cache lookups by result (hit/miss)
+serverly_db_pool_connections | gauge | Database connections by state (checked_out; size & overflow for pools of fixed size). Only if `serverly.user` is set up.
+serverly_db_pool_checkouts, serverly_db_pool_connects | counter | Database connections checked out from the pool/opened
+serverly_mail_queue | gauge | Emails by queue (pending/scheduled). Only if `serverly.user.mail` is set up.
+
+Request metrics are aggregated over all worker processes, the database & mail metrics are the ones of the process serving the scrape.
+
+The lines are rendered from preformatted label prefixes (built once per function) and the rendered text is reused for `max_age` seconds, so scrapes cost microseconds.
+
+Configuration
+--
+Attribute | Description
+- | -
+buckets = [0.001, ..., 10.0] | Upper bounds (seconds) of the latency histogram's buckets. As the statistics' histogram has buckets of ~9% width, a bucket counts the requests known to have taken less than its bound.
+max_age = 1 | Seconds a rendered exposition is reused for. 0 renders it on every scrape.
+"""
+import sys
+import time
+
+import numpy as np
+
+import serverly.statistics
+
+buckets = [0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+max_age = 1
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+_DURATION = "serverly_request_duration_seconds"
+_rendered = None  # (time, body)
+_prefixes = (None, None, [])  # (generation, buckets, lines per slot)
+
+
+def _escape(value: str):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value):
+    return str(value) if type(value) == int else repr(float(value))
+
+
+def _slot_prefixes():
+    """[internal] Return the preformatted beginnings of the histogram lines of each slot (function) of the statistics: the buckets' lines, +Inf, count & sum. Rebuilt only when functions are added or `buckets` change."""
+    global _prefixes
+    storage = serverly.statistics._storage
+    key = (int(storage.header[serverly.statistics._GENERATION]),
+           int(storage.header[serverly.statistics._N_NAMES]))
+    if _prefixes[0] != key or _prefixes[1] != buckets:
+        les = ['le="' + _format(float(b)) + '"' for b in buckets] + ['le="+Inf"']
+        lines = [None]  # slot 0: overall
+        for slot in range(1, key[1] + 1):
+            label = 'function="' + _escape(serverly.statistics._name(slot)) + '"'
+            lines.append([f"{_DURATION}_bucket{{{label},{le}}} " for le in les] + [
+                f"{_DURATION}_count{{{label}}} ", f"{_DURATION}_sum{{{label}}} "])
+        _prefixes = (key, list(buckets), lines)
+    return _prefixes[2]
+
+
+def _render_requests(lines: list):
+    storage = serverly.statistics._storage
+    prefixes = _slot_prefixes()
+    n = len(prefixes)
+    histograms = storage.histograms[:, :n].sum(0, dtype=np.int64)
+    cumulative = histograms.cumsum(1)
+    counts = cumulative[:, -1]
+    sums = storage.counters[:, :n, serverly.statistics._SUM].sum(0) / 1000
+    # number of statistics buckets entirely below each bound
+    ends = np.searchsorted(serverly.statistics._UPPER,
+                           np.array(buckets, dtype=float) * 1000, side="right")
+    below = np.zeros((n, len(ends)), dtype=np.int64)
+    inside = ends > 0
+    below[:, inside] = cumulative[:, ends[inside] - 1]
+
+    lines.append("# TYPE serverly_requests counter\n# HELP serverly_requests Requests served.\n")
+    lines.append(f"serverly_requests_total {int(counts[0])}\n")
+    lines.append("# TYPE serverly_requests_in_flight gauge\n# HELP serverly_requests_in_flight Requests currently being served.\n")
+    lines.append(f"serverly_requests_in_flight {serverly.statistics.get_in_flight()}\n")
+    lines.append(f"# TYPE {_DURATION} histogram\n# UNIT {_DURATION} seconds\n# HELP {_DURATION} Time to calculate responses, by function serving them.\n")
+    for slot in range(1, n):
+        if counts[slot] == 0:
+            continue
+        p = prefixes[slot]
+        values = below[slot].tolist() + [int(counts[slot]), int(counts[slot])]
+        lines.extend(p[i] + str(v) + "\n" for i, v in enumerate(values))
+        lines.append(p[-1] + _format(sums[slot]) + "\n")
+    cache = serverly.statistics.get_route_cache()
+    lines.append("# TYPE serverly_route_cache_lookups counter\n# HELP serverly_route_cache_lookups Route cache lookups by result.\n")
+    lines.append(f'serverly_route_cache_lookups_total{{result="hit"}} {cache["hits"]}\n')
+    lines.append(f'serverly_route_cache_lookups_total{{result="miss"}} {cache["misses"]}\n')
+
+
+def _render_db(lines: list):
+    user = sys.modules.get("serverly.user", None)  # not imported just for this
+    if user == None or user._engine == None:
+        return
+    stats = user.get_pool_statistics()
+    lines.append("# TYPE serverly_db_pool_connections gauge\n# HELP serverly_db_pool_connections Database connections by state.\n")
+    for state in ("checked_out", "size", "overflow"):
+        if state in stats:
+            lines.append(f'serverly_db_pool_connections{{state="{state}"}} {stats[state]}\n')
+    lines.append("# TYPE serverly_db_pool_checkouts counter\n# HELP serverly_db_pool_checkouts Database connections checked out from the pool.\n")
+    lines.append(f"serverly_db_pool_checkouts_total {stats['checkouts']}\n")
+    lines.append("# TYPE serverly_db_pool_connects counter\n# HELP serverly_db_pool_connects Database connections opened.\n")
+    lines.append(f"serverly_db_pool_connects_total {stats['connects']}\n")
+
+
+def _render_mail(lines: list):
+    mail = sys.modules.get("serverly.user.mail", None)
+    if mail == None or mail.manager == None:
+        return
+    lengths = mail.manager.get_queue_lengths()
+    lines.append("# TYPE serverly_mail_queue gauge\n# HELP serverly_mail_queue Emails waiting to be sent, by queue.\n")
+    for queue in ("pending", "scheduled"):
+        lines.append(f'serverly_mail_queue{{queue="{queue}"}} {lengths[queue]}\n')
+
+
+def render():
+    """Return the metrics in the OpenMetrics text format (bytes). Reused for `max_age` seconds."""
+    global _rendered
+    now = time.monotonic()
+    if max_age > 0 and _rendered != None and now - _rendered[0] < max_age:
+        return _rendered[1]
+    lines = []
+    _render_requests(lines)
+    _render_db(lines)
+    _render_mail(lines)
+    lines.append("# EOF\n")
+    body = "".join(lines).encode("utf-8")
+    _rendered = (now, body)
+    return body
+
+
+def clear():
+    """Discard the rendered exposition, so the next `render` is up to date."""
+    global _rendered
+    _rendered = None
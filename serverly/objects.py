@@ -1,13 +1,15 @@
 import base64
 import collections.abc
 import datetime
-import json as jsonjson
 import mimetypes
 import os
+import re
 import urllib.parse
 from typing import Union
 
 import serverly
+import serverly.staticfiles
+from serverly import jsoncodec
 from serverly.utils import (check_relative_file_path, check_relative_path,
                             get_http_method_type, guess_response_headers,
                             is_json_serializable, lowercase_dict, clean_user_object)
@@ -24,7 +26,7 @@ class DBObject:
                 try:
                     if type(a) == str and a[0] == "[":
                         try:
-                            a = jsonjson.loads(a)
+                            a = jsoncodec.loads(a)
                         except:
                             pass
                 except:
@@ -41,8 +43,23 @@ class DBObject:
         return d
 
 
+_NOT_COMPUTED = object()
+_JSON_START = set('{["-0123456789tfnNI')
+_JSON_LITERALS = ("true", "false", "null", "NaN", "Infinity")
+
+
+def _could_be_json(s: str):
+    """Cheap check whether parsing `s` as JSON is worth a try."""
+    stripped = s.lstrip()
+    if len(stripped) == 0 or stripped[0] not in _JSON_START:
+        return False
+    return stripped[0] not in "tfnNI" or stripped.startswith(_JSON_LITERALS)
+
+
 class CommunicationObject:
-    """More abstract class unifying Request & Response"""
+    """More abstract class unifying Request & Response
+
+    `body` and `obj` are computed lazily from what the body was set to (and memoized), so e.g. a plain text body is never parsed as JSON and a dict body is only serialized when it's sent."""
 
     def __init__(self, headers: dict = {}, body: Union[str, dict, list] = ""):
 
@@ -54,6 +71,8 @@ class CommunicationObject:
 
     @property
     def obj(self):
+        if self._obj is _NOT_COMPUTED:
+            self._obj = self._objectify(self._source)
         return self._obj
 
     @property
@@ -62,53 +81,81 @@ class CommunicationObject:
 
     @headers.setter
     def headers(self, headers: dict):
-        o = self.obj if self.obj else self.body
+        known = "content-type" in self._headers or any(
+            type(k) == str and k.lower() == "content-type" for k in headers)
+        guessed = {} if known else self._guess_headers()
         try:
             self._headers = lowercase_dict({
-                **guess_response_headers(o), **self.headers, **headers})
+                **guessed, **self.headers, **headers})
         except TypeError:
             h = {}
             for i in headers:
                 h[str(i[0], "utf-8")] = str(i[1], "utf-8")
             self._headers = lowercase_dict({
-                **guess_response_headers(o), **self.headers, **h})
+                **guessed, **self.headers, **h})
+
+    def _guess_headers(self):
+        o = self.obj if self.obj else self.body
+        return guess_response_headers(o)
 
     @property
     def body(self):
+        if self._body is _NOT_COMPUTED:
+            self._body = jsoncodec.dumps(self.obj)
         return self._body
 
+    @property
+    def body_bytes(self):
+        """bytes representation of the content as sent to the client. Objects are serialized straight to bytes."""
+        if self._body is _NOT_COMPUTED:
+            return jsoncodec.dumpb(self.obj)
+        body = self.body
+        if type(body) == str:
+            return body.encode("utf-8")
+        return body
+
     @body.setter
-    def body(self, body: Union[str, dict, list, DBObject]):
-        """str, dict, list, DBObject (or subclass) or file-like object"""
-        def dictify(a):
-            if type(a) == list:
-                try:
-                    return jsonjson.dumps(a), a
-                except:
-                    b = [dictify(i)[1] for i in a]
-                    return jsonjson.dumps(b), b
-            elif type(a) == dict:
-                return jsonjson.dumps(a), a
-            elif type(a) == str:
-                try:
-                    obj = jsonjson.loads(a)
-                except jsonjson.JSONDecodeError:
-                    obj = None
-                return a, obj
-            elif issubclass(a.__class__, DBObject):
-                b = clean_user_object(a)
-                return jsonjson.dumps(b), b
-            else:
-                a.seek(0)
-                c = a.read()
-                self._headers["content-type"] = mimetypes.guess_type(a.name)[
-                    0]
-                return c, a
-        self._body, self._obj = dictify(body)
+    def body(self, body: Union[str, bytes, dict, list, DBObject]):
+        """str, bytes, dict, list, DBObject (or subclass) or file-like object"""
+        self._source = body
+        if type(body) == str:
+            self._body = body
+            self._obj = _NOT_COMPUTED
+        elif type(body) in (bytes, bytearray):
+            self._body = bytes(body)
+            self._obj = None
+        elif type(body) in (dict, list) or issubclass(body.__class__, DBObject):
+            self._body = _NOT_COMPUTED
+            self._obj = _NOT_COMPUTED
+        else:
+            body.seek(0)
+            self._body = body.read()
+            self._obj = body
+            self._headers["content-type"] = mimetypes.guess_type(body.name)[
+                0]
+
+    @staticmethod
+    def _objectify(a):
+        """Return the object representation of `a` (str, dict, list or DBObject)."""
+        if type(a) == list:
+            if all(is_json_serializable(i) for i in a):
+                return a
+            return [CommunicationObject._objectify(i) for i in a]
+        elif type(a) == str:
+            if not _could_be_json(a):
+                return None
+            try:
+                return jsoncodec.loads(a)
+            except ValueError:
+                return None
+        elif issubclass(a.__class__, DBObject):
+            return clean_user_object(a)
+        return a
 
     def __del__(self):
-        if hasattr(self.obj, "read"):
-            self.obj.close()
+        o = getattr(self, "_obj", None)
+        if hasattr(o, "read"):
+            o.close()
 
 
 class Request(CommunicationObject):
@@ -117,19 +164,30 @@ class Request(CommunicationObject):
     Attributes:
 
     - headers: dict: Headers received by client
-    - body (get): String representation of requests content
+    - body (get): String representation of requests content (decoded from `raw_body` on first access)
     - body (set): Anything. Will be tried to jsonify, or other things if appropriate.
+    - raw_body: bytes: Content as received by the client. None if body was not given as bytes (or is streamed).
     - obj (get): Object representation of requests content. Might be None.
+    - stream: Async iterator of bytes chunks of the content if the function serving the request is decorated with `serverly.stream_body`, else None.
     - method: str: HTTP-Method (GET/POST etc.)
     - path: urllib.parse.ParseResult(tuple): Parsed data about the request path
     - address: tuple: Client address (e.g. ('localhost', 12345))
     - authenticated: bool: Is user authenticated (not authorized) by any means?
     - auth_type: str/None: Type of authentication (Basic/Bearer)
     - user_cred: tuple/str: Credentials of user authenticating with (e.g. ('root', 'password123') or 'somebearerstring')
+    - timing: serverly.statistics.Timing/None: Durations of the stages of serving the request, if `serverly.statistics.stages` is enabled
     """
 
-    def __init__(self, method: str, path: urllib.parse.ParseResult, headers: dict, body: Union[str, dict], address: tuple):
+    def __init__(self, method: str, path: urllib.parse.ParseResult, headers: dict, body: Union[str, dict, bytes], address: tuple, stream=None):
+        self._raw_body = None
+        self.raw_body = None
+        self.stream = stream
+        self.timing = None
+        if isinstance(body, (bytes, bytearray)):
+            self.raw_body = bytes(body)
+            body = ""
         super().__init__(headers, body)
+        self._raw_body = self.raw_body
 
         self.method = get_http_method_type(method)
         self.path = path
@@ -166,6 +224,30 @@ class Request(CommunicationObject):
         if not self.authenticated:
             self._set_auth_none()
 
+    @property
+    def body(self):
+        if self._raw_body != None:
+            raw = self._raw_body
+            self._raw_body = None
+            CommunicationObject.body.fset(self, raw.decode("utf-8"))
+        return CommunicationObject.body.fget(self)
+
+    @body.setter
+    def body(self, body: Union[str, dict, list, DBObject]):
+        self._raw_body = None
+        CommunicationObject.body.fset(self, body)
+
+    @property
+    def obj(self):
+        if self._raw_body != None:
+            self.body  # decode first
+        return CommunicationObject.obj.fget(self)
+
+    def _guess_headers(self):
+        if self.raw_body != None or self.stream != None:
+            return {}  # content-type is up to the client; don't decode just for guessing
+        return super()._guess_headers()
+
     def _set_auth_none(self):
         self.auth_type = None
         self.user_cred = None
@@ -186,23 +268,63 @@ class Response(CommunicationObject):
     - code: Response code
     - headers: dict of headers to respond to the client
     - body (get): str representation of the content
+    - body_bytes (get): bytes representation of the content as sent to the client
     - obj (get): Object representation of the content. Might be None.
     - body (set): Pretty much anything. Can be list, dict, string, a subclass of DBObject (e.g. serverly.user.User)
-    - bandwidth: Maximum bandwidth used when sending to client (**bytes per sec**). None for no regulation.
+    - body (set) to an iterator/generator or async iterator/generator yielding bytes or str: The content is streamed to the client chunk by chunk as it's produced (`stream`). `body` is empty then.
+    - stream: The (async) iterator the body is streamed from, None if not streamed.
+    - bandwidth: Maximum bandwidth used when sending to client (**bytes per sec**). None for no regulation. See `serverly.bandwidth` for a server-wide cap.
+    - etag: bool: Add an ETag (hash of the content) when sending (if there's none yet), so conditional requests (If-None-Match) are answered with 304 - Not Modified. Ignored for streamed bodies.
     """
 
-    def __init__(self, code: int = 200, headers: dict = {}, body: Union[str, dict, list] = "", bandwidth: int = None):
+    def __init__(self, code: int = 200, headers: dict = {}, body: Union[str, dict, list] = "", bandwidth: int = None, etag: bool = False):
         try:
+            self.stream = None
             super().__init__(headers, body)
             self.code = code
             self.bandwidth = bandwidth
+            self.etag = etag
         except Exception as e:
             serverly.logger.handle_exception(e)
 
+    @property
+    def body(self):
+        return CommunicationObject.body.fget(self)
+
+    @body.setter
+    def body(self, body: Union[str, bytes, dict, list, DBObject]):
+        if isinstance(body, (collections.abc.Iterator, collections.abc.AsyncIterator)) and not hasattr(body, "read"):
+            self.stream = body
+            CommunicationObject.body.fset(self, "")
+        else:
+            self.stream = None
+            CommunicationObject.body.fset(self, body)
+
     def __str__(self):
         return f"Responding to request with a body-length of {str(len(self.body))} and {str(len(self.headers))} headers"
 
 
+class FileResponse(Response):
+    """Behaves like a Response object, but the content is the file at `file_path`, which is sent from disk (zero-copy if the server supports it, see `serverly.staticfiles`) instead of being loaded into memory. `body` is empty. ETag & Last-Modified are derived from the file's size and mtime.
+
+    `parts` can be set to a list of bytes and (offset, count) tuples (windows of the file) to send instead of the whole file (see `serverly.ranges`)."""
+
+    def __init__(self, file_path: str, code: int = 200, headers: dict = {}):
+        self.file_path = file_path
+        self.parts = None
+        stat = os.stat(file_path)
+        content_type = mimetypes.guess_type(file_path)[
+            0] or "application/octet-stream"
+        super().__init__(code, {"content-type": content_type,
+                                "content-length": str(stat.st_size),
+                                "etag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+                                "last-modified": serverly.utils.http_date(stat.st_mtime),
+                                **headers})
+
+    def __str__(self):
+        return f"Responding to request with file '{self.file_path}' and {str(len(self.headers))} headers"
+
+
 class Redirect(Response):
     """Behaves like a Response object. Return it to redirect client to path. If required, you can change the code from 303 - See other (GET only) to whatever you like (might not redirect of course)."""
 
@@ -224,14 +346,17 @@ class StaticSite:
         self.path = path
 
     def get_content(self):
-        """get content from file. Used by serverly."""
-        try:
-            f = open(self.file_path, "r")
-            f.seek(0)
-            f.read()
-        except UnicodeDecodeError:
-            f = open(self.file_path, "rb")
-        return Response(body=f)
+        """get content from file. Used by serverly. Files larger than `serverly.staticfiles.stream_threshold` are streamed (FileResponse), smaller ones are cached in memory. Both support range requests (see `serverly.ranges`)."""
+        f = serverly.staticfiles.get(self.file_path)
+        if f == None:
+            if os.path.getsize(self.file_path) > serverly.staticfiles.stream_threshold:
+                return FileResponse(self.file_path, headers={"accept-ranges": "bytes"})
+            f = serverly.staticfiles.load(self.file_path)
+        headers = {"etag": f.etag, "last-modified": f.last_modified,
+                   "accept-ranges": "bytes"}
+        if f.content_type:
+            headers["content-type"] = f.content_type
+        return Response(headers=headers, body=f.body)
 
     def use(self):
         """register it, so you don't have to"""
@@ -330,6 +455,8 @@ class StaticResource(Resource):
                 path = "/" + dir_path + "/" + f
                 path = "/".join(path.split(".")
                                 [:-1]) if not file_extensions else path
+                # file names are literal paths, not patterns ('.' would match any char)
+                path = re.escape(path)
                 self.__map__[("GET", path)] = StaticSite(
                     (endpoint_path + "/" + path).replace("//", "/"), os.path.join(dir_path, f))
         self.use()
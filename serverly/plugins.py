@@ -24,6 +24,14 @@ class ServerLifespanPlugin(Plugin):
     def onRedirectServerStart(self):
         raise NotImplementedError()
 
+    def onWorkerStart(self, worker: int):
+        """Called in each worker process (with its index) once it's ready to serve, if the server runs with several workers. The other hooks are called once, in the master process."""
+        pass
+
+    def onWorkerShutdown(self, worker: int):
+        """Called in each worker process (with its index) when it's shutting down, if the server runs with several workers."""
+        pass
+
 
 class HeaderPlugin(Plugin):
 
@@ -0,0 +1,91 @@
+"""
+serverly.profiler
+---
+Statistical sampling profiler for the running server: `profile(seconds)` takes a sample of the stacks of all threads of the process (the event loop, the handler threads, ...) every `interval` seconds, without instrumenting any code, so the production traffic pattern and timings stay as they are. The result is returned in the collapsed-stack format (one line per distinct stack: `frame;frame;frame count`, outermost frame first), which flamegraph tools (flamegraph.pl, speedscope, inferno, ...) read directly. Available to admins via the console's 'console.api.profile' endpoint (see `serverly.user.api.use`).
+
+Threads waiting for work (a handler thread waiting for a request, the event loop waiting for I/O, ...) are left out unless `idle`.
+
+Only one profile runs at a time per process.
+
+Configuration
+--
+Attribute | Description
+- | -
+interval = 0.005 | Seconds between samples.
+max_seconds = 60 | Maximum duration of a profile.
+max_depth = 100 | Maximum number of frames per stack (innermost ones).
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+interval = 0.005
+max_seconds = 60
+max_depth = 100
+
+# (file name, function) of the innermost frames of threads waiting for work
+_IDLE = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+         ("thread.py", "_worker"), ("slowlog.py", "_watch")}
+_running = threading.Lock()
+
+
+def _stack(frame):
+    """[internal] Return the stack of `frame` as tuple of (file name, line, function), innermost first."""
+    stack = []
+    while frame != None and len(stack) < max_depth:
+        code = frame.f_code
+        stack.append((code.co_filename, frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    return tuple(stack)
+
+
+def _is_idle(stack: tuple):
+    return len(stack) == 0 or (os.path.basename(stack[0][0]), stack[0][2]) in _IDLE
+
+
+def sample(seconds: float, idle: bool = False):
+    """Sample the stacks of all other threads every `interval` seconds for `seconds` (at most `max_seconds`). Return a Counter of the stacks (tuples of (file name, line, function), innermost first). Raise RuntimeError if another profile is running."""
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("Another profile is running.")
+    try:
+        me = threading.get_ident()
+        counts = collections.Counter()
+        start = time.perf_counter()
+        end = start + min(seconds, max_seconds)
+        n = 0
+        while True:
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = _stack(frame)
+                if idle or not _is_idle(stack):
+                    counts[stack] += 1
+            frames = frame = None  # don't keep the frames (and their locals) alive while sleeping
+            n += 1
+            next_sample = start + n * interval  # no drift from the time sampling takes
+            now = time.perf_counter()
+            if next_sample >= end:
+                break
+            if next_sample > now:
+                time.sleep(next_sample - now)
+        return counts
+    finally:
+        _running.release()
+
+
+def collapse(counts: collections.Counter):
+    """Return the stacks of `counts` (as returned by `sample`) in the collapsed-stack format, most frequent first: one line per stack, its frames (`function (file:line)`) outermost first, separated by ';', and its count."""
+    lines = []
+    for stack, count in counts.most_common():
+        frames = [f"{name} ({filename}:{line})".replace(";", ":")
+                  for filename, line, name in reversed(stack)]
+        lines.append(";".join(frames) + " " + str(count) + "\n")
+    return "".join(lines)
+
+
+def profile(seconds: float, idle: bool = False):
+    """Profile the process for `seconds` (see `sample`). Return the collapsed stacks (str)."""
+    return collapse(sample(seconds, idle))
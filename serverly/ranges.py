@@ -0,0 +1,113 @@
+"""
+serverly.ranges
+---
+Range requests (RFC 7233). Responses with an `accept-ranges: bytes` header (e.g. from a `StaticSite`/`StaticResource`) are answered with 206 - Partial Content for GET requests with a (satisfiable) `Range` header, honoring `If-Range`. Several ranges are sent as multipart/byteranges. Streamed files (`FileResponse`) only read the requested windows from disk.
+
+Configuration
+--
+Attribute | Description
+- | -
+max_ranges = 16 | Maximum number of ranges per request. Requests for more are answered with the whole content.
+"""
+import re
+
+import serverly
+import serverly.utils
+from serverly.objects import FileResponse, Response
+
+max_ranges = 16
+
+_RANGE_SPEC = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+def parse(header: str, size: int):
+    """Return the (start, stop) tuples (stop exclusive) of the satisfiable byte ranges in Range-header `header` for content of `size` bytes, overlapping ones merged. Return None if the header is invalid (or requests more than `max_ranges` ranges), so it's ignored, and [] if no range is satisfiable."""
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    specs = specs.split(",")
+    if len(specs) > max_ranges:
+        return None
+    ranges = []
+    for spec in specs:
+        m = _RANGE_SPEC.match(spec)
+        if m == None or m.group(1) == m.group(2) == "":
+            return None
+        first, last = m.group(1), m.group(2)
+        if first == "":  # suffix: last n bytes
+            n = int(last)
+            if n > 0 and size > 0:
+                ranges.append((max(0, size - n), size))
+            continue
+        first = int(first)
+        if last != "" and int(last) < first:
+            return None
+        if first < size:
+            stop = size if last == "" else min(size, int(last) + 1)
+            ranges.append((first, stop))
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def if_range_matches(request_headers: dict, response_headers: dict):
+    """Return whether the `If-Range` precondition in `request_headers` (if any) holds for the (strong) validators in `response_headers`."""
+    if_range = request_headers.get("if-range", None)
+    if if_range == None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        etag = response_headers.get("etag", None)
+        return etag != None and not etag.startswith("W/") and etag == if_range
+    last_modified = response_headers.get("last-modified", None)
+    if last_modified == None:
+        return False
+    date = serverly.utils.parse_http_date(if_range)
+    return date != None and date == serverly.utils.parse_http_date(last_modified)
+
+
+def partial_response(request_headers: dict, response: Response, body: bytes):
+    """Return the response & body (None for `FileResponse`s) to send instead of (200) `response` with `body`, given `request_headers`: 206 - Partial Content, 416 - Range Not Satisfiable or the unchanged `response`."""
+    if response.code != 200 or response.headers.get("accept-ranges", None) != "bytes":
+        return response, body
+    header = request_headers.get("range", None)
+    if header == None or not if_range_matches(request_headers, response.headers):
+        return response, body
+    is_file = isinstance(response, FileResponse)
+    size = int(response.headers["content-length"]) if is_file else len(body)
+    ranges = parse(header, size)
+    if ranges == None:
+        return response, body
+    if ranges == []:
+        r = Response(416, {"content-range": f"bytes */{size}"})
+        return r, r.body_bytes
+
+    headers = {k: v for k, v in response.headers.items()
+               if k != "content-length"}
+    content_type = headers.get("content-type", "application/octet-stream")
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers["content-range"] = f"bytes {start}-{stop - 1}/{size}"
+        parts = [(start, stop - start)]
+    else:
+        boundary = serverly.utils.ranstr(32)
+        headers["content-type"] = "multipart/byteranges; boundary=" + boundary
+        parts = []
+        for i, (start, stop) in enumerate(ranges):
+            parts.append(bytes(("\r\n" if i > 0 else "") + f"--{boundary}\r\ncontent-type: {content_type}\r\ncontent-range: bytes {start}-{stop - 1}/{size}\r\n\r\n", "utf-8"))
+            parts.append((start, stop - start))
+        parts.append(bytes(f"\r\n--{boundary}--\r\n", "utf-8"))
+    length = sum(len(p) if type(p) == bytes else p[1] for p in parts)
+    headers["content-length"] = str(length)
+
+    if is_file:
+        r = FileResponse(response.file_path, 206, headers)
+        r.parts = parts
+        return r, None
+    r = Response(206, headers, b"".join(
+        p if type(p) == bytes else body[p[0]:p[0] + p[1]] for p in parts), response.bandwidth)
+    return r, r.body_bytes
@@ -0,0 +1,198 @@
+"""Routing engines used by serverly's `Sitemap` to map a request path to the pattern (and therefore the site) serving it.
+
+All routers keep serverly's first-match-wins semantics: of all patterns matching a path, the one registered first is returned.
+"""
+import re
+
+_META_CHARS = ".^$*+?{}[]|()"
+_QUANTIFIERS = "*+?{"
+# numbered backreferences would point to the wrong group once combined
+_NUMBERED_REFERENCE = re.compile(r"\\[1-9]|\(\?\(\d")
+
+
+def _segments(path: str):
+    """Split `path` into its segments, e.g. '/a/b' -> ['a', 'b']."""
+    return path.split("/")[1:]
+
+
+def split_pattern(pattern: str):
+    """Return a tuple (literal_prefix, exact) for a path pattern.
+
+    `literal_prefix` is the part of the pattern every matching path has to start with. `exact` is True if the pattern matches nothing but `literal_prefix` itself (no regex magic involved).
+    """
+    i = 1 if pattern.startswith("^") else 0
+    literal = []
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            if i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+                char, step = pattern[i + 1], 2
+            else:
+                break  # character class like \w, \d, ...
+        elif c in _META_CHARS:
+            break
+        else:
+            char, step = c, 1
+        if i + step < len(pattern) and pattern[i + step] in _QUANTIFIERS:
+            break  # char belongs to the quantified (dynamic) part
+        literal.append(char)
+        i += step
+    rest = pattern[i:]
+    if "|" in rest:  # top-level alternation might invalidate the prefix
+        return "", False
+    return "".join(literal), rest == "$"
+
+
+class _Node:
+    def __init__(self):
+        self.children = {}
+        self.exact = []  # [(index, pattern)]
+        self.dynamic = []  # [(index, pattern, compiled pattern)]
+
+
+class TrieRouter:
+    """Path-segment trie. Patterns without any regex magic (e.g. '^/index$') are found by walking the trie, dynamic patterns are stored at the node of their literal prefix and only tried for paths passing that node. Routing cost therefore depends on the length of the path, not on the number of routes registered."""
+
+    def __init__(self, patterns=[]):
+        self._root = _Node()
+        self._routes = {}
+        self._counter = 0
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern: str):
+        """Add `pattern` (no-op if already present, so it keeps its precedence)."""
+        if pattern in self._routes:
+            return
+        index = self._counter
+        self._counter += 1
+        prefix, exact = split_pattern(pattern)
+        if exact:
+            segments = _segments(prefix)
+        else:
+            segments = _segments(prefix)[:-1]  # only complete segments
+        node = self._root
+        for segment in segments:
+            node = node.children.setdefault(segment, _Node())
+        if exact:
+            entry = (index, pattern)
+            node.exact.append(entry)
+            node.exact.sort()
+        else:
+            entry = (index, pattern, re.compile(pattern))
+            node.dynamic.append(entry)
+        self._routes[pattern] = (node, entry)
+
+    def remove(self, pattern: str):
+        """Remove `pattern`. Return bool whether it was found."""
+        try:
+            node, entry = self._routes.pop(pattern)
+        except KeyError:
+            return False
+        if len(entry) == 2:
+            node.exact.remove(entry)
+        else:
+            node.dynamic.remove(entry)
+        return True
+
+    def match(self, path: str):
+        """Return the first registered pattern matching `path` or None."""
+        node = self._root
+        candidates = []
+        for segment in _segments(path):
+            candidates.extend(node.dynamic)
+            node = node.children.get(segment, None)
+            if node == None:
+                break
+        else:
+            candidates.extend(node.dynamic)
+            if node.exact:
+                candidates.append(node.exact[0])
+        if len(candidates) > 1:
+            candidates.sort(key=lambda entry: entry[0])
+        for entry in candidates:
+            if len(entry) == 2 or entry[2].match(path):
+                return entry[1]
+        return None
+
+    def __len__(self):
+        return len(self._routes)
+
+    def __contains__(self, pattern: str):
+        return pattern in self._routes
+
+
+class CombinedRegexRouter:
+    """Compiles all patterns into one alternation of named groups, so a lookup costs a single `re.match`. Meant for apps whose routes are (nearly) all regex. The combined pattern is recompiled lazily after `add`/`remove`. If the patterns cannot be combined (e.g. duplicate group names or numbered backreferences), falls back to trying them one by one."""
+
+    def __init__(self, patterns=[]):
+        self._patterns = []
+        self._compiled = None
+        self._groups = {}
+        self._dirty = True
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern: str):
+        """Add `pattern` (no-op if already present, so it keeps its precedence)."""
+        if pattern in self._patterns:
+            return
+        re.compile(pattern)  # fail early on invalid patterns
+        self._patterns.append(pattern)
+        self._dirty = True
+
+    def remove(self, pattern: str):
+        """Remove `pattern`. Return bool whether it was found."""
+        try:
+            self._patterns.remove(pattern)
+        except ValueError:
+            return False
+        self._dirty = True
+        return True
+
+    def _compile(self):
+        self._dirty = False
+        self._groups = {}
+        if not self._patterns:
+            self._compiled = None
+            return
+        if any(_NUMBERED_REFERENCE.search(p) for p in self._patterns):
+            self._compiled = False
+            return
+        combined = "|".join(
+            f"(?P<_r{i}>{p})" for i, p in enumerate(self._patterns))
+        try:
+            self._compiled = re.compile(combined)
+        except (re.error, AssertionError, OverflowError):
+            self._compiled = False
+            return
+        for i, p in enumerate(self._patterns):
+            self._groups[self._compiled.groupindex[f"_r{i}"]] = p
+
+    def match(self, path: str):
+        """Return the first registered pattern matching `path` or None."""
+        if self._dirty:
+            self._compile()
+        if self._compiled == None:
+            return None
+        if self._compiled == False:
+            for pattern in self._patterns:
+                if re.match(pattern, path):
+                    return pattern
+            return None
+        m = self._compiled.match(path)
+        if m == None:
+            return None
+        return self._groups[m.lastindex]
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __contains__(self, pattern: str):
+        return pattern in self._patterns
+
+
+routers = {
+    "trie": TrieRouter,
+    "regex": CombinedRegexRouter
+}
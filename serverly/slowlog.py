@@ -0,0 +1,168 @@
+"""
+serverly.slowlog
+---
+Log of slow requests: every request taking longer than `threshold` is recorded with its request line, the function serving it, its status code, the time spent in each stage (see `serverly.statistics.STAGES`) and samples of the stack of the thread running its handler, taken every `sample_interval` seconds by a watchdog thread once the request has run for half the `threshold`. Identical consecutive samples are counted instead of repeated.
+
+The latest `size` entries are kept in memory (per process), newest first in `get_entries()`, e.g. via the admin console's 'console.api.slow_requests' endpoint (see `serverly.user.api.use`).
+
+Keeping track of the requests in flight costs about a microsecond per request; stacks are only sampled while requests are slow.
+
+Configuration
+--
+Attribute | Description
+- | -
+threshold = 1.0 | Seconds after which a request is logged. None disables the log.
+sample_interval = 0.05 | Seconds between stack samples of slow requests.
+max_samples = 50 | Maximum number of (distinct consecutive) stack samples per request.
+max_depth = 40 | Maximum number of frames per stack sample (innermost ones).
+size = 100 | Number of slow requests kept.
+"""
+import collections
+import contextvars
+import datetime
+import os
+import sys
+import threading
+import time
+import traceback
+
+import serverly
+import serverly.statistics
+
+threshold = 1.0
+sample_interval = 0.05
+max_samples = 50
+max_depth = 40
+size = 100
+
+_log = collections.deque(maxlen=size)
+_in_flight = {}
+_current = contextvars.ContextVar("serverly_slowlog", default=None)
+_lock = threading.Lock()
+_watchdog = None  # pid of the process the watchdog thread runs in
+
+
+class _Request:
+    """[internal] A request in flight: when it started, the thread running it (its handler) & the stack samples taken."""
+
+    __slots__ = ("start", "started", "method", "target", "thread", "samples", "_token")
+
+    def __init__(self, scope: dict):
+        self.start = time.perf_counter()
+        self.started = time.time()
+        self.method = scope["method"]
+        query = scope.get("query_string", b"")
+        self.target = scope["path"] + ("?" + str(query, "latin-1") if query else "")
+        self.thread = threading.get_ident()
+        self.samples = []  # [seconds since start, stack, count]
+
+
+def start(scope: dict):
+    """[internal] Keep track of the request of ASGI `scope` being served in the current context. Return its record, to be passed to `finish`."""
+    if _watchdog != os.getpid():  # threads don't survive forking into the workers
+        _start_watchdog()
+    r = _Request(scope)
+    r._token = _current.set(r)
+    _in_flight[id(r)] = r
+    return r
+
+
+def in_thread(func, *args):
+    """[internal] Call `func(*args)` (in a thread of the handler thread pool) as part of the current request, so its stack is sampled instead of the event loop's."""
+    r = _current.get()
+    if r == None:
+        return func(*args)
+    loop_thread = r.thread
+    r.thread = threading.get_ident()
+    try:
+        return func(*args)
+    finally:
+        r.thread = loop_thread
+
+
+def finish(r: _Request, function: str, code: int, timing=None):
+    """[internal] Stop keeping track of request `r`, served by `function` with status `code`. Log it if it took longer than `threshold`."""
+    _in_flight.pop(id(r), None)
+    try:
+        _current.reset(r._token)
+    except ValueError:
+        pass
+    duration = time.perf_counter() - r.start
+    if threshold == None or duration < threshold:
+        return
+    entry = {
+        "time": datetime.datetime.fromtimestamp(r.started).isoformat(),
+        "request": r.method + " " + r.target,
+        "function": function,
+        "code": code,
+        "duration": duration * 1000,
+        "pid": os.getpid(),
+        "stages": dict(zip(serverly.statistics.STAGES, [d * 1000 for d in timing.durations])) if timing != None else None,
+        "samples": [{"at": at * 1000, "count": count, "stack": stack} for at, stack, count in r.samples]
+    }
+    with _lock:
+        if _log.maxlen != size:
+            _resize()
+        _log.append(entry)
+
+
+def _resize():
+    global _log
+    _log = collections.deque(_log, maxlen=size)
+
+
+def get_entries():
+    """Return the logged slow requests (of this process), newest first, as list of dicts: time (ISO format), request (request line), function, code, duration (ms), pid, stages (ms per stage) & samples (at: ms since start, count: number of consecutive identical samples, stack: list of 'file:line in function', innermost last)."""
+    with _lock:
+        return list(reversed(_log))
+
+
+def clear():
+    """Remove all logged slow requests."""
+    with _lock:
+        _log.clear()
+
+
+def _stack(frame):
+    frames = traceback.StackSummary.extract(
+        traceback.walk_stack(frame), limit=max_depth, lookup_lines=False)
+    return [f"{f.filename}:{f.lineno} in {f.name}" for f in reversed(frames)]
+
+
+def _sample():
+    """[internal] Take a stack sample of each request in flight for half the `threshold` or longer."""
+    if threshold == None:
+        return
+    now = time.perf_counter()
+    due = [r for r in list(_in_flight.values())
+           if now - r.start >= threshold / 2 and len(r.samples) < max_samples]
+    if len(due) == 0:
+        return
+    frames = sys._current_frames()
+    for r in due:
+        frame = frames.get(r.thread, None)
+        if frame == None:
+            continue
+        stack = _stack(frame)
+        if len(r.samples) > 0 and r.samples[-1][1] == stack:
+            r.samples[-1][2] += 1
+        else:
+            r.samples.append([now - r.start, stack, 1])
+
+
+def _watch():
+    while True:
+        time.sleep(sample_interval)
+        try:
+            _sample()
+        except Exception as e:
+            serverly.logger.handle_exception(e)
+
+
+def _start_watchdog():
+    global _watchdog
+    with _lock:
+        if _watchdog != os.getpid():
+            _watchdog = os.getpid()
+            threading.Thread(target=_watch, name="serverly-slowlog",
+                             daemon=True).start()
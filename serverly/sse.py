@@ -0,0 +1,203 @@
+"""
+serverly.sse
+---
+Server-Sent Events & long polling. Return an `EventStream` from a function to push events to the client over one long-lived response, and use a `Channel` to publish events to many subscribers at once (each event is serialized only once):
+
+```python
+stats = serverly.sse.Channel()
+
+@serverly.serves("GET", "/events")
+def events(request):
+    return serverly.sse.EventStream(stats.subscribe())
+
+@serverly.serves("GET", "/poll")
+async def poll(request):
+    event = await stats.next(timeout=30)  # long polling
+    return Response(body=event.data) if event != None else Response(204)
+
+stats.publish({"requests": 42}, event="statistics")  # from any thread
+```
+
+Clients that disconnect are detected and their subscriptions removed. Channels (and their subscribers) are local to the process.
+
+Configuration
+--
+Attribute | Description
+- | -
+heartbeat = 15 | Seconds after which a comment is sent if there was no event, so proxies don't close idle streams. None to disable.
+queue_size = 64 | Maximum number of events buffered per subscriber. If a subscriber is too slow, its oldest events are dropped.
+"""
+import asyncio
+import collections.abc
+import inspect
+import threading
+
+import serverly
+from serverly import jsoncodec
+from serverly.objects import Response
+
+heartbeat = 15
+queue_size = 64
+
+
+class Event:
+    """An event as sent to the client. `data` is a str or anything JSON-serializable, `event` the event type (None for 'message'), `id` sets the client's last event ID and `retry` its reconnection time (ms)."""
+
+    def __init__(self, data="", event: str = None, id: str = None, retry: int = None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+        self._encoded = None
+
+    def encode(self):
+        """Return the event in the text/event-stream format (memoized, so it's serialized only once no matter how many subscribers receive it)."""
+        if self._encoded == None:
+            data = self.data if type(self.data) == str else jsoncodec.dumps(
+                self.data)
+            lines = []
+            if self.event != None:
+                lines.append("event: " + str(self.event))
+            if self.id != None:
+                lines.append("id: " + str(self.id))
+            if self.retry != None:
+                lines.append("retry: " + str(int(self.retry)))
+            lines += ["data: " + l for l in data.splitlines() or [""]]
+            self._encoded = bytes("\n".join(lines) + "\n\n", "utf-8")
+        return self._encoded
+
+    def __str__(self):
+        return self.encode().decode("utf-8")
+
+
+class EventStream(Response):
+    """Behaves like a Response object, but keeps the connection open and sends the events yielded by `events` as Server-Sent Events (text/event-stream). `events` can be an (async) iterator/generator of `Event`s or data (str or JSON-serializable), e.g. `Channel.subscribe()`. A comment is sent every `heartbeat` seconds without events."""
+
+    def __init__(self, events, code: int = 200, headers: dict = {}, heartbeat: float = None):
+        self.heartbeat = heartbeat if heartbeat != None else serverly.sse.heartbeat
+        super().__init__(code, {"content-type": "text/event-stream",
+                                "cache-control": "no-cache, no-transform",  # no compression, so events aren't buffered
+                                "x-accel-buffering": "no", **headers}, self._encode(events))
+
+    async def _encode(self, events):
+        if not isinstance(events, collections.abc.AsyncIterator):
+            events = _iterate_in_thread(iter(events))
+        pending = None
+        try:
+            while True:
+                if pending == None:
+                    pending = asyncio.ensure_future(events.__anext__())
+                done, _ = await asyncio.wait({pending}, timeout=self.heartbeat)
+                if not done:
+                    yield b": heartbeat\n\n"
+                    continue
+                try:
+                    item = pending.result()
+                except StopAsyncIteration:
+                    pending = None
+                    return
+                pending = None
+                yield (item if isinstance(item, Event) else Event(item)).encode()
+        finally:
+            if pending != None:
+                pending.cancel()
+                try:
+                    await pending  # the generator has to stop running before it's closed
+                except (asyncio.CancelledError, Exception):
+                    pass
+            if hasattr(events, "aclose"):
+                await events.aclose()
+
+    def __str__(self):
+        return f"Responding to request with an event stream and {str(len(self.headers))} headers"
+
+
+async def _iterate_in_thread(iterator):
+    done = object()
+    while True:
+        item = await serverly._sitemap._run_in_thread(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+class _Subscriber:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+        self.queue = asyncio.Queue(queue_size)
+
+    def put(self, event: Event):
+        if self.queue.full():
+            self.queue.get_nowait()  # drop the oldest
+        self.queue.put_nowait(event)
+
+
+class Channel:
+    """Publish events to any number of subscribers. Publishing is thread-safe, so sync functions (running in the handler thread pool) can publish as well.
+
+    If `source` (a (async) function returning data or an `Event`) is given, its result is published every `interval` seconds as long as there are subscribers, computed once for all of them."""
+
+    def __init__(self, source=None, interval: float = 5):
+        self.source = source
+        self.interval = interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._task = None
+        self._task_loop = None
+
+    @property
+    def subscribers(self):
+        """Number of current subscribers."""
+        return len(self._subscribers)
+
+    def publish(self, data, event: str = None, id: str = None, retry: int = None):
+        """Send an event with `data` (str or JSON-serializable, or an `Event`) to all subscribers. Return the number of subscribers."""
+        e = data if isinstance(data, Event) else Event(data, event, id, retry)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for s in subscribers:
+            try:
+                s.loop.call_soon_threadsafe(s.put, e)
+            except RuntimeError:  # loop closed
+                self._unsubscribe(s)
+        return len(subscribers)
+
+    async def subscribe(self):
+        """Async generator yielding the events published from now on until it's closed (e.g. when the client disconnects)."""
+        s = _Subscriber()
+        with self._lock:
+            self._subscribers.add(s)
+        if self.source != None and (self._task == None or self._task.done() or self._task_loop != s.loop):
+            self._task = asyncio.ensure_future(self._publish_periodically())
+            self._task_loop = s.loop
+        try:
+            while True:
+                yield await s.queue.get()
+        finally:
+            self._unsubscribe(s)
+
+    async def next(self, timeout: float = None):
+        """Wait for the next published event and return it (as `Event`). Return None after `timeout` seconds without one (long polling)."""
+        events = self.subscribe()
+        try:
+            return await asyncio.wait_for(events.__anext__(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            await events.aclose()
+
+    def _unsubscribe(self, subscriber: _Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    async def _publish_periodically(self):
+        while self._subscribers:
+            try:
+                if inspect.iscoroutinefunction(self.source):
+                    data = await self.source()
+                else:
+                    data = await serverly._sitemap._run_in_thread(self.source)
+                self.publish(data)
+            except Exception as e:
+                serverly.logger.handle_exception(e)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,242 @@
+"""
+serverly.staticfiles
+---
+Sending files from disk without loading them into memory. Used for responses of type `serverly.objects.FileResponse` (e.g. large files served by a `StaticSite`).
+
+If the ASGI server supports the `http.response.pathsend` or `http.response.zerocopysend` extension, the file is handed over to it (zero-copy). Otherwise it's memory-mapped and sent in chunks of `chunk_size` bytes.
+
+Smaller files are kept in an in-memory LRU cache (content, content-type & ETag) which is invalidated when a file changes: via inotify if `inotify_simple` is installed (Linux), otherwise by comparing the mtime on every hit.
+
+Configuration
+--
+Attribute | Description
+- | -
+stream_threshold = 1048576 | Files larger than this (bytes) are streamed by `StaticSite`s instead of read into memory. Streamed files are not searched for SUPERPATH.
+chunk_size = 65536 | Size (bytes) of the chunks sent when the file is memory-mapped.
+cache_size = 33554432 | Maximum total size (bytes) of cached files. 0 disables the cache.
+use_inotify = True | Use inotify (if available) instead of checking the mtime on every cache hit.
+"""
+import collections
+import mimetypes
+import mmap
+import os
+import threading
+
+import serverly
+import serverly.utils
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+stream_threshold = 1024 * 1024
+chunk_size = 64 * 1024
+cache_size = 32 * 1024 * 1024
+use_inotify = True
+
+_cache = collections.OrderedDict()
+_cache_bytes = 0
+_lock = threading.RLock()
+_watcher = None
+_watcher_pid = None
+
+
+class CachedFile:
+    """Content of a (small) file as used by `StaticSite`.
+
+    Attributes
+    ---
+    - body: str if the file is valid UTF-8, else bytes
+    - size: size in bytes
+    - content_type: guessed by the file name, None if unknown
+    - etag: strong ETag (hash of the content)
+    - mtime: modification time (ns)
+    - last_modified: modification time as HTTP-date
+    """
+
+    def __init__(self, file_path: str, content: bytes, stat: os.stat_result):
+        self.file_path = file_path
+        self.size = len(content)
+        self.mtime = stat.st_mtime_ns
+        self.last_modified = serverly.utils.http_date(stat.st_mtime)
+        self.etag = serverly.utils.content_etag(content)
+        self.content_type = mimetypes.guess_type(file_path)[0]
+        try:
+            self.body = content.decode("utf-8")
+        except UnicodeDecodeError:
+            self.body = content
+
+
+class _Watcher(threading.Thread):
+    """Invalidates cache entries of files changed on disk (inotify)."""
+
+    _flags = None
+
+    def __init__(self):
+        super().__init__(name="serverly-staticfiles-watcher", daemon=True)
+        f = inotify_simple.flags
+        self._flags = f.MODIFY | f.ATTRIB | f.CLOSE_WRITE | f.DELETE_SELF | f.MOVE_SELF
+        self.inotify = inotify_simple.INotify()
+        self.paths = {}  # wd -> {paths}
+        self.wds = {}  # path -> wd
+        self.events = collections.Counter()  # path -> number of changes
+
+    def watch(self, path: str):
+        if path in self.wds:
+            return
+        wd = self.inotify.add_watch(path, self._flags)
+        self.paths.setdefault(wd, set()).add(path)
+        self.wds[path] = wd
+
+    def unwatch(self, path: str):
+        wd = self.wds.pop(path, None)
+        paths = self.paths.get(wd, set())
+        paths.discard(path)
+        if wd != None and not paths:
+            del self.paths[wd]
+            try:
+                self.inotify.rm_watch(wd)
+            except OSError:
+                pass  # already removed (file deleted)
+
+    def run(self):
+        while True:
+            for event in self.inotify.read():
+                with _lock:
+                    for path in list(self.paths.get(event.wd, ())):
+                        self.events[path] += 1
+                        invalidate(path)
+
+
+def _get_watcher():
+    """Return the inotify watcher of this process or None if unavailable. Threads don't survive forking, so a new one is started (and the cache cleared) in a new process."""
+    global _watcher, _watcher_pid
+    if not use_inotify or inotify_simple == None:
+        return None
+    if _watcher_pid != os.getpid():
+        _watcher = None
+        _watcher_pid = os.getpid()
+        clear()
+        try:
+            _watcher = _Watcher()
+            _watcher.start()
+        except Exception as e:
+            serverly.logger.handle_exception(e)
+    return _watcher
+
+
+def invalidate(file_path: str):
+    """Remove `file_path` from the cache."""
+    global _cache_bytes
+    with _lock:
+        entry = _cache.pop(file_path, None)
+        if entry != None:
+            _cache_bytes -= entry.size
+            if _watcher != None:
+                _watcher.unwatch(file_path)
+
+
+def clear():
+    """Remove all files from the cache."""
+    with _lock:
+        for path in list(_cache.keys()):
+            invalidate(path)
+
+
+def get(file_path: str):
+    """Return the up-to-date CachedFile for `file_path` or None if it isn't cached."""
+    with _lock:
+        entry = _cache.get(file_path, None)
+        if entry == None:
+            return None
+        _cache.move_to_end(file_path)
+        watched = _watcher != None and _watcher_pid == os.getpid()
+    if not watched:
+        try:
+            stat = os.stat(file_path)
+            outdated = stat.st_mtime_ns != entry.mtime or stat.st_size != entry.size
+        except OSError:
+            outdated = True
+        if outdated:
+            invalidate(file_path)
+            return None
+    return entry
+
+
+def load(file_path: str):
+    """Read the file at `file_path`, cache it (if it fits into `cache_size`) and return it as CachedFile."""
+    global _cache_bytes
+    watcher = _get_watcher()
+    events = None
+    if watcher != None:
+        with _lock:
+            invalidate(file_path)
+            try:
+                # watch before reading so changes made meanwhile aren't missed
+                watcher.watch(file_path)
+                events = watcher.events[file_path]
+            except OSError:
+                pass
+    with open(file_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        content = f.read()
+    entry = CachedFile(file_path, content, stat)
+    if entry.size > cache_size:
+        return entry
+    with _lock:
+        if watcher != None:
+            if events == None or watcher.events[file_path] != events or file_path not in watcher.wds:
+                return entry  # not watched or changed while reading
+        else:
+            invalidate(file_path)
+        _cache[file_path] = entry
+        _cache_bytes += entry.size
+        while _cache_bytes > cache_size:
+            invalidate(next(iter(_cache)))
+    return entry
+
+
+def iter_file(file_path: str, offset: int = 0, count: int = None):
+    """Yield `count` bytes (None for all) of the file at `file_path`, starting at `offset`, in chunks of (at most) `chunk_size` bytes. Only the requested window is read from disk."""
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if count == None else min(size, offset + count)
+        if end <= offset:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for i in range(offset, end, chunk_size):
+                yield m[i:min(i + chunk_size, end)]
+
+
+async def send_file(send, file_path: str, extensions: dict = {}, offset: int = 0, count: int = None):
+    """Send `count` bytes (None for all) of the file at `file_path`, starting at `offset`, as the body of a response via the ASGI `send` callable. `extensions` are the extensions of the ASGI scope. The response start has to be sent already."""
+    path = os.path.abspath(file_path)
+    if "http.response.pathsend" in extensions and offset == 0 and count == None:
+        await send({"type": "http.response.pathsend", "path": path})
+        return
+    if "http.response.zerocopysend" in extensions:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            end = size if count == None else min(size, offset + count)
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": f,
+                "offset": offset,
+                "count": max(0, end - offset)
+            })
+        return
+    await send_file_parts(send, path, [(offset, count)])
+
+
+async def send_file_parts(send, file_path: str, parts: list):
+    """Send a body made of `parts` via the ASGI `send` callable. Parts are either bytes (sent as they are) or (offset, count) tuples describing a window of the file at `file_path` (e.g. multipart/byteranges responses). The response start has to be sent already."""
+    pending = b""
+    for part in parts:
+        chunks = [part] if type(part) == bytes else iter_file(
+            file_path, *part)
+        for chunk in chunks:
+            if pending:
+                await send({"type": "http.response.body", "body": pending, "more_body": True})
+            pending = chunk
+    await send({"type": "http.response.body", "body": pending, "more_body": False})
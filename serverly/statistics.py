@@ -1,70 +1,382 @@
+"""
+serverly.statistics
+---
+Calculation time statistics (ms) per function serving requests and of the server overall, as well as route cache hits & misses.
+
+Besides min, max & mean, every calculation time is recorded (in constant time) in a histogram with logarithmic buckets (8 per power of two from 1 microsecond to ~4.5 minutes, so values are accurate to ~6%), from which the `percentiles` (e.g. p50, p99, p999) are computed when reading the statistics.
+
+The statistics are kept in fixed-size counters. When the server runs with several workers (see `serverly.start(workers=...)`), they are located in a `multiprocessing.shared_memory` segment (an anonymous shared mapping before Python 3.8) in which every process updates its own stripe of counters (so updating needs no locks or IPC at all). Reading (`get_overall_performance`, `get_endpoint_performance`, ...) adds up the stripes of all processes, so e.g. the admin console shows the statistics of the whole server no matter which worker serves it.
+
+The number of requests currently being served (`get_in_flight`) is counted as well.
+
+If `stages` is enabled, the time spent in each stage of serving a request (see `STAGES`) is recorded as well: parse (reading the body & parsing the request), route (finding the function), auth (authentication decorators of `serverly.user`), handler (the function without its authentication), plugins (header plugins) & send (conditional requests, ranges, compression & sending the response). See `get_overall_stages` & `get_endpoint_stages`. With `server_timing`, responses carry them in a `Server-Timing` header (except for send, which isn't over yet), so they show up in the browser's developer tools.
+
+`overall_performance`, `endpoint_performance` and `route_cache` are (read-only) aggregated views, computed when accessed.
+
+Configuration
+--
+Attribute | Description
+- | -
+filename = "statistics.json" | File `print_stats` saves the statistics to.
+max_endpoints = 1024 | Maximum number of functions statistics are kept for. Further ones are only counted in the overall statistics. Needs to be set before the server is started.
+percentiles = [50, 90, 99, 99.9] | Percentiles reported (as 'p50', 'p90', 'p99', 'p999' etc.).
+stages = False | Record the time spent in each stage of serving requests.
+server_timing = False | Send the stages' times in a `Server-Timing` header (if they're measured, i.e. `stages` or `serverly.slowlog` is enabled). Reveals details about the server to clients.
+"""
+import mmap
+import multiprocessing
+import threading
+import time
+from math import frexp
+
 import numpy as np
 from tabulate import tabulate
-import signal
-import json
+
+from serverly import jsoncodec
 
 filename = "statistics.json"
+max_endpoints = 1024
+percentiles = [50, 90, 99, 99.9]
+stages = False
+server_timing = False
+
+STAGES = ("parse", "route", "auth", "handler", "plugins", "send")
+PARSE, ROUTE, AUTH, HANDLER, PLUGINS, SEND = range(len(STAGES))
+
+_NAME_SIZE = 128  # bytes per function name (utf-8, truncated)
+_COUNT, _SUM, _MIN, _MAX = range(4)
+_N_NAMES, _GENERATION = range(2)
+_EMPTY = {"min": 100000000000.0, "max": 0.0, "mean": 0.0, "len": 0}
+
+_SUB_BUCKETS = 8  # per power of two
+_OCTAVES = 28  # 1us - 2^28us
+_BUCKETS = 1 + _OCTAVES * _SUB_BUCKETS  # bucket 0: < 1us
+# bounds (ms) of the histogram buckets
+_UPPER = np.array([0.001] + [2 ** (i // _SUB_BUCKETS) * (1 + (i % _SUB_BUCKETS + 1) / _SUB_BUCKETS) / 1000
+                             for i in range(_BUCKETS - 1)])
+_LOWER = np.concatenate(([0.0], _UPPER[:-1]))
+
+
+def _layout(stripes: int, endpoints: int):
+    """[internal] Return the (name, dtype, shape) of the arrays making up the statistics of `stripes` processes. Slot 0 of the counters holds the overall statistics."""
+    return [
+        ("counters", np.float64, (stripes, endpoints + 1, 4)),
+        ("histograms", np.uint32, (stripes, endpoints + 1, _BUCKETS)),
+        # total time (ms) per stage & number of requests with stages recorded
+        ("stages", np.float64, (stripes, endpoints + 1, len(STAGES) + 1)),
+        ("route_cache", np.int64, (stripes, 2)),
+        ("in_flight", np.int64, (stripes, 1)),
+        ("header", np.int64, (2,)),  # number of names, generation (incremented by reset)
+        ("names", np.uint8, (endpoints + 1, _NAME_SIZE)),
+    ]
+
+
+class _Storage:
+    """[internal] The statistics' arrays, either local to the process or views of a shared memory segment (which survive forking)."""
+
+    def __init__(self, stripes: int = 1, shared: bool = False):
+        layout = _layout(stripes, max_endpoints)
+        size = sum(np.dtype(dtype).itemsize * int(np.prod(shape))
+                   for _, dtype, shape in layout)
+        self.shm = None
+        if shared:
+            try:
+                from multiprocessing import shared_memory
+                self.shm = shared_memory.SharedMemory(create=True, size=size)
+                # the mapping stays valid (for forked workers as well), so nothing is left behind in /dev/shm
+                self.shm.unlink()
+                buffer = self.shm.buf
+            except ImportError:  # Python < 3.8: anonymous mappings are shared with forked processes as well
+                self.shm = mmap.mmap(-1, size)
+                buffer = self.shm
+        else:
+            buffer = bytearray(size)
+        offset = 0
+        for name, dtype, shape in layout:
+            a = np.ndarray(shape, dtype, buffer, offset)
+            offset += a.nbytes
+            setattr(self, name, a)
+        self.lock = multiprocessing.Lock() if shared else threading.Lock()
+        self.flat_header = memoryview(self.header).cast("B").cast("q")
+        self.clear()
+        self.set_stripe(0)
+
+    def set_stripe(self, stripe: int):
+        """Let this process update stripe `stripe` through flat memoryviews (faster than indexing numpy arrays)."""
+        self.my_counters = memoryview(self.counters[stripe]).cast("B").cast("d")
+        self.my_histograms = memoryview(
+            self.histograms[stripe]).cast("B").cast("I")
+        self.my_stages = memoryview(self.stages[stripe]).cast("B").cast("d")
+        self.my_route_cache = memoryview(self.route_cache[stripe]).cast("B").cast("q")
+        # requests of a process which previously used the stripe (and died) aren't in flight anymore
+        self.in_flight[stripe] = 0
+        self.my_in_flight = memoryview(self.in_flight[stripe]).cast("B").cast("q")
+
+    def clear(self):
+        self.counters[:] = 0
+        self.histograms[:] = 0
+        self.stages[:] = 0
+        self.counters[:, :, _MIN] = np.inf
+        self.route_cache[:] = 0
+        self.header[_N_NAMES] = 0
+        self.header[_GENERATION] += 1
 
-overall_performance = {
-    "min": 100000000000.0,
-    "max": 0.0,
-    "mean": 0.0,
-    "len": 0
-}
 
-endpoint_performance = {}
+_storage = _Storage()
+_slots = {}  # function name -> slot, cached per process
+_generation = None  # of the storage when _slots was filled
 
 
-def new_statistic(function: str, time: float):
+def _init_shared(stripes: int):
+    """[internal] Keep the statistics in shared memory with a stripe for each of `stripes` processes forked afterwards. Resets the statistics."""
+    global _storage
+    _storage = _Storage(stripes, True)
+
+
+def _set_stripe(stripe: int):
+    """[internal] Make this (forked) process update stripe `stripe` of the shared statistics."""
+    _storage.set_stripe(stripe)
+
+
+def _name(slot: int):
+    return bytes(_storage.names[slot]).rstrip(b"\0").decode("utf-8", "ignore")
+
+
+def _get_slot(function: str):
+    """[internal] Return the counters' slot of `function` (allocated if necessary), or None if there are already `max_endpoints` functions."""
+    global _generation
+    if _storage.flat_header[_GENERATION] != _generation:  # reset (by any process)
+        _slots.clear()
+        _generation = _storage.flat_header[_GENERATION]
+    slot = _slots.get(function, None)
+    if slot != None:
+        return slot
+    encoded = function.encode("utf-8")[:_NAME_SIZE]
+    with _storage.lock:  # only when a process sees a function for the first time
+        n = int(_storage.header[_N_NAMES])
+        for i in range(1, n + 1):
+            if bytes(_storage.names[i]).rstrip(b"\0") == encoded:
+                slot = i
+                break
+        else:
+            if n >= max_endpoints:
+                return None
+            slot = n + 1
+            _storage.names[slot] = 0
+            _storage.names[slot, :len(encoded)] = np.frombuffer(
+                encoded, np.uint8)
+            _storage.header[_N_NAMES] = slot
+    _slots[function] = slot
+    return slot
+
+
+def new_statistic(function: str, time: float, timing=None):
     """Register a new statistic both for the specific endpoint as well as the overall server performance.
 
     :param function: function serving the endpoint
     :param response_time: (calc) time of the function + serverly in seconds
+    :param timing: durations of the request's stages, if recorded
     :type function: str
     :type time: flloat
+    :type timing: Timing
     """
-    global overall_performance, endpoint_performance
-
-    def refresh_stats(s: dict):
-        d = s.copy()
-        d["len"] += 1
-        if d["len"] > 1:
-            d["min"] = d["min"] if d["min"] < t else t
-            d["max"] = d["max"] if d["max"] > t else t
-            d["mean"] = (d["mean"] * (d["len"] - 1) + t) / d["len"]
-        else:
-            d["min"] = t
-            d["max"] = t
-            d["mean"] = t
-        return d
     t = time * 1000
-    endpoint_performance[function] = refresh_stats(endpoint_performance.get(
-        function, {"min": 100000000000.0, "max": 0.0, "mean": 0.0, "len": 0}))
-    overall_performance = refresh_stats(overall_performance)
+    c = _storage.my_counters
+    h = _storage.my_histograms
+    b = _bucket(t)
+    slot = _get_slot(function)
+    for s in (0, slot) if slot != None else (0,):
+        i = s * 4
+        c[i + _COUNT] += 1
+        c[i + _SUM] += t
+        if t < c[i + _MIN]:
+            c[i + _MIN] = t
+        if t > c[i + _MAX]:
+            c[i + _MAX] = t
+        h[s * _BUCKETS + b] += 1
+    if timing != None:
+        d = _storage.my_stages
+        durations = timing.durations
+        for s in (0, slot) if slot != None else (0,):
+            i = s * (len(STAGES) + 1)
+            for j in range(len(STAGES)):
+                d[i + j] += durations[j] * 1000
+            d[i + len(STAGES)] += 1
+
+
+class Timing:
+    """Durations (seconds) of the stages (`STAGES`) of serving a request, measured by laps: `lap(stage)` attributes the time since the previous lap (or `start`) to `stage`. Authentication is timed separately (`start_auth`/`stop_auth`, called by the decorators of `serverly.user`) and taken out of the handler's time by `stop`."""
+
+    __slots__ = ("durations", "_last", "_auth_start")
+
+    def __init__(self, start: float = None):
+        self.durations = [0.0] * len(STAGES)
+        self._last = time.perf_counter() if start == None else start
+        self._auth_start = None
+
+    def lap(self, stage: int):
+        now = time.perf_counter()
+        self.durations[stage] += now - self._last
+        self._last = now
+
+    def start_auth(self):
+        if self._auth_start == None:
+            self._auth_start = time.perf_counter()
+
+    def stop_auth(self):
+        if self._auth_start != None:
+            self.durations[AUTH] += time.perf_counter() - self._auth_start
+            self._auth_start = None
+
+    def stop(self):
+        """Take the authentication's time out of the handler's. Call once the handler's lap is recorded."""
+        self.durations[HANDLER] = max(
+            self.durations[HANDLER] - self.durations[AUTH], 0.0)
+
+    def header(self):
+        """Return the value of a `Server-Timing` header with the durations recorded so far (ms)."""
+        return ", ".join(f"{name};dur={d * 1000:.3f}" for name, d in zip(STAGES, self.durations) if name != "send")
+
+
+def _bucket(t: float):
+    """[internal] Return the index of the histogram bucket for `t` ms."""
+    if t < 0.001:
+        return 0
+    m, e = frexp(t * 1000)  # us = m * 2^e, 0.5 <= m < 1
+    # (e - 1) * _SUB_BUCKETS + int((m - 0.5) * 2 * _SUB_BUCKETS) + 1
+    i = e * _SUB_BUCKETS + int(m * 2 * _SUB_BUCKETS) - 2 * _SUB_BUCKETS + 1
+    return i if i < _BUCKETS else _BUCKETS - 1
+
+
+def new_route_cache_access(hit: bool):
+    """Count a lookup in the route cache of `serverly.Sitemap`.
+
+    :param hit: whether the route was found in the cache
+    :type hit: bool
+    """
+    _storage.my_route_cache[0 if hit else 1] += 1
+
+
+def request_started():
+    """Count a request as in flight, until `request_finished` is called."""
+    _storage.my_in_flight[0] += 1
+
+
+def request_finished():
+    """Count a request started with `request_started` as finished."""
+    _storage.my_in_flight[0] -= 1
+
+
+def _percentile_key(q: float):
+    return "p" + ("%g" % q).replace(".", "")
+
+
+def _percentiles(histograms: np.ndarray, mins: np.ndarray, maxs: np.ndarray):
+    """[internal] Return an array (slots x `percentiles`) of the percentiles (ms) estimated from the (aggregated) `histograms` of the slots: the middle of the bucket the percentile falls into, clipped to the actual min & max."""
+    cumulative = histograms.cumsum(1, dtype=np.int64)
+    counts = cumulative[:, -1]
+    result = np.zeros((len(histograms), len(percentiles)))
+    for j, q in enumerate(percentiles):
+        rank = np.maximum(np.ceil(counts * q / 100), 1)
+        buckets = np.minimum(
+            (cumulative < rank[:, None]).sum(1), _BUCKETS - 1)
+        result[:, j] = (_LOWER[buckets] + _UPPER[buckets]) / 2
+    return np.clip(result, mins[:, None], maxs[:, None])
+
+
+def _summarize(slots: slice):
+    """[internal] Return the statistics (dicts) of `slots`, aggregated over all processes."""
+    counters = _storage.counters[:, slots]
+    counts = counters[:, :, _COUNT].sum(0)
+    totals = counters[:, :, _SUM].sum(0)
+    mins = counters[:, :, _MIN].min(0)
+    maxs = counters[:, :, _MAX].max(0)
+    quantiles = _percentiles(
+        _storage.histograms[:, slots].sum(0, dtype=np.int64), mins, maxs)
+    keys = [_percentile_key(q) for q in percentiles]
+    summaries = []
+    for i in range(len(counts)):
+        if counts[i] == 0:
+            d = dict(_EMPTY)
+            d.update((k, 0.0) for k in keys)
+        else:
+            d = {"min": float(mins[i]), "max": float(maxs[i]), "mean": float(
+                totals[i] / counts[i]), "len": int(counts[i])}
+            d.update(zip(keys, quantiles[i].tolist()))
+        summaries.append(d)
+    return summaries
+
+
+def get_overall_performance():
+    """Return the overall statistics of the server (all processes) as dict with the keys min, max, mean (ms), len (number of requests) and the `percentiles` (ms, e.g. p50, p99, p999)."""
+    return _summarize(slice(0, 1))[0]
+
+
+def get_endpoint_performance():
+    """Return the statistics (see `get_overall_performance`) of all functions (all processes) which served requests by their name."""
+    n = int(_storage.header[_N_NAMES])
+    summaries = _summarize(slice(0, n + 1))
+    return {_name(i): summaries[i] for i in range(1, n + 1) if summaries[i]["len"] > 0}
+
+
+def _summarize_stages(slots: slice):
+    """[internal] Return the mean time (ms) of each stage of `slots` (dicts, None if not recorded), aggregated over all processes."""
+    stages = _storage.stages[:, slots].sum(0)
+    summaries = []
+    for row in stages:
+        n = row[len(STAGES)]
+        summaries.append(None if n == 0 else dict(
+            zip(STAGES, (row[:len(STAGES)] / n).tolist()), len=int(n)))
+    return summaries
+
+
+def get_overall_stages():
+    """Return the mean time (ms) spent in each stage (`STAGES`) of serving requests (all processes) and the number of requests they were recorded for (len) as dict, or None if `stages` wasn't enabled."""
+    return _summarize_stages(slice(0, 1))[0]
+
+
+def get_endpoint_stages():
+    """Return the stages' times (see `get_overall_stages`) of all functions which served requests with `stages` enabled by their name."""
+    n = int(_storage.header[_N_NAMES])
+    summaries = _summarize_stages(slice(0, n + 1))
+    return {_name(i): summaries[i] for i in range(1, n + 1) if summaries[i] != None}
+
+
+def get_route_cache():
+    """Return the number of route cache hits & misses (all processes) as dict."""
+    hits, misses = _storage.route_cache.sum(0)
+    return {"hits": int(hits), "misses": int(misses)}
+
+
+def get_in_flight():
+    """Return the number of requests currently being served (all processes)."""
+    return int(_storage.in_flight.sum())
+
+
+def __getattr__(name: str):
+    if name == "overall_performance":
+        return get_overall_performance()
+    if name == "endpoint_performance":
+        return get_endpoint_performance()
+    if name == "route_cache":
+        return get_route_cache()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 
 def print_stats():
     """Print statistics saved in this module and save them to disk."""
+    overall_performance = get_overall_performance()
     if overall_performance["len"] > 0:
         print("\n\nCalculation times (ms):\n")
         print(tabulate([overall_performance.values()],
                        tuple(overall_performance.keys())))
     else:
         print("No statistics.")
-    with open(filename, "w+") as f:
-        json.dump({"overall_performance": overall_performance,
-                   "endpoint_performance": endpoint_performance}, f)
+    with open(filename, "wb+") as f:
+        f.write(jsoncodec.dumpb({"overall_performance": overall_performance,
+                                 "endpoint_performance": get_endpoint_performance()}))
 
 
 def reset():
-    """Reset all stats."""
-    global overall_performance, endpoint_performance
-
-    overall_performance = {
-        "min": 100000000000.0,
-        "max": 0.0,
-        "mean": 0.0,
-        "len": 0
-    }
-
-    endpoint_performance = {}
+    """Reset all stats (of all processes)."""
+    _storage.clear()
@@ -0,0 +1,306 @@
+"""
+serverly.tracing
+---
+Lightweight tracing of requests, compatible with OpenTelemetry: every (sampled) request gets a trace with a span for serving it and child spans for routing, the authentication decorators of `serverly.user`, database queries, sessions & scheduling emails. Functions can add their own:
+
+```python
+@serverly.serves("GET", "/report")
+def report(request):
+    with serverly.tracing.span("render report", rows=42):
+        ...
+```
+
+or decorate them with `traced`.
+
+The trace context is propagated with the W3C `traceparent` header (https://www.w3.org/TR/trace-context/): requests carrying one continue the client's trace (and follow its sampling decision), responses carry the server's span in a `traceresponse` header and `traceparent()` returns the header to send with requests to other services.
+
+Finished spans are queued and exported in batches by a background thread (of each process) every `export_interval` seconds, as OTLP/JSON (one ExportTraceServiceRequest per line) appended to `filename` (like the OpenTelemetry Collector's file exporter writes them) and/or posted to an OTLP/HTTP collector at `endpoint`. Spans which don't fit into the queue are dropped.
+
+Configuration
+--
+Attribute | Description
+- | -
+enabled = False | Trace requests at all.
+sample_rate = 1.0 | Fraction of the requests without a `traceparent` header which are traced.
+service_name = "serverly" | Name of the service in the exported spans.
+filename = "traces.jsonl" | File the spans are appended to. None to not write them to a file.
+endpoint = None | URL of an OTLP/HTTP collector the spans are posted to, e.g. 'http://localhost:4318/v1/traces'.
+export_interval = 5 | Seconds between exports.
+max_queue_size = 2048 | Maximum number of spans waiting for export.
+"""
+import collections
+import contextvars
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+from functools import wraps
+
+import serverly
+from serverly import jsoncodec
+
+enabled = False
+sample_rate = 1.0
+service_name = "serverly"
+filename = "traces.jsonl"
+endpoint = None
+export_interval = 5
+max_queue_size = 2048
+
+INTERNAL, SERVER, CLIENT = 1, 2, 3  # OTLP span kinds
+_UNSET, _OK, _ERROR = 0, 1, 2  # OTLP status codes
+
+_TRACEPARENT = re.compile(
+    r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_current = contextvars.ContextVar("serverly_span", default=None)
+_queue = collections.deque()
+_lock = threading.Lock()
+_exporter = None  # (pid, event waking it up) of this process' exporting thread
+
+
+def _new_id(bits: int):
+    return "%0*x" % (bits // 4, random.getrandbits(bits) or 1)
+
+
+class Span:
+    """A timed operation of a trace. Use `span` or `start_span` to create one.
+
+    Attributes:
+
+    - name: str
+    - trace_id: str: 32 hex digits
+    - span_id: str: 16 hex digits
+    - parent_id: str/None: span_id of the parent span
+    - kind: int: INTERNAL, SERVER or CLIENT
+    - attributes: dict
+    - error: str/None: Error message, if the operation failed
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind",
+                 "attributes", "error", "start", "end_time", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: int = INTERNAL, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes if attributes != None else {}
+        self.error = None
+        self.start = time.time_ns()
+        self.end_time = None
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        """Mark the operation as failed because of `error` (exception or message)."""
+        self.error = str(error) or error.__class__.__name__
+
+    def activate(self):
+        """Make this span the current one (the parent of spans started afterwards in this context) until it ends."""
+        self._token = _current.set(self)
+        return self
+
+    def end(self):
+        """End the span (again: no-op) and queue it for export. If it's the current span, its parent becomes the current one again."""
+        if self.end_time != None:
+            return
+        self.end_time = time.time_ns()
+        if self._token != None:
+            try:
+                _current.reset(self._token)
+            except ValueError:  # activated in another context
+                pass
+            self._token = None
+        _enqueue(self)
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc != None:
+            self.set_error(exc)
+        self.end()
+
+    @property
+    def traceparent(self):
+        """The `traceparent` header referring to this span."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+class _NoSpan:
+    """[internal] Stands in for spans of requests which aren't traced."""
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def current_span():
+    """Return the current span (of the request being served) or None if it isn't traced."""
+    return _current.get()
+
+
+def start_span(name: str, kind: int = INTERNAL, attributes: dict = None, activate: bool = True):
+    """Start a span `name` as child of the current span, which becomes the current one (if `activate`) until it `end`s. Return None if the current request isn't traced."""
+    parent = _current.get()
+    if parent == None:
+        return None
+    s = Span(name, parent.trace_id, parent.span_id, kind, attributes)
+    return s.activate() if activate else s
+
+
+def span(name: str, kind: int = INTERNAL, **attributes):
+    """Return a span `name` (with `attributes`) to be used in a `with` statement, timing its block as child of the current span. Does nothing if the current request isn't traced."""
+    parent = _current.get()
+    if parent == None:
+        return _NO_SPAN
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+
+def traced(name: str = None):
+    """Decorator tracing calls of the function as span `name` (default: the function's qualified name), if the current request is traced."""
+    def decorator(func):
+        span_name = name if name != None else func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() == None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traceparent():
+    """Return the `traceparent` header to propagate the current trace to other services, or None if the current request isn't traced."""
+    s = _current.get()
+    return s.traceparent if s != None else None
+
+
+def start_request(scope: dict):
+    """[internal] Start (and activate) the span serving the request of ASGI `scope` if tracing is `enabled` and it's sampled. Continues the trace of its `traceparent` header (if valid). Return the span or None."""
+    if not enabled:
+        return None
+    header = None
+    for k, v in scope["headers"]:
+        if k == b"traceparent":
+            header = str(v, "latin-1")
+            break
+    m = _TRACEPARENT.match(header.strip().lower()) if header != None else None
+    if m != None and m.group(1) != "ff" and m.group(2) != "0" * 32 and m.group(3) != "0" * 16:
+        if not int(m.group(4), 16) & 1:  # not sampled by the client
+            return None
+        trace_id, parent_id = m.group(2), m.group(3)
+    elif random.random() < sample_rate:
+        trace_id, parent_id = _new_id(128), None
+    else:
+        return None
+    attributes = {"http.method": scope["method"], "http.target": scope["path"]}
+    if scope.get("client", None):
+        attributes["net.peer.ip"] = scope["client"][0]
+    return Span(scope["method"], trace_id, parent_id, SERVER, attributes).activate()
+
+
+def _enqueue(s: Span):
+    global _exporter
+    with _lock:
+        if len(_queue) >= max_queue_size:
+            return
+        _queue.append(s)
+        n = len(_queue)
+    exporter = _exporter
+    if exporter == None or exporter[0] != os.getpid():  # threads don't survive forking into the workers
+        with _lock:
+            if _exporter == None or _exporter[0] != os.getpid():
+                wakeup = threading.Event()
+                _exporter = (os.getpid(), wakeup)
+                threading.Thread(target=_export_loop, args=(wakeup,),
+                                 name="serverly-tracing", daemon=True).start()
+            exporter = _exporter
+    if n >= max_queue_size // 2:
+        exporter[1].set()
+
+
+def _attribute(key: str, value):
+    if type(value) == bool:
+        v = {"boolValue": value}
+    elif type(value) == int:
+        v = {"intValue": str(value)}
+    elif type(value) == float:
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+def _to_otlp(s: Span):
+    d = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": s.kind,
+        "startTimeUnixNano": str(s.start),
+        "endTimeUnixNano": str(s.end_time),
+        "attributes": [_attribute(k, v) for k, v in s.attributes.items()],
+        "status": {"code": _ERROR, "message": s.error} if s.error != None else {"code": _UNSET}
+    }
+    if s.parent_id != None:
+        d["parentSpanId"] = s.parent_id
+    return d
+
+
+def _export_request(spans: list):
+    """[internal] Return the OTLP/JSON ExportTraceServiceRequest for `spans`."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", service_name), _attribute("process.pid", os.getpid())]},
+        "scopeSpans": [{"scope": {"name": "serverly", "version": serverly.version}, "spans": [_to_otlp(s) for s in spans]}]
+    }]}
+
+
+def flush():
+    """Export all queued spans now (in this thread)."""
+    with _lock:
+        spans = list(_queue)
+        _queue.clear()
+    if len(spans) == 0:
+        return
+    data = jsoncodec.dumpb(_export_request(spans))
+    if filename != None:
+        try:
+            with open(filename, "ab") as f:
+                f.write(data + b"\n")  # a single write, so lines of several workers don't interleave
+        except Exception as e:
+            serverly.logger.handle_exception(e)
+    if endpoint != None:
+        try:
+            urllib.request.urlopen(urllib.request.Request(
+                endpoint, data, {"content-type": "application/json"}), timeout=10).close()
+        except Exception as e:
+            serverly.logger.handle_exception(e)
+
+
+def _export_loop(wakeup: threading.Event):
+    while True:
+        wakeup.wait(export_interval)
+        wakeup.clear()
+        flush()
@@ -11,11 +11,13 @@ session_renew_threshold = 60 | Number of seconds after which a new session will
 import datetime
 import hashlib
 import string
+import threading
 from functools import wraps
 from hmac import compare_digest
 from typing import Union
 
 import serverly
+import serverly.tracing
 import sqlalchemy
 from serverly.err import (ConfigurationError, NotAuthorizedError,
                           UserAlreadyExistsError, UserNotFoundError)
@@ -34,6 +36,8 @@ _Session: sqlalchemy.orm.Session = None
 algorithm = None
 salting = 1
 require_verified = False
+_pool_statistics = {"checked_out": 0, "checkouts": 0, "connects": 0}
+_pool_statistics_lock = threading.Lock()
 
 
 Base = declarative_base()
@@ -168,6 +172,8 @@ def setup(hash_algorithm=hashlib.sha3_512, use_salting=True, filename="serverly_
     _engine = sqlalchemy.create_engine("sqlite:///" + filename, echo=verbose)
     Base.metadata.create_all(bind=_engine)
     _Session = sqlalchemy.orm.sessionmaker(bind=_engine)
+    _watch_pool(_engine)
+    _trace_queries(_engine)
     require_verified = require_email_verification
 
     for attr in _required_user_attrs:
@@ -181,6 +187,99 @@ def setup(hash_algorithm=hashlib.sha3_512, use_salting=True, filename="serverly_
         f"serverly.user is now set up with the following configuration:\nalgorithm: {hash_algorithm.__name__}\nsalting: {bool(salting)}\nrequire email verification: {require_email_verification}\nrole hierarchy: {_role_hierarchy}", debug)
 
 
+def _count_pool_event(key: str, n: int):
+    def listener(*args):
+        with _pool_statistics_lock:
+            _pool_statistics[key] += n
+    return listener
+
+
+def _watch_pool(engine):
+    """[internal] Count the connections of `engine`'s pool (see `get_pool_statistics`)."""
+    sqlalchemy.event.listen(engine, "connect", _count_pool_event("connects", 1))
+    sqlalchemy.event.listen(engine, "checkout", _count_pool_event("checkouts", 1))
+    sqlalchemy.event.listen(engine, "checkout", _count_pool_event("checked_out", 1))
+    sqlalchemy.event.listen(engine, "checkin", _count_pool_event("checked_out", -1))
+
+
+def _trace_queries(engine):
+    """[internal] Trace the queries executed by `engine` (see `serverly.tracing`)."""
+    def before(conn, cursor, statement, parameters, context, executemany):
+        span = serverly.tracing.start_span("db " + statement.split(None, 1)[0].upper(), serverly.tracing.CLIENT, {
+            "db.system": engine.dialect.name, "db.statement": statement}, False)
+        conn.info.setdefault("serverly_spans", []).append(span)
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("serverly_spans", None)
+        if spans:
+            span = spans.pop()
+            if span != None:
+                span.end()
+
+    def error(context):
+        spans = context.connection.info.get("serverly_spans", None)
+        if spans:
+            span = spans.pop()
+            if span != None:
+                span.set_error(context.original_exception)
+                span.end()
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", before)
+    sqlalchemy.event.listen(engine, "after_cursor_execute", after)
+    sqlalchemy.event.listen(engine, "handle_error", error)
+
+
+def get_pool_statistics():
+    """Return statistics of the database connection pool (of this process) as dict: checked_out (connections in use), checkouts & connects (connections opened) since setup and, if the pool has a fixed size (not for SQLite files), size & overflow."""
+    with _pool_statistics_lock:
+        stats = dict(_pool_statistics)
+    pool = getattr(_engine, "pool", None)
+    if hasattr(pool, "size") and hasattr(pool, "overflow"):
+        stats["size"] = pool.size()
+        stats["overflow"] = pool.overflow()
+    return stats
+
+
+def _timed_auth(name: str):
+    """[internal] Decorator for the wrappers of authentication decorators: time them as the request's 'auth' stage (see `serverly.statistics.stages`) and trace them as span `name` (see `serverly.tracing`) until they call the function they protect (wrapped with `_auth_done`)."""
+    def decorator(wrapper):
+        @wraps(wrapper)
+        def timed(request, *args, **kwargs):
+            timing = getattr(request, "timing", None)
+            span = serverly.tracing.start_span(name)
+            if timing == None and span == None:
+                return wrapper(request, *args, **kwargs)
+            if timing != None:
+                timing.start_auth()
+            request._auth_span = span
+            try:
+                return wrapper(request, *args, **kwargs)
+            finally:  # unless already done by _auth_done
+                _end_auth(request, False)
+        return timed
+    return decorator
+
+
+def _end_auth(request, authorized: bool):
+    timing = getattr(request, "timing", None)
+    if timing != None:
+        timing.stop_auth()
+    span = getattr(request, "_auth_span", None)
+    if span != None:
+        request._auth_span = None
+        span.set_attribute("authorized", authorized)
+        span.end()
+
+
+def _auth_done(func):
+    """[internal] Wrap `func`, the function an authentication decorator protects, to end the request's 'auth' stage (& span) when it's called."""
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        _end_auth(request, True)
+        return func(request, *args, **kwargs)
+    return wrapper
+
+
 def _setup_required(func):
     """internal decorator to apply when db setup is required before running the function"""
     @wraps(func)
@@ -385,7 +484,10 @@ def requires_role(role: Union[str, list]):
     role = [r.lower() for r in role] if type(role) == list else role.lower()
 
     def my_wrap(func):
+        func = _auth_done(func)
+
         @wraps(func)
+        @_timed_auth("requires_role")
         def wrapper(request: Request, *args, **kwargs):
             user_roles = _role_hierarchy.get(request.user.role, set())
             if type(role) == list:
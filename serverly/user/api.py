@@ -3,20 +3,24 @@
 See the Postman documentation online: https://documenter.getpostman.com/view/10720102/Szf549XF?version=latest
 """
 import datetime
-import json
 import mimetypes
-import os
 import string
+import threading
 from functools import wraps
 from urllib import parse as parse
 
 import serverly
+import serverly.compression
+import serverly.metrics
+import serverly.profiler
+import serverly.slowlog
+import serverly.sse
 import serverly.statistics
 import serverly.user
 import serverly.user.auth
 import serverly.user.mail
 import serverly.utils
-from serverly import error_response
+from serverly import error_response, jsoncodec
 from serverly.objects import Redirect, Request, Response
 from serverly.user import requires_role
 from serverly.user.auth import basic_auth, bearer_auth
@@ -27,8 +31,27 @@ use_sessions = False
 persistant_user_attributes = []
 bearer_allow_api_to_set_expired = False
 bearer_expires_after_minutes = 30
+statistics_events_interval = 2
 
 _reversed_api = {}
+_console_static = None
+_console_static_lock = threading.RLock()
+_CONSOLE_STATIC_FILES = {
+    "/console/static/css/main.css": "console_css_main",
+    "/console/static/js/main.js": "console_js_main",
+    "/console/static/js/consoleIndex.js": "console_index_js_main",
+    "/console/static/js/consoleIndexLoaded.js": "console_index_js_loaded",
+    "/console/static/css/consoleIndex.css": "console_index_css",
+    "/console/static/js/consoleUsers.js": "console_users_js",
+    "/console/static/js/consoleUsersLoaded.js": "console_users_js_loaded",
+    "/console/static/css/consoleUsers.css": "console_users_css",
+    "/console/static/js/consoleEndpoints.js": "console_endpoints_js",
+    "/console/static/js/consoleEndpointsLoaded.js": "console_endpoints_js_loaded",
+    "/console/static/css/consoleEndpoints.css": "console_endpoints_css",
+    "/console/static/js/consoleStatistics.js": "console_statistics_js",
+    "/console/static/js/consoleStatisticsLoaded.js": "console_statistics_js_loaded",
+    "/console/static/css/consoleStatistics.css": "console_statistics_css"
+}
 _RES_406 = Response(
     406, body="Unable to parse required parameters. Expected username, password.")
 
@@ -45,6 +68,7 @@ def use(function: str, method: str, path: str):
     - sessions.delete: Basic (Delete all sessions of user)
     - bearer.authenticate: Bearer (Authenticate user with Bearer token)
     - bearer.new: Basic (Send a new Bearer token to user authenticated via Basic)
+    - GET metrics: None (metrics in the OpenMetrics format for Prometheus & co., see `serverly.metrics`. Don't expose it publicly.)
     - GET console.index: Basic (Entrypoint for serverly's admin console)
     - GET console.users: Basic (users overview)
     - GET console.users.change_or_register: Basic (Allows admins to change or register users on one page)
@@ -70,13 +94,16 @@ def use(function: str, method: str, path: str):
     - DEL console.api.clear_expired_tokens: Basic (Call serverly.user.auth.clear_expired_tokens and return how many were deleted)
     - GET console.api.endpoints.get: Basic (get all endpoint details)
     - GET console.api.statistics.get: Basic (get endpoint statistics)
+    - GET console.api.statistics.events: Basic (Server-Sent Events pushing the endpoint statistics every `statistics_events_interval` seconds)
     - DEL console.api.statistics.reset: Basic (reset/delete all statistics)
+    - GET console.api.slow_requests: Basic (the latest slow requests of the worker serving the request, see `serverly.slowlog`)
+    - GET console.api.profile: Basic (profile the worker serving the request for `seconds` (default 10) and return the collapsed stacks for flamegraphs, see `serverly.profiler`). Ex. /console/api/profile?seconds=30&idle=1
     - console.all (register all available console endpoints)
 
     `function` accepts on of the above. The API-endpoint will be registered for `method`on `path`.
     All console functions require the 'admin' role.
     """
-    global verify_mail
+    global verify_mail, _console_static
     supported_funcs = {
         "authenticate": _api_authenticate,
         "change": _api_change,
@@ -89,6 +116,7 @@ def use(function: str, method: str, path: str):
         "bearer.authenticate": _api_bearer_authenticate,
         "bearer.new": _api_bearer_new,
         "bearer.clear": _api_bearer_clear,
+        "metrics": _api_metrics,
         "console.index": _console_index,
         "console.users": _console_users,
         "console.users.change_or_register": _console_change_or_create_user,
@@ -114,8 +142,11 @@ def use(function: str, method: str, path: str):
         "console.api.clear_expired_tokens": _console_api_clear_expired_tokens,
         "console.api.endpoints.get": _console_api_endpoints_get,
         "console.api.statistics.get": _console_api_statistics_get,
+        "console.api.statistics.events": _console_api_statistics_events,
         "console.api.statistics.reset": _console_api_statistics_reset,
-        "console.all": {_console_index: ('GET', '/console/?'), _console_users: ('GET', '/console/users/?'), _console_change_or_create_user: ('GET', '/console/changeorcreateuser'), _console_endpoints: ('GET', '/console/endpoints/?'), _console_statistics: ('GET', '/console/statistics'), _console_api_get_root_token: ('GET', '/console/api/root/token'), _console_api_create_root_user: ('POST', '/console/api/root/create'), _console_api_endpoint_new: ('POST', '/console/api/endpoint.new'), _console_api_endpoint_delete: ('DELETE', '/console/api/endpoint.del'), _console_summary_json: ('GET', '/console/api/summary.json'), _console_summary_users: ('GET', '/console/api/summary.users'), _console_summary_endpoints: ('GET', '/console/api/summary.endpoints'), _console_summary_statistics: ('GET', '/console/api/summary.statistics'), _console_api_endpoints_get: ('GET', '/console/api/endpoints'), _console_api_get_user: ('GET', '/console/api/user/get'), _console_api_change_or_create_user: ('PUT', '/console/api/changeorcreateuser'), _console_api_users_get: ('GET', '/console/api/users.get'), _console_api_verify_users: ('POST', '/console/api/users/verify'), _console_api_deverify_users: ('POST', '/console/api/users/deverify'), _console_api_verimail: ('POST', '/console/api/users/verimail'), _console_api_delete_users: ('DELETE', '/console/api/users/delete'), _console_api_reset_password: ('DELETE', '/console/api/users/resetpassword'), _console_api_renew_login: ('POST', '/console/api/renewlogin'), _console_api_clear_expired_tokens: ('DELETE', '/console/api/cleartokens'), _console_api_statistics_get: ('GET', '/console/api/statistics'), _console_api_statistics_reset: ('DELETE', '/console/api/statistics')}
+        "console.api.slow_requests": _console_api_slow_requests,
+        "console.api.profile": _console_api_profile,
+        "console.all": {_console_index: ('GET', '/console/?'), _console_users: ('GET', '/console/users/?'), _console_change_or_create_user: ('GET', '/console/changeorcreateuser'), _console_endpoints: ('GET', '/console/endpoints/?'), _console_statistics: ('GET', '/console/statistics'), _console_api_get_root_token: ('GET', '/console/api/root/token'), _console_api_create_root_user: ('POST', '/console/api/root/create'), _console_api_endpoint_new: ('POST', '/console/api/endpoint.new'), _console_api_endpoint_delete: ('DELETE', '/console/api/endpoint.del'), _console_summary_json: ('GET', '/console/api/summary.json'), _console_summary_users: ('GET', '/console/api/summary.users'), _console_summary_endpoints: ('GET', '/console/api/summary.endpoints'), _console_summary_statistics: ('GET', '/console/api/summary.statistics'), _console_api_endpoints_get: ('GET', '/console/api/endpoints'), _console_api_get_user: ('GET', '/console/api/user/get'), _console_api_change_or_create_user: ('PUT', '/console/api/changeorcreateuser'), _console_api_users_get: ('GET', '/console/api/users.get'), _console_api_verify_users: ('POST', '/console/api/users/verify'), _console_api_deverify_users: ('POST', '/console/api/users/deverify'), _console_api_verimail: ('POST', '/console/api/users/verimail'), _console_api_delete_users: ('DELETE', '/console/api/users/delete'), _console_api_reset_password: ('DELETE', '/console/api/users/resetpassword'), _console_api_renew_login: ('POST', '/console/api/renewlogin'), _console_api_clear_expired_tokens: ('DELETE', '/console/api/cleartokens'), _console_api_statistics_get: ('GET', '/console/api/statistics'), _console_api_statistics_events: ('GET', '/console/api/statistics/events'), _console_api_statistics_reset: ('DELETE', '/console/api/statistics'), _console_api_slow_requests: ('GET', '/console/api/slowrequests'), _console_api_profile: ('GET', '/console/api/profile')}
     }
     if not function.lower() in supported_funcs.keys():
         raise ValueError(
@@ -128,6 +159,7 @@ def use(function: str, method: str, path: str):
     else:
         serverly._sitemap.register_site(method, func, path)
         _reversed_api[func.__name__] = path
+    _console_static = None  # console files contain the endpoints' paths
 
     if function.startswith("console.") and not function.startswith("console.api"):
         _serve_console_static_files()
@@ -166,6 +198,8 @@ def _check_to_use_sessions(func):
 
 
 def _get_content(base: str, **extra_subs):
+    if "$_console_static_version" in base:
+        extra_subs["_console_static_version"] = _get_console_static()[1]
     return string.Template(base).safe_substitute(**_reversed_api, **extra_subs)
 
 
@@ -276,31 +310,60 @@ def _api_bearer_clear(request: Request):
     return Response(body=f"Deleted {n} expired tokens.")
 
 
+def _api_metrics(request: Request):
+    return Response(headers={"content-type": serverly.metrics.CONTENT_TYPE, "cache-control": "no-store"}, body=serverly.metrics.render())
+
+
+class _ConsoleAsset:
+    """[internal] A static file of the admin console kept in memory, with ETag & compressed variants computed once."""
+
+    def __init__(self, path: str, content: str):
+        self.body = bytes(content, "utf-8")
+        self.etag = serverly.utils.content_etag(self.body)
+        self.content_type = mimetypes.guess_type(path)[0] or "text/plain"
+        if serverly.compression.is_compressible({"content-type": self.content_type}, len(self.body)):
+            serverly.compression.precompress(self.body, self.etag)
+
+
+def _get_console_static():
+    """[internal] Return the admin console's static files ({path: _ConsoleAsset}) and their version (hash). Built once for the superpath the server runs with (by a single thread; compressing them takes a while, so don't call this on the event loop)."""
+    global _console_static
+    superpath = serverly._sitemap.superpath
+    static = _console_static
+    if static == None or static[0] != superpath:
+        with _console_static_lock:
+            static = _console_static
+            if static == None or static[0] != superpath:
+                assets = {}
+                for path, name in _CONSOLE_STATIC_FILES.items():
+                    content = _get_content(getattr(serverly.default_sites, name)).replace(
+                        "/SUPERPATH/", superpath).replace("SUPERPATH/", superpath)
+                    assets[path] = _ConsoleAsset(path, content)
+                version = serverly.utils.content_etag(
+                    bytes("".join(a.etag for a in assets.values()), "utf-8"))[1:13]
+                static = _console_static = (superpath, assets, version)
+    return static[1], static[2]
+
+
+def _console_static_file(request: Request):
+    assets, version = _get_console_static()
+    asset = assets.get(request.path.path, None)
+    if asset == None:
+        return error_response(404)
+    # pages reference the files with their version, so these can be cached forever
+    if parse.parse_qs(request.path.query).get("v", [None])[0] == version:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+    return Response(headers={"content-type": asset.content_type, "etag": asset.etag, "cache-control": cache_control}, body=asset.body)
+
+
 def _serve_console_static_files():
-    required_files = {
-        "^/console/static/css/main.css$": serverly.default_sites.console_css_main,
-        "^/console/static/js/main.js$": serverly.default_sites.console_js_main,
-        "^/console/static/js/consoleIndex.js$": serverly.default_sites.console_index_js_main,
-        "^/console/static/js/consoleIndexLoaded.js$": serverly.default_sites.console_index_js_loaded,
-        "^/console/static/css/consoleIndex.css$": serverly.default_sites.console_index_css,
-        "^/console/static/js/consoleUsers.js$": serverly.default_sites.console_users_js,
-        "^/console/static/js/consoleUsersLoaded.js$": serverly.default_sites.console_users_js_loaded,
-        "^/console/static/css/consoleUsers.css$": serverly.default_sites.console_users_css,
-        "^/console/static/js/consoleEndpoints.js$": serverly.default_sites.console_endpoints_js,
-        "^/console/static/js/consoleEndpointsLoaded.js$": serverly.default_sites.console_endpoints_js_loaded,
-        "^/console/static/css/consoleEndpoints.css$": serverly.default_sites.console_endpoints_css,
-        "^/console/static/js/consoleStatistics.js$": serverly.default_sites.console_statistics_js,
-        "^/console/static/js/consoleStatisticsLoaded.js$": serverly.default_sites.console_statistics_js_loaded,
-        "^/console/static/css/consoleStatistics.css$": serverly.default_sites.console_statistics_css
-    }
-    for path in required_files.keys():
-        os.makedirs("/".join(path[2:-1].split("/")[:-1]), exist_ok=True)
-    for path, content in required_files.items():
-        if serverly._sitemap.methods["get"].get(path, "no") == "no":
-            fpath = path[2:-1]
-            with open(fpath, "w+") as f:
-                f.write(_get_content(content))
-            serverly.static_page(fpath, path)
+    """[internal] Serve the admin console's CSS & JS files from memory (never written to disk)."""
+    for path in _CONSOLE_STATIC_FILES.keys():
+        pattern = "^" + path + "$"
+        if serverly._sitemap.methods["get"].get(pattern, "no") == "no":
+            serverly._sitemap.register_site("GET", _console_static_file, pattern)
 
 
 def _console_index(request: Request):
@@ -353,7 +416,7 @@ def _console_change_or_create_user(request: Request):
             ids.pop()
         ids = [int(i) for i in ids]
         content = _get_content(
-            serverly.default_sites.console_user_change_or_create, user_ids=json.dumps(ids))
+            serverly.default_sites.console_user_change_or_create, user_ids=jsoncodec.dumps(ids))
         return Response(body=content)
     except IndexError:
         path = "SUPERPATH" + _reversed_api["_console_users"]
@@ -398,7 +461,7 @@ def _console_summary_json(request: Request):
         for method, endpoints in serverly._sitemap.methods.items():
             d["endpoints"][method] = len(endpoints)
 
-        d["statistics"] = serverly.statistics.overall_performance.copy()
+        d["statistics"] = serverly.statistics.get_overall_performance()
         l = d["statistics"]["len"]
         del d["statistics"]["len"]
         d["statistics"]["length"] = l
@@ -467,7 +530,7 @@ def _console_summary_endpoints(request: Request):
 def _console_summary_statistics(request: Request):
     def r(f):
         return round(f, 2)
-    d = serverly.statistics.overall_performance
+    d = serverly.statistics.get_overall_performance()
     return Response(body=f"The average calculation time is {r(d['mean'])} ms, with a min of {r(d['min'])} and a max of {r(d['max'])}.")
 
 
@@ -776,15 +839,31 @@ def _console_api_statistics_get(request: Request):
         pass
     if bool(a):
         l = []
-        for k, v in serverly.statistics.endpoint_performance.items():
+        for k, v in serverly.statistics.get_endpoint_performance().items():
             l.append({"function": k, **v})
         l.append({"function": "overall", **
-                  serverly.statistics.overall_performance})
+                  serverly.statistics.get_overall_performance()})
         return Response(body=l)
     else:
-        d = serverly.statistics.endpoint_performance
-        d["overall"] = serverly.statistics.overall_performance
-        return Response(body=d)
+        return Response(body=_get_statistics())
+
+
+def _get_statistics():
+    d = serverly.statistics.get_endpoint_performance()
+    d["overall"] = serverly.statistics.get_overall_performance()
+    return d
+
+
+_statistics_channel = serverly.sse.Channel(_get_statistics)
+
+
+@basic_auth
+@_check_to_use_sessions
+@requires_role("admin")
+def _console_api_statistics_events(request: Request):
+    # computed once per interval for all subscribed consoles
+    _statistics_channel.interval = statistics_events_interval
+    return serverly.sse.EventStream(_statistics_channel.subscribe())
 
 
 @basic_auth
@@ -795,6 +874,32 @@ def _console_api_statistics_reset(request: Request):
     return Response(body="Reset statistics.")
 
 
+@basic_auth
+@_check_to_use_sessions
+@requires_role("admin")
+def _console_api_slow_requests(request: Request):
+    return Response(body=serverly.slowlog.get_entries())
+
+
+@basic_auth
+@_check_to_use_sessions
+@requires_role("admin")
+def _console_api_profile(request: Request):
+    q = parse.parse_qs(request.path.query)
+    try:
+        seconds = float(q.get("seconds", [10])[0])
+        if not 0 < seconds <= serverly.profiler.max_seconds:
+            raise ValueError
+    except ValueError:
+        return Response(406, body=f"Expected seconds between 0 and {serverly.profiler.max_seconds}.")
+    idle = q.get("idle", ["0"])[0].lower() in ("1", "true")
+    try:
+        stacks = serverly.profiler.profile(seconds, idle)
+    except RuntimeError as e:
+        return Response(409, body=str(e))
+    return Response(headers={"content-type": "text/plain; charset=utf-8", "cache-control": "no-store"}, body=stacks)
+
+
 def _console_api_get_root_token(request: Request):
     if serverly.user.has_role("admin"):
         body = {"code": "401", "message": "There is an admin user."}
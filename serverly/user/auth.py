@@ -31,7 +31,10 @@ UNAUTHORIZED_TMPLT = "Unauthorized."
 
 def basic_auth(func):
     """Use this as a decorator to specify that serverly should automatically look for the (via 'Basic') authenticated user inside of the request object. You can then access the user with request.user. If the user is not authenticated, not found, or another exception occurs, your function WILL NOT BE CALLED."""
+    func = serverly.user._auth_done(func)
+
     @wraps(func)
+    @serverly.user._timed_auth("basic_auth")
     def wrapper(request: Request, *args, **kwargs):
         try:
             if request.auth_type.lower() == "basic":
@@ -72,7 +75,10 @@ def bearer_auth(scope: Union[str, list], expired=True):
     `expired`: bool specifies whether to handle expired tokens appropriately (-> not authorized).
     """
     def my_wrap(func):
+        func = serverly.user._auth_done(func)
+
         @wraps(func)
+        @serverly.user._timed_auth("bearer_auth")
         def wrapper(request, *args, **kwargs):
             try:
                 if request.auth_type == None:
@@ -98,8 +104,11 @@ def bearer_auth(scope: Union[str, list], expired=True):
 def session_auth(scope: Union[str, list]):
     """Use this decorator to authenticate the user by the latest session. Uses `bearer_auth`."""
     def my_wrap(func):
+        func = serverly.user._auth_done(func)
+
         @wraps(func)
         @bearer_auth(scope)
+        @serverly.user._timed_auth("session_auth")
         def wrapper(request: Request, *args, **kwargs):
             unauth_res = string.Template(
                 UNAUTHORIZED_TMPLT).safe_substitute(**request.user.to_dict())
@@ -7,6 +7,7 @@ import time
 from functools import wraps
 
 import serverly
+import serverly.tracing
 import serverly.user
 import yagmail
 from serverly.user import _requires_user_attr
@@ -152,6 +153,7 @@ class MailManager:
             serverly.logger.handle_exception(e)
             raise e
 
+    @serverly.tracing.traced("mail.schedule")
     def schedule(self, email={}, immediately=True):
         """schedule a new email: dict. 'email' or 'username' as well as 'subject' are required. Use 'schedule': Union[isoformat, datetime.datetime] to schedule it for some time in the future. Required if 'immediately' is False. If 'immediately' is True, send it ASAP."""
         try:
@@ -188,6 +190,15 @@ class MailManager:
             self.scheduled = []
             self._save()
 
+    def get_queue_lengths(self):
+        """Return the number of pending & scheduled emails (as saved in mails.json, so including the ones scheduled by other processes) as dict."""
+        try:
+            with open("mails.json", "r") as f:
+                data = json.load(f)
+            return {"pending": len(data["pending"]), "scheduled": len(data["scheduled"])}
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            return {"pending": 0, "scheduled": 0}
+
     def _save(self):
         try:
             scheduled = []
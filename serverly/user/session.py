@@ -1,6 +1,7 @@
 import datetime
 
 import serverly
+import serverly.tracing
 import sqlalchemy
 from serverly.user import Session, _setup_required
 
@@ -34,6 +35,7 @@ def extend_session(id, new_end: datetime.datetime):
 
 
 @_setup_required
+@serverly.tracing.traced("session.new_activity")
 def new_activity(username: str, address: tuple):
     """Update sessions to reflect a new user activity"""
     def create_new():
@@ -1,4 +1,7 @@
 import copy
+import datetime
+import email.utils
+import hashlib
 import json
 import mimetypes
 import os
@@ -33,13 +36,13 @@ def check_relative_path(path: str):
 
 
 def get_http_method_type(method: str):
-    """Return lowercase http method name, if valid. Else, raise Exception."""
-    supported_methods = ["get", "post", "put", "delete"  # , "head", "connect", "options", "trace", "patch"
+    """Return lowercase http method name, if valid. Else, raise Exception. 'websocket' is accepted for WebSocket endpoints."""
+    supported_methods = ["get", "post", "put", "delete", "websocket"  # , "head", "connect", "options", "trace", "patch"
                          ]
     m = str(method).lower()
     if not m in supported_methods:
         raise ValueError(
-            f"Request method '{method}' not supported. Supported are GET, POST, PUT & DELETE.")
+            f"Request method '{method}' not supported. Supported are GET, POST, PUT, DELETE & WEBSOCKET.")
     return m
 
 
@@ -204,3 +207,48 @@ def get_bytes(o, mimetype: str = None):
     else:
         # yeah i know could be simpler, shouldn't though (will probably 'soon' become more)
         return o
+
+
+_ETAG = re.compile(r'(?:W/)?"[^"]*"')
+
+
+def content_etag(content: bytes):
+    """Return a strong ETag for `content` (hash of it)."""
+    return '"' + hashlib.sha1(content).hexdigest() + '"'
+
+
+def http_date(timestamp: float):
+    """Format `timestamp` (seconds since the epoch) as HTTP-date, e.g. 'Sun, 06 Nov 1994 08:49:37 GMT'."""
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(date: str):
+    """Return the timestamp (seconds since the epoch) of HTTP-date `date` or None if it's invalid."""
+    try:
+        dt = email.utils.parsedate_to_datetime(date)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if dt.tzinfo == None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+def is_not_modified(request_headers: dict, response_headers: dict):
+    """Return whether the client's copy (described by the If-None-Match/If-Modified-Since `request_headers`) matches the validators (ETag/Last-Modified) in `response_headers`, i.e. a GET request can be answered with 304 - Not Modified. Keys are expected to be lowercase."""
+    etag = response_headers.get("etag", None)
+    if_none_match = request_headers.get("if-none-match", None)
+    if if_none_match != None:  # takes precedence over If-Modified-Since
+        if etag == None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        etag = etag[2:] if etag.startswith("W/") else etag
+        return any((t[2:] if t.startswith("W/") else t) == etag
+                   for t in _ETAG.findall(if_none_match))
+    if_modified_since = request_headers.get("if-modified-since", None)
+    last_modified = response_headers.get("last-modified", None)
+    if if_modified_since == None or last_modified == None:
+        return False
+    since = parse_http_date(if_modified_since)
+    modified = parse_http_date(last_modified)
+    return since != None and modified != None and int(modified) <= int(since)
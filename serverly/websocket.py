@@ -0,0 +1,167 @@
+"""
+serverly.websocket
+---
+WebSocket endpoints. Register an `async def` function for the pseudo-method 'websocket'; it's called with a `WebSocket` (a `Request`, so routing, auth decorators & header plugins work just like for HTTP) as soon as a client connects:
+
+```python
+@serverly.serves("websocket", "/chat")
+@serverly.user.auth.bearer_auth("chat")
+async def chat(ws):
+    await ws.accept()
+    ws.join("chat")
+    async for message in ws:
+        await serverly.websocket.broadcast(message, "chat", exclude=ws)
+```
+
+If the function returns a `Response` before accepting the connection (e.g. a 401 from an auth decorator), the handshake is denied with that response (if the server supports it, otherwise the connection is closed with code 1008). The connection is closed when the function returns.
+
+All accepted connections are kept in `connections` (and in the groups they joined) until they are closed, so messages can be broadcast to them. Connections are local to the process.
+"""
+import asyncio
+
+import serverly
+import serverly.err
+import serverly.utils
+from serverly import jsoncodec
+from serverly.objects import Request, Response
+
+connections = set()
+_groups = {}
+
+
+def _message(data):
+    if isinstance(data, (bytes, bytearray)):
+        return {"type": "websocket.send", "bytes": bytes(data)}
+    if type(data) != str:
+        data = jsoncodec.dumps(data)
+    return {"type": "websocket.send", "text": data}
+
+
+class WebSocket(Request):
+    """A WebSocket connection. Like a `Request` with method 'websocket' (and without body), but able to send and receive messages.
+
+    Attributes (additionally to the ones of `Request`):
+
+    - subprotocols: list: Subprotocols requested by the client
+    - accepted: bool: Has the connection been accepted?
+    - closed: bool: Has the connection been closed (by either side)?
+    - close_code: int/None: Close code, once closed
+    - groups: set: Names of the groups joined
+    """
+
+    def __init__(self, path, headers: dict, address: tuple, receive, send, subprotocols: list = []):
+        super().__init__("websocket", path, headers, "", address)
+        self.subprotocols = list(subprotocols)
+        self.accepted = False
+        self.closed = False
+        self.close_code = None
+        self.groups = set()
+        self._receive = receive
+        self._send = send
+
+    async def accept(self, subprotocol: str = None, headers: dict = {}):
+        """Accept the connection, choosing `subprotocol` (one of `subprotocols`) and sending `headers` (passed through the header plugins) with the handshake response."""
+        if self.accepted or self.closed:
+            return
+        response = serverly._apply_header_plugins(
+            self, Response(headers=headers))
+        await self._send({
+            "type": "websocket.accept",
+            "subprotocol": subprotocol,
+            "headers": [[bytes(k, "utf-8"), serverly.utils.get_bytes(v)] for k, v in response.headers.items() if k != "content-type" and k != "content-length"]
+        })
+        self.accepted = True
+        connections.add(self)
+
+    async def receive(self):
+        """Return the next message (str for text, bytes for binary messages). Accept the connection first if that didn't happen yet. Raise `serverly.err.WebSocketDisconnect` once the connection is closed."""
+        if not self.accepted:
+            await self.accept()
+        if self.closed:
+            raise serverly.err.WebSocketDisconnect(self.close_code)
+        message = await self._receive()
+        if message["type"] == "websocket.disconnect":
+            self._set_closed(message.get("code", 1000))
+            raise serverly.err.WebSocketDisconnect(self.close_code)
+        text = message.get("text", None)
+        return text if text != None else message.get("bytes", b"")
+
+    async def receive_json(self):
+        """Return the next message, parsed as JSON."""
+        return jsoncodec.loads(await self.receive())
+
+    async def send(self, data):
+        """Send `data` as a binary (bytes) or text (str or JSON-serializable) message. Accept the connection first if that didn't happen yet. Raise `serverly.err.WebSocketDisconnect` if the connection is closed."""
+        if not self.accepted:
+            await self.accept()
+        await self._send_message(_message(data))
+
+    async def _send_message(self, message: dict):
+        if self.closed:
+            raise serverly.err.WebSocketDisconnect(self.close_code)
+        try:
+            await self._send(message)
+        except OSError:  # client went away
+            self._set_closed(1006)
+            raise serverly.err.WebSocketDisconnect(self.close_code)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Close the connection with `code` (and `reason`). Closing a connection which hasn't been accepted rejects it (403 - Forbidden)."""
+        if self.closed:
+            return
+        self._set_closed(code)
+        try:
+            await self._send({"type": "websocket.close", "code": code, "reason": reason})
+        except OSError:
+            pass
+
+    def _set_closed(self, code: int):
+        self.closed = True
+        self.close_code = code
+        connections.discard(self)
+        for group in list(self.groups):
+            self.leave(group)
+
+    def join(self, group: str):
+        """Add the connection to `group` (created if necessary), so it receives messages broadcast to it."""
+        if self.closed:
+            return
+        self.groups.add(group)
+        _groups.setdefault(group, set()).add(self)
+
+    def leave(self, group: str):
+        """Remove the connection from `group` (removed when empty)."""
+        self.groups.discard(group)
+        members = _groups.get(group, None)
+        if members != None:
+            members.discard(self)
+            if len(members) == 0:
+                del _groups[group]
+
+    async def __aiter__(self):
+        """Yield the received messages until the connection is closed."""
+        try:
+            while True:
+                yield await self.receive()
+        except serverly.err.WebSocketDisconnect:
+            return
+
+    def __str__(self):
+        return f"WebSocket connection to '{self.path.path}' from {self.address}"
+
+
+def group(name: str):
+    """Return the (accepted) connections in group `name`."""
+    return set(_groups.get(name, ()))
+
+
+async def broadcast(data, group: str = None, exclude: WebSocket = None):
+    """Send `data` (like `WebSocket.send`, but serialized only once) to all accepted connections, or only the ones in `group`, except `exclude`. Connections which are closed meanwhile are skipped. Return the number of connections the message was sent to."""
+    message = _message(data)
+    receivers = [ws for ws in (connections if group == None else _groups.get(group, ()))
+                 if ws is not exclude]
+    results = await asyncio.gather(*[ws._send_message(message) for ws in receivers], return_exceptions=True)
+    for r in results:
+        if isinstance(r, Exception) and not isinstance(r, serverly.err.WebSocketDisconnect):
+            serverly.logger.handle_exception(r)
+    return sum(1 for r in results if not isinstance(r, Exception))
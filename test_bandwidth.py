@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+import serverly.bandwidth
+from serverly.bandwidth import TokenBucket, send_regulated
+
+
+def send_all(body: bytes, bandwidth: int):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    t = time.monotonic()
+    asyncio.run(send_regulated(send, body, bandwidth))
+    return messages, time.monotonic() - t
+
+
+def test_token_bucket():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+    async def consume():
+        b = TokenBucket(1000, 100)
+        t = time.monotonic()
+        await b.consume(100)  # initially full
+        assert time.monotonic() - t < 0.05
+        await b.consume(100)
+        await b.consume(100)
+        return time.monotonic() - t
+
+    assert 0.15 < asyncio.run(consume()) < 0.5
+
+
+def test_send_regulated():
+    body = bytes(range(250))
+    messages, t = send_all(body, 1000)
+    assert [len(m["body"]) for m in messages] == [100, 100, 50]
+    assert [m["more_body"] for m in messages] == [True, True, False]
+    assert b"".join(m["body"] for m in messages) == body
+    assert 0.1 < t < 0.5
+
+    messages, t = send_all(b"", 1000)
+    assert messages == [{"type": "http.response.body", "body": b""}]
+
+
+def test_send_regulated_shared_cap():
+    serverly.bandwidth.max_bandwidth = 1000
+    try:
+        async def send(message):
+            pass
+
+        async def two():
+            t = time.monotonic()
+            await asyncio.gather(send_regulated(send, b"a" * 200, 100000),
+                                 send_regulated(send, b"b" * 200, 100000))
+            return time.monotonic() - t
+        # 400 bytes at 1000 bytes/sec with a burst of 100 bytes
+        assert 0.25 < asyncio.run(two()) < 0.8
+    finally:
+        serverly.bandwidth.max_bandwidth = None
+        serverly.bandwidth._shared_bucket = None
@@ -0,0 +1,150 @@
+import gzip
+import os
+
+import pytest
+import serverly
+import serverly.compression
+import serverly.staticfiles
+from serverly.compression import (Compressor, compress, is_compressible,
+                                  negotiate, variant_etag)
+from test_serverly import asgi_request
+
+FILENAME = "test_compression.tmp.txt"
+
+
+def decompress(data, encoding):
+    if encoding == "br":
+        import brotli
+        return brotli.decompress(data)
+    return gzip.decompress(data)
+
+
+@pytest.fixture
+def no_brotli():
+    b = serverly.compression.brotli
+    serverly.compression.brotli = None
+    yield
+    serverly.compression.brotli = b
+
+
+def test_negotiate(no_brotli):
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("gzip, deflate, br") == "gzip"
+    assert negotiate("deflate") == None
+    assert negotiate("gzip;q=0") == None
+    assert negotiate("*") == "gzip"
+    assert negotiate("*, gzip;q=0") == None
+    assert negotiate("") == None
+    assert negotiate(None) == None
+    assert negotiate("gzip;q=invalid, identity") == None
+
+
+@pytest.mark.skipif("serverly.compression.brotli == None")
+def test_negotiate_brotli():
+    assert negotiate("gzip, deflate, br") == "br"
+    assert negotiate("gzip, br;q=0.5") == "gzip"
+    assert negotiate("*") == "br"
+
+
+def test_is_compressible():
+    big = serverly.compression.min_size
+    assert is_compressible({"content-type": "text/html"}, big)
+    assert is_compressible({"content-type": "application/json"}, big)
+    assert is_compressible({"content-type": "application/json"})
+    assert not is_compressible({"content-type": "text/html"}, big - 1)
+    assert not is_compressible({"content-type": "image/png"}, big)
+    assert not is_compressible({}, big)
+    assert not is_compressible(
+        {"content-type": "text/html", "content-encoding": "gzip"}, big)
+    assert not is_compressible(
+        {"content-type": "text/html", "cache-control": "no-transform"}, big)
+
+
+def test_variant_etag():
+    assert variant_etag('"abc"', "gzip") == '"abc-gzip"'
+    assert variant_etag('W/"abc"', "br") == 'W/"abc-br"'
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_compress(encoding):
+    if encoding == "br" and serverly.compression.brotli == None:
+        pytest.skip("brotli not installed")
+    data = b"hello world " * 1000
+    assert decompress(compress(data, encoding), encoding) == data
+    c = Compressor(encoding)
+    streamed = b"".join([c.compress(data[:5000]), c.compress(data[5000:]), c.flush()])
+    assert decompress(streamed, encoding) == data
+    with pytest.raises(ValueError):
+        Compressor("deflate")
+
+
+def test_compress_cache():
+    serverly.compression.clear()
+    data = b"hello world " * 1000
+    a = compress(data, "gzip", '"a"')
+    assert compress(data, "gzip", '"a"') is a
+    assert compress(data, "gzip") is not a
+    default = serverly.compression.cache_size
+    try:
+        serverly.compression.cache_size = len(a)
+        b = compress(b"hello there " * 1000, "gzip", '"b"')
+        assert list(serverly.compression._cache.values()) == [b]
+        assert serverly.compression._cache_bytes == len(b)
+    finally:
+        serverly.compression.cache_size = default
+        serverly.compression.clear()
+
+
+def test_compressed_responses(no_brotli):
+    obj = {"numbers": list(range(1000))}
+    serverly.register_function(
+        "GET", "/compression-json", lambda req: serverly.Response(body=obj))
+    serverly.register_function(
+        "GET", "/compression-small", lambda req: serverly.Response(body="hi"))
+    code, headers, body = asgi_request(
+        "GET", "/compression-json", {"Accept-Encoding": "gzip, deflate"})
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert serverly.jsoncodec.loads(gzip.decompress(body)) == obj
+    code, headers, body = asgi_request("GET", "/compression-json")
+    assert not "content-encoding" in headers
+    assert headers["vary"] == "Accept-Encoding"
+    assert serverly.jsoncodec.loads(body) == obj
+    code, headers, body = asgi_request(
+        "GET", "/compression-small", {"Accept-Encoding": "gzip"})
+    assert not "content-encoding" in headers and body == b"hi"
+
+
+@pytest.mark.parametrize("threshold", [1024, 1024 * 1024])
+def test_compressed_static_site(no_brotli, threshold):
+    data = b"serverly is a web server framework\n" * 2000
+    with open(FILENAME, "wb") as f:
+        f.write(data)
+    default = serverly.staticfiles.stream_threshold
+    serverly.staticfiles.stream_threshold = threshold  # streamed or cached
+    try:
+        serverly.StaticSite("/compression-static", FILENAME).use()
+        code, headers, body = asgi_request(
+            "GET", "/compression-static", {"Accept-Encoding": "gzip"})
+        assert code == 200
+        assert headers["content-encoding"] == "gzip"
+        assert not "content-length" in headers
+        assert gzip.decompress(body) == data
+        etag = headers["etag"]
+        assert etag.endswith('-gzip"')
+
+        code, headers, body = asgi_request(
+            "GET", "/compression-static", {"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert code == 304 and headers["etag"] == etag
+        assert headers["vary"] == "Accept-Encoding"
+        code, headers, body = asgi_request(
+            "GET", "/compression-static", {"If-None-Match": etag})
+        assert code == 200 and body == data  # identity has another ETag
+
+        code, headers, body = asgi_request(
+            "GET", "/compression-static", {"Accept-Encoding": "gzip", "Range": "bytes=0-9"})
+        assert code == 206 and body == data[:10]
+        assert not "content-encoding" in headers
+    finally:
+        serverly.staticfiles.stream_threshold = default
+        os.remove(FILENAME)
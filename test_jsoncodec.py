@@ -0,0 +1,43 @@
+import json
+
+import pytest
+from serverly import jsoncodec
+
+
+@pytest.fixture(params=["orjson", "ujson", "json"])
+def backend(request):
+    previous = jsoncodec.backend
+    try:
+        jsoncodec.use(request.param)
+    except ImportError:
+        pytest.skip(f"{request.param} not installed")
+    yield request.param
+    jsoncodec.use(previous)
+
+
+def test_default_backend():
+    assert jsoncodec.backend in jsoncodec.backends
+    with pytest.raises(ValueError):
+        jsoncodec.use("notabackend")
+
+
+def test_roundtrip(backend):
+    d = {"hello": [1, 2.5, "wörld", None, True], "nested": {"/a": {}}}
+    assert jsoncodec.backend == backend
+    assert json.loads(jsoncodec.dumps(d)) == d
+    assert json.loads(jsoncodec.dumpb(d)) == d
+    assert type(jsoncodec.dumps(d)) == str
+    assert type(jsoncodec.dumpb(d)) == bytes
+    assert jsoncodec.loads(jsoncodec.dumps(d)) == d
+    assert jsoncodec.loads(jsoncodec.dumpb(d)) == d
+
+    with pytest.raises(ValueError):
+        jsoncodec.loads("{not json")
+
+
+def test_fallback(backend):
+    # too big for the fast backends
+    assert jsoncodec.dumps([2 ** 70]) == json.dumps([2 ** 70])
+    assert jsoncodec.dumpb([2 ** 70]) == json.dumps([2 ** 70]).encode()
+    with pytest.raises(TypeError):
+        jsoncodec.dumps(object())
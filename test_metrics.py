@@ -0,0 +1,64 @@
+import serverly
+import serverly.metrics
+import serverly.statistics
+
+
+def samples(body: bytes):
+    """Return the samples ({'name{labels}': value}) of an OpenMetrics exposition."""
+    result = {}
+    for line in body.decode("utf-8").splitlines():
+        if not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            result[name] = float(value)
+    return result
+
+
+def test_render():
+    serverly.statistics.reset()
+    serverly.metrics.clear()
+    for t in (0.0004, 0.003, 0.003, 0.2):
+        serverly.statistics.new_statistic("hello", t)
+    serverly.statistics.new_statistic('say "hi"', 0.02)
+    body = serverly.metrics.render()
+    assert body.endswith(b"# EOF\n")
+    assert b"# TYPE serverly_request_duration_seconds histogram\n" in body
+    s = samples(body)
+    assert s["serverly_requests_total"] == 5
+    assert s["serverly_requests_in_flight"] == 0
+
+    bucket = 'serverly_request_duration_seconds_bucket{function="hello",le="%s"}'
+    assert s[bucket % "0.001"] == 1
+    assert s[bucket % "0.0025"] == 1
+    assert s[bucket % "0.005"] == 3
+    assert s[bucket % "0.1"] == 3
+    assert s[bucket % "0.25"] == 4
+    assert s[bucket % "+Inf"] == 4
+    assert s['serverly_request_duration_seconds_count{function="hello"}'] == 4
+    assert abs(s['serverly_request_duration_seconds_sum{function="hello"}'] - 0.2064) < 1e-9
+    assert s['serverly_request_duration_seconds_count{function="say \\"hi\\""}'] == 1
+    assert 'serverly_route_cache_lookups_total{result="hit"}' in s
+
+
+def test_render_reused():
+    serverly.statistics.reset()
+    serverly.metrics.clear()
+    serverly.statistics.new_statistic("reused", 0.01)
+    body = serverly.metrics.render()
+    serverly.statistics.new_statistic("reused", 0.01)
+    assert serverly.metrics.render() is body
+    default = serverly.metrics.max_age
+    try:
+        serverly.metrics.max_age = 0
+        assert samples(serverly.metrics.render())["serverly_requests_total"] == 2
+    finally:
+        serverly.metrics.max_age = default
+
+
+def test_in_flight():
+    serverly.statistics.reset()
+    serverly.statistics.request_started()
+    serverly.statistics.request_started()
+    serverly.statistics.request_finished()
+    assert serverly.statistics.get_in_flight() == 1
+    serverly.statistics.request_finished()
+    assert serverly.statistics.get_in_flight() == 0
@@ -7,6 +7,7 @@ import urllib.parse as parse
 import pytest
 import serverly
 import serverly.utils
+from serverly import jsoncodec
 from serverly.objects import (DBObject, Redirect, Request, Resource, Response,
                               StaticSite)
 
@@ -71,6 +72,26 @@ def test_request_6():
     assert str(req) == s + " With 'bearer' authentication."
 
 
+def test_request_raw_body():
+    raw = '{"hello": "wörld"}'.encode("utf-8")
+    req = Request("POST", parse.urlparse("/raw"), {}, raw, ("localhost", 8080))
+    assert req.raw_body == raw
+    assert req._raw_body == raw  # not decoded yet
+    assert req.headers == {}
+    assert req.obj == {"hello": "wörld"}
+    assert req.body == '{"hello": "wörld"}'
+    assert req._raw_body == None
+
+    req = Request("POST", parse.urlparse("/raw"), {},
+                  b"\xff\xfe", ("localhost", 8080))
+    assert req.raw_body == b"\xff\xfe"
+    with pytest.raises(UnicodeDecodeError):
+        req.body
+
+    req.body = "new"
+    assert req.body == "new"
+
+
 def test_response():
     content = "<html><h1>Hello, World</h1></html>"
     res = Response(body=content)
@@ -112,7 +133,8 @@ def test_response_3():
     res = Response(body=d)
 
     assert res.obj == d
-    assert res.body == json.dumps(d)
+    assert res.body == jsoncodec.dumps(d)
+    assert json.loads(res.body) == d
 
 
 def test_response_4():
@@ -120,7 +142,8 @@ def test_response_4():
 
     res = Response(body=d)
 
-    assert res.body == json.dumps(d)
+    assert res.body == jsoncodec.dumps(d)
+    assert json.loads(res.body) == d
     assert res.obj == d
 
 
@@ -160,6 +183,41 @@ def test_response_7():
     assert r.obj == serverly.utils.clean_user_object(l)
 
 
+def test_response_lazy():
+    from serverly.objects import _NOT_COMPUTED, _could_be_json
+    d = {"hello": ["SUPERPATH/", 1]}
+    res = Response(body=d)
+    assert res._body is _NOT_COMPUTED
+    assert res.headers["content-type"] == "application/json"
+    assert res.obj is d
+    assert res.body == jsoncodec.dumps(d)
+    assert res.body is res.body  # memoized
+
+    res = Response(body='{"a": [1, 2]}')
+    assert res._body == '{"a": [1, 2]}'
+    assert res.obj == {"a": [1, 2]}
+    assert res.obj is res.obj
+
+    assert not _could_be_json("<html></html>")
+    assert not _could_be_json("Hello")
+    assert not _could_be_json("")
+    assert _could_be_json(" [1]")
+    assert _could_be_json("42")
+    assert Response(body="42").obj == 42
+    assert Response(body="nope").obj == None
+
+
+def test_response_body_bytes():
+    assert Response(body="hällo").body_bytes == "hällo".encode("utf-8")
+    d = {"a": [1, "ö"]}
+    res = Response(body=d)
+    assert json.loads(res.body_bytes) == d
+    assert res.body_bytes == jsoncodec.dumpb(d)
+    with open("test_serverly.py", "rb") as f:
+        c = f.read()
+        assert Response(body=f).body_bytes == c
+
+
 def test_redirect():
     r = Redirect("/index")
     assert r.code == 301
@@ -259,3 +317,26 @@ def test_static_resource():
         "/folders/serverly/__init__.py"), {}, "", ("localhost", 8091)))[1]
 
     assert "class Sitemap" in response.body
+
+
+def test_response_stream():
+    def gen():
+        yield "a"
+        yield b"b"
+
+    async def agen():
+        yield b"c"
+
+    g = gen()
+    res = Response(headers={"content-type": "text/csv"}, body=g)
+    assert res.stream is g
+    assert res.body == ""
+    assert res.obj == None
+    assert res.headers["content-type"] == "text/csv"
+    a = agen()
+    assert Response(body=a).stream is a
+    assert Response(body=iter([b"x"])).stream != None
+    assert Response(body=[b"x"]).stream == None  # lists are serialized
+    res.body = "hello"
+    assert res.stream == None
+    assert res.body == "hello"
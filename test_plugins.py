@@ -72,3 +72,36 @@ def test_server_lifespan_plugin():
 
     with pytest.raises(NotImplementedError):
         plugins.ServerLifespanPlugin().onRedirectServerStart()
+
+    # optional, only called in worker processes
+    assert plugins.ServerLifespanPlugin().onWorkerStart(0) == None
+    assert plugins.ServerLifespanPlugin().onWorkerShutdown(0) == None
+
+
+def test_worker_lifespan_hooks():
+    calls = []
+
+    class WorkerPlugin(plugins.ServerLifespanPlugin):
+        def onServerStart(self):
+            calls.append("server start")
+
+        def onServerShutdown(self):
+            calls.append("server shutdown")
+
+        def onWorkerStart(self, worker: int):
+            calls.append(("start", worker))
+
+        def onWorkerShutdown(self, worker: int):
+            calls.append(("shutdown", worker))
+
+    plugin = WorkerPlugin()
+    plugin.use()
+    serverly._worker = 3
+    try:
+        serverly._update_status("startup")
+        serverly._update_status("shutdown")
+    finally:
+        serverly._worker = None
+        plugins._plugin_manager.server_lifespan_plugins.remove(plugin)
+    # the master process handles the server's lifespan
+    assert calls == [("start", 3), ("shutdown", 3)]
@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+import serverly.profiler
+
+
+def busy(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def waiting(stop: threading.Event):
+    stop.wait()
+
+
+@pytest.fixture
+def threads():
+    stop = threading.Event()
+    ts = [threading.Thread(target=busy, args=(stop,)),
+          threading.Thread(target=waiting, args=(stop,))]
+    for t in ts:
+        t.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        for t in ts:
+            t.join()
+
+
+def test_profile(threads):
+    lines = serverly.profiler.profile(0.2).splitlines()
+    assert len(lines) > 0
+    stacks = {}
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        stacks[stack] = int(count)
+    busy_stacks = [s for s in stacks if "busy (" in s]
+    assert len(busy_stacks) > 0
+    frame = next(f for f in busy_stacks[0].split(";") if f.startswith("busy ("))
+    assert frame.endswith("test_profiler.py:10)")
+    assert busy_stacks[0].split(";")[0].startswith("_bootstrap (")  # outermost first
+    assert sum(stacks[s] for s in busy_stacks) > 10
+    assert not any("waiting (" in s for s in stacks)  # idle
+
+
+def test_idle(threads):
+    assert "waiting (" in serverly.profiler.profile(0.05, idle=True)
+
+
+def test_one_at_a_time():
+    t = threading.Thread(target=serverly.profiler.sample, args=(0.3,))
+    t.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(RuntimeError):
+            serverly.profiler.sample(0.01)
+    finally:
+        t.join()
+    assert serverly.profiler.sample(0.01) != None
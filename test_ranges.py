@@ -0,0 +1,110 @@
+import os
+
+import pytest
+import serverly
+import serverly.ranges
+import serverly.staticfiles
+from serverly.ranges import if_range_matches, parse
+from test_serverly import asgi_request
+
+FILENAME = "test_ranges.tmp"
+
+
+@pytest.fixture
+def data():
+    content = bytes(i % 251 for i in range(100000))
+    with open(FILENAME, "wb") as f:
+        f.write(content)
+    yield content
+    os.remove(FILENAME)
+
+
+def test_parse():
+    assert parse("bytes=0-99", 1000) == [(0, 100)]
+    assert parse("bytes=500-", 1000) == [(500, 1000)]
+    assert parse("bytes=-200", 1000) == [(800, 1000)]
+    assert parse("bytes=-2000", 1000) == [(0, 1000)]
+    assert parse("bytes=900-1999", 1000) == [(900, 1000)]
+    assert parse("bytes= 0-9 , 20-29", 1000) == [(0, 10), (20, 30)]
+    assert parse("bytes=20-29,0-9", 1000) == [(0, 10), (20, 30)]
+    # overlapping & adjacent ranges are merged
+    assert parse("bytes=0-9,5-19,20-29", 1000) == [(0, 30)]
+    # unsatisfiable
+    assert parse("bytes=1000-", 1000) == []
+    assert parse("bytes=-0", 1000) == []
+    assert parse("bytes=0-", 0) == []
+    assert parse("bytes=2000-,0-9", 1000) == [(0, 10)]
+    # invalid: ignored
+    assert parse("bytes=9-0", 1000) == None
+    assert parse("bytes=-", 1000) == None
+    assert parse("bytes=a-b", 1000) == None
+    assert parse("items=0-9", 1000) == None
+    assert parse(",".join(["bytes=0-1"] + ["3-4"] *
+                          serverly.ranges.max_ranges), 1000) == None
+
+
+def test_if_range_matches():
+    response = {"etag": '"abc"',
+                "last-modified": "Sun, 06 Nov 1994 08:49:37 GMT"}
+    assert if_range_matches({}, response)
+    assert if_range_matches({"if-range": '"abc"'}, response)
+    assert not if_range_matches({"if-range": '"abcd"'}, response)
+    assert not if_range_matches({"if-range": 'W/"abc"'}, response)
+    assert not if_range_matches(
+        {"if-range": '"abc"'}, {"etag": 'W/"abc"'})
+    assert if_range_matches(
+        {"if-range": "Sun, 06 Nov 1994 08:49:37 GMT"}, response)
+    assert not if_range_matches(
+        {"if-range": "Mon, 07 Nov 1994 08:49:37 GMT"}, response)
+
+
+@pytest.mark.parametrize("threshold", [1024, 1024 * 1024])
+def test_static_site_ranges(data, threshold):
+    default = serverly.staticfiles.stream_threshold
+    serverly.staticfiles.stream_threshold = threshold  # streamed or cached
+    try:
+        serverly.StaticSite("/ranges", FILENAME).use()
+        code, headers, body = asgi_request("GET", "/ranges")
+        assert code == 200 and body == data
+        assert headers["accept-ranges"] == "bytes"
+        etag = headers["etag"]
+
+        code, headers, body = asgi_request(
+            "GET", "/ranges", {"Range": "bytes=70000-"})
+        assert code == 206
+        assert body == data[70000:]
+        assert headers["content-range"] == "bytes 70000-99999/100000"
+        assert headers["content-length"] == "30000"
+
+        code, headers, body = asgi_request(
+            "GET", "/ranges", {"Range": "bytes=-10", "If-Range": etag})
+        assert code == 206 and body == data[-10:]
+        code, headers, body = asgi_request(
+            "GET", "/ranges", {"Range": "bytes=-10", "If-Range": '"outdated"'})
+        assert code == 200 and body == data
+
+        code, headers, body = asgi_request(
+            "GET", "/ranges", {"Range": "bytes=100000-"})
+        assert code == 416
+        assert headers["content-range"] == "bytes */100000"
+
+        code, headers, body = asgi_request(
+            "GET", "/ranges", {"Range": "bytes=0-9,99990-99999"})
+        assert code == 206
+        assert headers["content-type"].startswith("multipart/byteranges; boundary=")
+        boundary = headers["content-type"].split("boundary=")[1]
+        assert int(headers["content-length"]) == len(body)
+        parts = body.split(bytes("--" + boundary, "utf-8"))
+        assert parts[0] == b"" and parts[-1] == b"--\r\n"
+        assert parts[1] == b"\r\ncontent-type: application/octet-stream\r\ncontent-range: bytes 0-9/100000\r\n\r\n" + \
+            data[:10] + b"\r\n"
+        assert parts[2].endswith(b"\r\n\r\n" + data[99990:] + b"\r\n")
+    finally:
+        serverly.staticfiles.stream_threshold = default
+
+
+def test_iter_file(data):
+    chunks = list(serverly.staticfiles.iter_file(FILENAME, 10, 70000))
+    assert b"".join(chunks) == data[10:70010]
+    assert all(len(c) <= serverly.staticfiles.chunk_size for c in chunks)
+    assert list(serverly.staticfiles.iter_file(FILENAME, 100000)) == []
@@ -0,0 +1,171 @@
+import urllib.parse as parse
+
+import pytest
+import serverly
+from serverly.routing import CombinedRegexRouter, TrieRouter, split_pattern
+
+
+def test_split_pattern():
+    assert split_pattern("^/hello/world$") == ("/hello/world", True)
+    assert split_pattern("/hello$") == ("/hello", True)
+    assert split_pattern("^/hello") == ("/hello", False)
+    assert split_pattern(r"^/file\.txt$") == ("/file.txt", True)
+    assert split_pattern("^/file.txt$") == ("/file", False)
+    assert split_pattern(r"^/verify/[\w0-9]+$") == ("/verify/", False)
+    assert split_pattern("^/console/?$") == ("/console", False)
+    assert split_pattern("^/ab?c$") == ("/a", False)
+    assert split_pattern("^/a|/b$") == ("", False)
+    assert split_pattern(r"^/\w+$") == ("/", False)
+
+
+def test_trie_router():
+    r = TrieRouter(["^/index$", r"^/users/[0-9]+$", "^/users/new$", "^/$"])
+    assert len(r) == 4
+    assert r.match("/index") == "^/index$"
+    assert r.match("/users/12") == r"^/users/[0-9]+$"
+    assert r.match("/users/new") == "^/users/new$"
+    assert r.match("/") == "^/$"
+    assert r.match("/users/abc") == None
+    assert r.match("/index/more") == None
+    assert r.match("/nothing") == None
+
+
+def test_trie_router_first_match_wins():
+    r = TrieRouter([r"^/[a-z]+$", "^/hello$"])
+    assert r.match("/hello") == r"^/[a-z]+$"
+
+    r = TrieRouter(["^/hello$", r"^/[a-z]+$"])
+    assert r.match("/hello") == "^/hello$"
+    assert r.match("/world") == r"^/[a-z]+$"
+
+    r = TrieRouter(["^/hello$", "/hello$"])
+    assert r.match("/hello") == "^/hello$"
+    r.remove("^/hello$")
+    assert r.match("/hello") == "/hello$"
+
+
+def test_trie_router_add_remove():
+    r = TrieRouter()
+    r.add("^/a/b$")
+    r.add(r"^/a/\d+$")
+    assert "^/a/b$" in r
+    assert r.match("/a/b") == "^/a/b$"
+    assert r.match("/a/1") == r"^/a/\d+$"
+    assert r.remove("^/a/b$")
+    assert not r.remove("^/a/b$")
+    assert r.match("/a/b") == None
+    assert r.remove(r"^/a/\d+$")
+    assert r.match("/a/1") == None
+    assert len(r) == 0
+
+
+def test_combined_regex_router():
+    r = CombinedRegexRouter(
+        [r"^/users/(?P<id>[0-9]+)$", r"^/[a-z]+$", "^/hello$", "^/$"])
+    assert r.match("/users/1") == r"^/users/(?P<id>[0-9]+)$"
+    assert r.match("/hello") == r"^/[a-z]+$"
+    assert r.match("/") == "^/$"
+    assert r.match("/HELLO") == None
+
+    assert r.remove(r"^/[a-z]+$")
+    assert not r.remove(r"^/[a-z]+$")
+    assert r.match("/hello") == "^/hello$"
+    r.add(r"^/[a-z]+$")
+    assert r.match("/world") == r"^/[a-z]+$"
+    assert len(r) == 4
+
+
+def test_combined_regex_router_fallback():
+    # duplicate group names & numbered references cannot be combined
+    r = CombinedRegexRouter(
+        [r"^/a/(?P<id>\d+)$", r"^/b/(?P<id>\d+)$", r"^/(\w)\1$"])
+    assert r.match("/b/2") == r"^/b/(?P<id>\d+)$"
+    assert r.match("/xx") == r"^/(\w)\1$"
+    assert r.match("/xy") == None
+
+    r = CombinedRegexRouter()
+    assert r.match("/") == None
+    with pytest.raises(Exception):
+        r.add("^/(unbalanced$")
+
+
+@pytest.mark.parametrize("router", ["trie", "regex"])
+def test_sitemap_router(router):
+    sitemap = serverly.Sitemap(router=router)
+    sitemap.register_site("GET", lambda req: serverly.Response(
+        body="users"), r"/users/[0-9]+")
+    sitemap.register_site("GET", lambda req: serverly.Response(
+        body="index"), "/index")
+    req = serverly.Request("GET", parse.urlparse("/users/3"), {}, "", (0, 0))
+    assert sitemap.get_content(req)[1].body == "users"
+    req = serverly.Request("GET", parse.urlparse("/index"), {}, "", (0, 0))
+    assert sitemap.get_content(req)[1].body == "index"
+    sitemap.unregister_site("GET", "/index")
+    assert "404" in sitemap.get_content(req)[1].body
+
+    with pytest.raises(ValueError):
+        sitemap.router = "notarouter"
+
+
+def test_sitemap_unregister():
+    def a(req):
+        return serverly.Response(body="a")
+
+    def b(req):
+        return serverly.Response(body="b")
+    serverly.register_function("GET", "/routing/a", a)
+    serverly.register_function("GET", "/routing/b", b)
+
+    req = serverly.Request("GET", parse.urlparse(
+        "/routing/a"), {}, "", (0, 0))
+    assert serverly._sitemap.get_content(req)[1].body == "a"
+
+    assert serverly.unregister("GET", "/routing/a")
+    assert "404 - Page not found" in serverly._sitemap.get_content(req)[
+        1].body
+    assert serverly._sitemap.methods["get"].get("^/routing/b$") == b
+
+
+def test_sitemap_route_cache():
+    import serverly.statistics
+    serverly.statistics.reset()
+    sitemap = serverly.Sitemap(route_cache_size=2)
+    sitemap.register_site("GET", lambda req: serverly.Response(
+        body="a"), "/cache/a")
+
+    def get(path):
+        req = serverly.Request("GET", parse.urlparse(path), {}, "", (0, 0))
+        return sitemap.get_content(req)[1].body
+
+    assert get("/cache/a") == "a"
+    assert get("/cache/a") == "a"
+    assert serverly.statistics.route_cache == {"hits": 1, "misses": 1}
+
+    # negative entries are cached, too
+    assert "404" in get("/cache/b")
+    assert "404" in get("/cache/b")
+    assert serverly.statistics.route_cache == {"hits": 2, "misses": 2}
+    assert list(sitemap._route_cache.keys()) == [
+        ("get", "/cache/a"), ("get", "/cache/b")]
+
+    # registering invalidates the cache
+    sitemap.register_site("GET", lambda req: serverly.Response(
+        body="b"), "/cache/b")
+    assert len(sitemap._route_cache) == 0
+    assert get("/cache/b") == "b"
+
+    # LRU eviction
+    get("/cache/a")
+    get("/cache/b")
+    get("/cache/c")
+    assert list(sitemap._route_cache.keys()) == [
+        ("get", "/cache/b"), ("get", "/cache/c")]
+
+    sitemap.unregister_site("GET", "/cache/b")
+    assert len(sitemap._route_cache) == 0
+    assert "404" in get("/cache/b")
+
+    sitemap.route_cache_size = 0
+    sitemap._route_cache.clear()
+    get("/cache/a")
+    assert len(sitemap._route_cache) == 0
@@ -1,5 +1,7 @@
+import asyncio
 import json
 import multiprocessing
+import threading
 import os
 import time
 import urllib.parse as parse
@@ -35,6 +37,274 @@ def test_sitemap():
     assert "404 - Page not found" in serverly._sitemap.get_content(r2)[1].body
 
 
+def test_sitemap_async():
+    async def hello_async(req):
+        await asyncio.sleep(0)
+        return serverly.Response(body="hello async!")
+
+    def hello_sync(req):
+        return serverly.Response(body=threading.current_thread().name)
+
+    def wrapped(func):  # sync decorator around async function
+        def wrapper(req):
+            return func(req)
+        wrapper.__name__ = func.__name__
+        return wrapper
+
+    def broken(req):
+        raise ValueError("nope")
+
+    serverly.register_function("GET", "/async", hello_async)
+    serverly.register_function("GET", "/sync", hello_sync)
+    serverly.register_function("GET", "/wrapped", wrapped(hello_async))
+    serverly.register_function("GET", "/broken", broken)
+
+    def req(path):
+        return serverly.Request("GET", parse.urlparse(path), {}, "", (0, 0))
+
+    assert serverly._sitemap.get_content(req("/async"))[1].body == "hello async!"
+    assert serverly._sitemap.get_content(
+        req("/wrapped"))[1].body == "hello async!"
+
+    async def requests_async():
+        return await asyncio.gather(*[serverly._sitemap.get_content_async(req(p)) for p in ["/async", "/sync", "/wrapped", "/broken", "/nothing"]])
+
+    r = asyncio.run(requests_async())
+    assert r[0] == ("hello_async", r[0][1])
+    assert r[0][1].body == "hello async!"
+    assert r[1][1].body.startswith("serverly-handler")
+    assert r[2][1].body == "hello async!"
+    assert r[3][1].code == 500
+    assert r[4][1].code == 404
+
+
+def test_read_body():
+    messages = [{"type": "http.request", "body": b"hello ", "more_body": True},
+                {"type": "http.request", "body": b"world", "more_body": True},
+                {"type": "http.request", "body": b"!", "more_body": False}]
+
+    def receiver():
+        it = iter(list(messages))
+
+        async def receive():
+            return next(it)
+        return receive
+
+    assert asyncio.run(serverly._read_body(receiver())) == b"hello world!"
+
+    async def stream():
+        return [c async for c in serverly._iter_body(receiver())]
+    assert asyncio.run(stream()) == [b"hello ", b"world", b"!"]
+
+
+def test_stream_body():
+    @serverly.stream_body
+    async def upload(req):
+        return serverly.Response(body=b"".join([c async for c in req.stream]).decode())
+
+    assert upload.stream_body
+    serverly.register_function("POST", "/upload", upload)
+    site = serverly._sitemap.get_site("post", "/upload")
+    assert site == upload
+
+    async def stream():
+        yield b"a"
+        yield b"b"
+    req = serverly.Request("POST", parse.urlparse(
+        "/upload"), {}, "", (0, 0), stream())
+    assert asyncio.run(serverly._sitemap.get_content_async(req))[
+        1].body == "ab"
+
+
+def asgi_request(method, path, headers={}, body=b""):
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "method": method, "path": path, "query_string": query.encode(),
+             "client": ("127.0.0.1", 12345),
+             "headers": [(k.encode(), v.encode()) for k, v in headers.items()]}
+    received = [{"type": "http.request", "body": body, "more_body": False}]
+    messages = []
+
+    async def receive():
+        if received:
+            return received.pop()
+        await asyncio.sleep(3600)  # client stays connected
+
+    async def send(message):
+        messages.append(message)
+    asyncio.run(serverly._uvicorn_server(scope, receive, send))
+    headers = {str(k, "utf-8"): str(v, "utf-8")
+               for k, v in messages[0]["headers"]}
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return messages[0]["status"], headers, body
+
+
+def test_conditional_get():
+    with open("test_conditional.tmp", "w") as f:
+        f.write("hello")
+    try:
+        serverly.StaticSite("/conditional-static",
+                            "test_conditional.tmp").use()
+        code, headers, body = asgi_request("GET", "/conditional-static")
+        assert code == 200 and body == b"hello"
+        etag, last_modified = headers["etag"], headers["last-modified"]
+
+        code, headers, body = asgi_request(
+            "GET", "/conditional-static", {"If-None-Match": etag})
+        assert code == 304 and body == b""
+        assert headers["etag"] == etag
+        assert not "content-type" in headers
+        code, headers, body = asgi_request(
+            "GET", "/conditional-static", {"If-Modified-Since": last_modified})
+        assert code == 304
+        code, headers, body = asgi_request(
+            "GET", "/conditional-static", {"If-None-Match": '"other"'})
+        assert code == 200 and body == b"hello"
+    finally:
+        os.remove("test_conditional.tmp")
+
+    serverly.register_function("GET", "/conditional-func", lambda req: serverly.Response(
+        body={"hello": "world"}, etag=True))
+    serverly.register_function(
+        "GET", "/conditional-func-no-etag", lambda req: serverly.Response(body="hi"))
+    code, headers, body = asgi_request("GET", "/conditional-func")
+    assert code == 200 and json.loads(body) == {"hello": "world"}
+    etag = headers["etag"]
+    code, headers, body = asgi_request(
+        "GET", "/conditional-func", {"If-None-Match": etag})
+    assert code == 304 and body == b""
+    code, headers, body = asgi_request("GET", "/conditional-func-no-etag")
+    assert not "etag" in headers
+
+
+def test_streamed_response():
+    import gzip
+
+    def rows():
+        assert threading.current_thread() is not threading.main_thread()
+        yield "id,name\n"
+        for i in range(1000):
+            yield f"{i},user{i}\n"
+
+    async def numbers():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield bytes(str(i), "utf-8")
+
+    serverly.register_function("GET", "/stream-sync", lambda req: serverly.Response(
+        headers={"content-type": "text/csv"}, body=rows()))
+    serverly.register_function(
+        "GET", "/stream-async", lambda req: serverly.Response(body=numbers()))
+    expected = "id,name\n" + "".join(f"{i},user{i}\n" for i in range(1000))
+
+    code, headers, body = asgi_request("GET", "/stream-sync")
+    assert code == 200 and headers["content-type"] == "text/csv"
+    assert body == bytes(expected, "utf-8")
+    code, headers, body = asgi_request(
+        "GET", "/stream-sync", {"Accept-Encoding": "gzip"})
+    assert headers["content-encoding"] == "gzip"
+    assert gzip.decompress(body) == bytes(expected, "utf-8")
+    code, headers, body = asgi_request("GET", "/stream-async")
+    assert body == b"012"
+
+
+def test_superpath_object_body():
+    serverly.register_function("GET", "/superpath-json", lambda req: serverly.Response(
+        body={"next": "SUPERPATH/page/2", "items": [1, 2]}))
+    superpath = serverly._sitemap.superpath
+    serverly._sitemap.superpath = "/api/"
+    try:
+        code, headers, body = asgi_request("GET", "/superpath-json")
+    finally:
+        serverly._sitemap.superpath = superpath
+    assert json.loads(body) == {"next": "/api/page/2", "items": [1, 2]}
+    assert headers["content-type"] == "application/json"
+
+
+def test_streamed_response_error():
+    def failing():
+        yield "first"
+        raise ValueError("database went away")
+
+    serverly.register_function(
+        "GET", "/stream-error", lambda req: serverly.Response(body=failing()))
+    scope = {"type": "http", "method": "GET", "path": "/stream-error", "query_string": b"",
+             "client": ("127.0.0.1", 12345), "headers": []}
+    received = [{"type": "http.request", "body": b"", "more_body": False}]
+    messages = []
+
+    async def receive():
+        if received:
+            return received.pop()
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        messages.append(message)
+
+    before = serverly.statistics.overall_performance["len"]
+    asyncio.run(serverly._uvicorn_server(scope, receive, send))
+    # started responses aren't replaced by an error response, but left incomplete (aborted by the server)
+    assert [m["type"] for m in messages] == [
+        "http.response.start", "http.response.body"]
+    assert messages[0]["status"] == 200
+    assert messages[1]["body"] == b"first" and messages[1]["more_body"]
+    assert serverly.statistics.overall_performance["len"] == before + 1
+
+
+def test_streamed_response_disconnect():
+    closed = []
+
+    async def forever():
+        try:
+            while True:
+                yield b"x"
+        finally:
+            closed.append(True)
+
+    sent = []
+    disconnect = asyncio.Event()
+
+    async def send(message):
+        sent.append(message)
+        if len(sent) == 3:
+            disconnect.set()
+        await asyncio.sleep(0)
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    asyncio.run(serverly._send_stream(send, forever(), receive=receive))
+    assert closed == [True]
+    assert 3 <= len(sent) < 10
+    assert all(m["more_body"] for m in sent)
+
+
+def test_stages():
+    @serverly.serves("GET", "/stages")
+    def stages(request):
+        assert request.timing != None
+        return serverly.objects.Response(body="hi")
+
+    serverly.statistics.reset()
+    try:
+        serverly.statistics.stages = True
+        code, headers, body = asgi_request("GET", "/stages")
+        assert code == 200 and body == b"hi"
+        assert not "server-timing" in headers
+        serverly.statistics.server_timing = True
+        code, headers, body = asgi_request("GET", "/stages")
+        assert [t.split(";")[0] for t in headers["server-timing"].split(", ")] == [
+            "parse", "route", "auth", "handler", "plugins"]
+    finally:
+        serverly.statistics.stages = False
+        serverly.statistics.server_timing = False
+    asgi_request("GET", "/stages")
+    recorded = serverly.statistics.get_endpoint_stages()["stages"]
+    assert recorded["len"] == 2
+    assert recorded["handler"] > 0 and recorded["send"] > 0
+    assert serverly.statistics.endpoint_performance["stages"]["len"] == 3
+
+
 @pytest.mark.skipif("not address_available")
 @pytest.mark.skipif("database_collision")
 def test_server():
@@ -80,3 +350,25 @@ def test_server():
     evaluate()
 
     p.terminate()
+
+
+def test_worker_stripes(monkeypatch):
+    started = []
+
+    class FakeProcess:
+        def __init__(self, target, args, name):
+            started.append(args[:2])
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(multiprocessing, "Process", FakeProcess)
+    server = serverly.Server.__new__(serverly.Server)
+    server._n_workers, server._stripes, server._workers = 3, {}, {}
+    server._config = server._socket = None
+    for i in range(3):
+        server._start_worker(i)
+    server._start_worker(1)  # replacement
+    server._start_worker(1)
+    # a replacement never shares the stripe of the worker it replaces
+    assert started == [(0, 1), (1, 2), (2, 3), (1, 5), (1, 2)]
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+import serverly
+import serverly.slowlog
+from serverly.objects import Response
+from test_serverly import asgi_request
+
+
+@pytest.fixture
+def slowlog():
+    defaults = serverly.slowlog.threshold, serverly.slowlog.sample_interval, serverly.slowlog.size
+    serverly.slowlog.clear()
+    serverly.slowlog.threshold = 0.1
+    serverly.slowlog.sample_interval = 0.01
+    try:
+        yield
+    finally:
+        serverly.slowlog.threshold, serverly.slowlog.sample_interval, serverly.slowlog.size = defaults
+        serverly.slowlog.clear()
+
+
+def takes_its_time():
+    time.sleep(0.3)
+
+
+def test_slow_request(slowlog):
+    @serverly.serves("GET", "/slowlog/slow")
+    def slow(request):
+        takes_its_time()
+        return Response(body="done")
+
+    @serverly.serves("GET", "/slowlog/fast")
+    def fast(request):
+        return Response(body="done")
+
+    asgi_request("GET", "/slowlog/fast")
+    assert serverly.slowlog.get_entries() == []
+    code, headers, body = asgi_request("GET", "/slowlog/slow?x=1")
+    assert code == 200
+    entry, = serverly.slowlog.get_entries()
+    assert entry["request"] == "GET /slowlog/slow?x=1"
+    assert entry["function"] == "slow" and entry["code"] == 200
+    assert entry["duration"] >= 300
+    assert entry["stages"]["handler"] >= 300
+    assert len(entry["samples"]) > 0
+    sample = entry["samples"][0]
+    assert sample["at"] >= 50
+    # the handler's thread, not the event loop's
+    assert sample["stack"][-1].endswith("in takes_its_time")
+    assert sample["stack"][-2].endswith("in slow")
+    assert sum(s["count"] for s in entry["samples"]) > 5  # identical samples are counted
+
+
+def test_size(slowlog):
+    @serverly.serves("GET", "/slowlog/any")
+    async def any_request(request):
+        return Response(body="done")
+
+    serverly.slowlog.threshold = 0
+    serverly.slowlog.size = 2
+    for i in range(3):
+        asgi_request("GET", "/slowlog/any?" + str(i))
+    assert [e["request"] for e in serverly.slowlog.get_entries()] == [
+        "GET /slowlog/any?2", "GET /slowlog/any?1"]
+    assert len(serverly.slowlog._in_flight) == 0
+
+    serverly.slowlog.threshold = None
+    asgi_request("GET", "/slowlog/any?3")
+    assert len(serverly.slowlog.get_entries()) == 2
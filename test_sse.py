@@ -0,0 +1,158 @@
+import asyncio
+import threading
+
+import serverly
+import serverly.sse
+from serverly.sse import Channel, Event, EventStream
+
+
+def test_event_encode():
+    assert Event("hello").encode() == b"data: hello\n\n"
+    assert Event("a\nb", "update", 3, 1000).encode(
+    ) == b"event: update\nid: 3\nretry: 1000\ndata: a\ndata: b\n\n"
+    assert Event({"a": 1}).encode() == b'data: {"a":1}\n\n'
+    assert Event("").encode() == b"data: \n\n"
+    e = Event([1, 2])
+    assert e.encode() is e.encode()
+
+
+def collect(response, n):
+    async def run():
+        chunks = []
+        async for chunk in response.stream:
+            chunks.append(chunk)
+            if len(chunks) == n:
+                break
+        await response.stream.aclose()
+        return chunks
+    return asyncio.run(run())
+
+
+def test_event_stream():
+    def events():
+        yield "a"
+        yield Event({"b": 2}, "custom")
+
+    r = EventStream(events())
+    assert r.headers["content-type"] == "text/event-stream"
+    assert "no-transform" in r.headers["cache-control"]
+    assert collect(r, 3) == [b"data: a\n\n",
+                             b'event: custom\ndata: {"b":2}\n\n']
+
+
+def test_event_stream_heartbeat():
+    async def slow():
+        await asyncio.sleep(0.35)
+        yield "late"
+
+    r = EventStream(slow(), heartbeat=0.1)
+    assert collect(r, 4) == [b": heartbeat\n\n"] * 3 + [b"data: late\n\n"]
+
+
+def test_channel():
+    channel = Channel()
+
+    async def run():
+        a, b = channel.subscribe(), channel.subscribe()
+        first = [asyncio.ensure_future(a.__anext__()),
+                 asyncio.ensure_future(b.__anext__())]
+        await asyncio.sleep(0)
+        assert channel.subscribers == 2
+        # from another thread, e.g. a sync function
+        t = threading.Thread(target=channel.publish,
+                             args=({"x": 1},), kwargs={"event": "update"})
+        t.start()
+        t.join()
+        ea, eb = await asyncio.gather(*first)
+        assert ea is eb  # serialized once
+        assert ea.encode() == b'event: update\ndata: {"x":1}\n\n'
+        await a.aclose()
+        assert channel.subscribers == 1
+        await b.aclose()
+        assert channel.subscribers == 0
+
+        assert await channel.next(timeout=0.05) == None
+        waiter = asyncio.ensure_future(channel.next(timeout=1))
+        await asyncio.sleep(0.01)
+        channel.publish("polled")
+        assert (await waiter).data == "polled"
+        assert channel.subscribers == 0
+    asyncio.run(run())
+
+
+def test_channel_slow_subscriber():
+    default = serverly.sse.queue_size
+    serverly.sse.queue_size = 2
+    channel = Channel()
+
+    async def run():
+        events = channel.subscribe()
+        first = asyncio.ensure_future(events.__anext__())
+        await asyncio.sleep(0)
+        for i in range(5):
+            channel.publish(i)
+        await asyncio.sleep(0)
+        assert (await first).data == 3  # oldest dropped
+        assert (await events.__anext__()).data == 4
+        await events.aclose()
+    try:
+        asyncio.run(run())
+    finally:
+        serverly.sse.queue_size = default
+
+
+def test_channel_source():
+    calls = []
+
+    def source():
+        calls.append(1)
+        return {"n": len(calls)}
+    channel = Channel(source, interval=0.05)
+
+    async def run():
+        a, b = channel.subscribe(), channel.subscribe()
+        ea = await a.__anext__()
+        eb = await b.__anext__()
+        assert ea.data["n"] >= 1 and eb.data["n"] >= 1
+        await a.aclose()
+        await b.aclose()
+        n = len(calls)
+        await asyncio.sleep(0.15)
+        assert len(calls) <= n + 1  # stopped without subscribers
+    asyncio.run(run())
+
+
+def test_event_stream_disconnect():
+    channel = Channel()
+    serverly.register_function(
+        "GET", "/sse-events", lambda req: EventStream(channel.subscribe()))
+    sent = []
+
+    async def run():
+        disconnect = asyncio.Event()
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/sse-events",
+                 "query_string": b"", "client": ("127.0.0.1", 1), "headers": []}
+        server = asyncio.ensure_future(
+            serverly._uvicorn_server(scope, receive, send))
+        while channel.subscribers == 0:
+            await asyncio.sleep(0.01)
+        channel.publish("hi")
+        while len(sent) < 2:
+            await asyncio.sleep(0.01)
+        disconnect.set()
+        await asyncio.wait_for(server, 1)
+    asyncio.run(run())
+    assert sent[0]["status"] == 200
+    assert sent[1]["body"] == b"data: hi\n\n"
+    assert channel.subscribers == 0
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+
+import pytest
+import serverly.staticfiles
+from serverly.objects import FileResponse, Response, StaticSite
+from serverly.staticfiles import send_file
+
+FILENAME = "test_staticfiles.tmp"
+
+
+@pytest.fixture
+def data():
+    content = os.urandom(200 * 1024 + 7)
+    with open(FILENAME, "wb") as f:
+        f.write(content)
+    yield content
+    os.remove(FILENAME)
+
+
+def send_all(extensions={}, offset=0, count=None):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+    asyncio.run(send_file(send, FILENAME, extensions, offset, count))
+    return messages
+
+
+def test_send_file_chunked(data):
+    messages = send_all()
+    assert len(messages) == 4
+    assert all(len(m["body"]) <= serverly.staticfiles.chunk_size for m in messages)
+    assert [m["more_body"] for m in messages] == [True, True, True, False]
+    assert b"".join(m["body"] for m in messages) == data
+
+    messages = send_all(offset=10, count=100)
+    assert b"".join(m["body"] for m in messages) == data[10:110]
+
+    messages = send_all(offset=len(data))
+    assert messages == [{"type": "http.response.body",
+                         "body": b"", "more_body": False}]
+
+
+def test_send_file_extensions(data):
+    messages = send_all({"http.response.pathsend": {}})
+    assert messages == [{"type": "http.response.pathsend",
+                         "path": os.path.abspath(FILENAME)}]
+
+    messages = send_all({"http.response.zerocopysend": {}}, 5, 10)
+    assert len(messages) == 1
+    assert messages[0]["type"] == "http.response.zerocopysend"
+    assert messages[0]["offset"] == 5
+    assert messages[0]["count"] == 10
+
+
+def test_static_site_streaming(data):
+    threshold = serverly.staticfiles.stream_threshold
+    try:
+        serverly.staticfiles.stream_threshold = 1024
+        r = StaticSite("/tmpfile", FILENAME).get_content()
+        assert isinstance(r, FileResponse)
+        assert r.body == ""
+        assert r.headers["content-length"] == str(len(data))
+        assert r.headers["content-type"] == "application/octet-stream"
+
+        serverly.staticfiles.stream_threshold = len(data)
+        r = StaticSite("/tmpfile", FILENAME).get_content()
+        assert not isinstance(r, FileResponse)
+        assert r.body_bytes == data
+    finally:
+        serverly.staticfiles.stream_threshold = threshold
+
+
+def test_bytes_body():
+    r = Response(body=b"\x00\x01")
+    assert r.body == b"\x00\x01"
+    assert r.obj == None
+    assert r.body_bytes == b"\x00\x01"
+    assert r.headers["content-type"] == "application/octet-stream"
+
+
+@pytest.fixture(params=[False, True])
+def cache(request):
+    if request.param and serverly.staticfiles.inotify_simple == None:
+        pytest.skip("inotify_simple not installed")
+    config = serverly.staticfiles.cache_size, serverly.staticfiles.use_inotify
+    serverly.staticfiles.use_inotify = request.param
+    serverly.staticfiles._watcher_pid = None
+    serverly.staticfiles.clear()
+    with open(FILENAME, "w") as f:
+        f.write("hello")
+    yield serverly.staticfiles
+    serverly.staticfiles.clear()
+    serverly.staticfiles.cache_size, serverly.staticfiles.use_inotify = config
+    os.remove(FILENAME)
+
+
+def modify(content):
+    with open(FILENAME, "w") as f:
+        f.write(content)
+    st = os.stat(FILENAME)
+    os.utime(FILENAME, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+    time.sleep(0.1)  # let the watcher (if any) process the event
+
+
+def test_cache(cache):
+    assert cache.get(FILENAME) == None
+    r = StaticSite("/tmpfile", FILENAME).get_content()
+    entry = cache.get(FILENAME)
+    assert entry != None
+    assert entry.body == "hello"
+    assert r.body == "hello"
+    assert r.headers["etag"] == entry.etag
+    assert StaticSite("/tmpfile", FILENAME).get_content().headers["etag"] == entry.etag
+    assert cache.get(FILENAME) is entry
+
+    modify("hello, world")
+    assert cache.get(FILENAME) == None
+    r = StaticSite("/tmpfile", FILENAME).get_content()
+    assert r.body == "hello, world"
+    assert r.headers["etag"] != entry.etag
+
+
+def test_cache_eviction(cache):
+    other = FILENAME + "2"
+    with open(other, "w") as f:
+        f.write("world")
+    try:
+        cache.cache_size = 8
+        cache.load(FILENAME)
+        assert cache.get(FILENAME) != None
+        cache.load(other)
+        assert cache.get(other) != None
+        assert cache.get(FILENAME) == None
+        assert cache._cache_bytes == 5
+
+        cache.cache_size = 0
+        cache.clear()
+        cache.load(FILENAME)
+        assert cache.get(FILENAME) == None
+    finally:
+        os.remove(other)
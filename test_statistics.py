@@ -1,6 +1,8 @@
 import json
+import multiprocessing
 import random
 import sys
+import time
 
 import serverly
 import serverly.statistics
@@ -73,3 +75,137 @@ def test_print_stats(capsys):
     with open(serverly.statistics.filename, "r") as f:
         assert json.load(f) == {"overall_performance": serverly.statistics.overall_performance,
                                 "endpoint_performance": serverly.statistics.endpoint_performance}
+
+
+def test_new_route_cache_access():
+    serverly.statistics.reset()
+    assert serverly.statistics.route_cache == {"hits": 0, "misses": 0}
+    serverly.statistics.new_route_cache_access(True)
+    serverly.statistics.new_route_cache_access(True)
+    serverly.statistics.new_route_cache_access(False)
+    assert serverly.statistics.route_cache == {"hits": 2, "misses": 1}
+    serverly.statistics.reset()
+    assert serverly.statistics.route_cache == {"hits": 0, "misses": 0}
+
+
+def _record(stripe: int, n: int):
+    serverly.statistics._set_stripe(stripe)
+    for i in range(n):
+        serverly.statistics.new_statistic("shared_" + str(i % 2), stripe)
+    serverly.statistics.new_route_cache_access(True)
+
+
+def test_shared_statistics():
+    local = serverly.statistics._storage
+    serverly.statistics._init_shared(4)
+    try:
+        serverly.statistics.new_statistic("shared_0", 0.5)
+        ctx = multiprocessing.get_context("fork")
+        processes = [ctx.Process(target=_record, args=(i, 10 * i))
+                     for i in range(1, 4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            assert p.exitcode == 0
+        # aggregated without asking the processes
+        overall = serverly.statistics.overall_performance
+        assert overall["len"] == 61
+        assert overall["min"] == 500.0 and overall["max"] == 3000.0
+        endpoints = serverly.statistics.endpoint_performance
+        assert endpoints["shared_0"]["len"] == 31
+        assert endpoints["shared_1"]["len"] == 30
+        validate(endpoints["shared_0"], 31)
+        assert serverly.statistics.route_cache == {"hits": 3, "misses": 0}
+
+        serverly.statistics.reset()
+        assert serverly.statistics.endpoint_performance == {}
+        assert serverly.statistics.overall_performance["len"] == 0
+    finally:
+        serverly.statistics._storage = local
+
+
+def test_max_endpoints():
+    serverly.statistics.reset()
+    for i in range(serverly.statistics.max_endpoints + 5):
+        serverly.statistics.new_statistic("endpoint" + str(i), 0.001)
+    assert len(serverly.statistics.endpoint_performance) == serverly.statistics.max_endpoints
+    validate(serverly.statistics.overall_performance,
+             serverly.statistics.max_endpoints + 5)
+    serverly.statistics.reset()
+
+
+def test_histogram_buckets():
+    b = serverly.statistics._bucket
+    lower, upper = serverly.statistics._LOWER, serverly.statistics._UPPER
+    assert b(0) == 0 and b(0.0009) == 0
+    assert b(0.001) == 1  # 1us
+    for t in [0.001, 0.0011, 0.0019, 0.002, 0.5, 1, 1.06, 3.9, 999.999, 1000, 123456.7]:
+        i = b(t)
+        assert lower[i] <= t < upper[i]
+        assert (upper[i] - lower[i]) / lower[i] <= 1 / serverly.statistics._SUB_BUCKETS + 1e-9
+    assert b(1e12) == serverly.statistics._BUCKETS - 1  # too slow: last bucket
+    # buckets are contiguous
+    assert all(upper[:-1] == lower[1:])
+
+
+def test_percentiles():
+    serverly.statistics.reset()
+    random.seed(4)
+    values = [random.lognormvariate(0, 1.5) for i in range(20000)]  # ms
+    for v in values:
+        serverly.statistics.new_statistic("lognormal", v / 1000)
+    serverly.statistics.new_statistic("single", 0.0042)
+    stats = serverly.statistics.endpoint_performance
+    values.sort()
+    for q, key in [(50, "p50"), (90, "p90"), (99, "p99"), (99.9, "p999")]:
+        exact = values[int(len(values) * q / 100)]
+        assert abs(stats["lognormal"][key] - exact) / exact < 0.07
+    # clipped to what was actually measured
+    assert stats["single"]["p50"] == stats["single"]["p999"] == 4.2
+    assert stats["lognormal"]["p999"] <= stats["lognormal"]["max"]
+    overall = serverly.statistics.overall_performance
+    assert overall["len"] == 20001 and overall["p50"] > 0
+
+    serverly.statistics.reset()
+    assert serverly.statistics.overall_performance["p99"] == 0.0
+
+
+def test_percentiles_exposed(capsys):
+    serverly.statistics.reset()
+    serverly.statistics.new_statistic("exposed", 0.01)
+    serverly.statistics.print_stats()
+    out, err = capsys.readouterr()
+    for i in ["p50", "p90", "p99", "p999"]:
+        assert i in out
+    with open(serverly.statistics.filename, "r") as f:
+        assert json.load(f)["endpoint_performance"]["exposed"]["p99"] == 10.0
+    serverly.statistics.reset()
+
+
+def test_stages():
+    serverly.statistics.reset()
+    assert serverly.statistics.get_overall_stages() == None
+    serverly.statistics.new_statistic("untimed", 0.01)
+    timing = serverly.statistics.Timing()
+    timing.lap(serverly.statistics.ROUTE)
+    timing.start_auth()
+    timing.start_auth()  # nested decorators
+    time.sleep(0.01)
+    timing.stop_auth()
+    timing.stop_auth()
+    timing.lap(serverly.statistics.HANDLER)
+    timing.stop()
+    assert timing.durations[serverly.statistics.AUTH] >= 0.01
+    assert timing.durations[serverly.statistics.HANDLER] < 0.01
+    assert timing.header().startswith("parse;dur=0.000, route;dur=")
+    assert not "send" in timing.header()
+
+    timing.durations = [0.001, 0.002, 0.003, 0.004, 0.005, 0.006]
+    serverly.statistics.new_statistic("timed", 0.021, timing)
+    stages = serverly.statistics.get_endpoint_stages()
+    assert list(stages.keys()) == ["timed"]
+    assert stages["timed"] == {"parse": 1.0, "route": 2.0, "auth": 3.0,
+                               "handler": 4.0, "plugins": 5.0, "send": 6.0, "len": 1}
+    assert serverly.statistics.get_overall_stages() == stages["timed"]
+    assert serverly.statistics.overall_performance["len"] == 2
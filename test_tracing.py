@@ -0,0 +1,109 @@
+import json
+import time
+
+import pytest
+import serverly
+import serverly.tracing
+from serverly.objects import Response
+from test_serverly import asgi_request
+
+PARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+@pytest.fixture
+def tracing(tmp_path):
+    """Enable tracing, exporting to a temporary file. Yields a function returning the spans exported so far."""
+    path = tmp_path / "traces.jsonl"
+    serverly.tracing.enabled = True
+    serverly.tracing.filename = str(path)
+
+    def spans():
+        serverly.tracing.flush()
+        result = []
+        if path.exists():
+            for line in path.read_text().splitlines():
+                for r in json.loads(line)["resourceSpans"]:
+                    for s in r["scopeSpans"]:
+                        result.extend(s["spans"])
+        return result
+    try:
+        yield spans
+    finally:
+        serverly.tracing.flush()
+        serverly.tracing.enabled = False
+        serverly.tracing.filename = "traces.jsonl"
+        serverly.tracing.sample_rate = 1.0
+
+
+def test_not_traced():
+    assert serverly.tracing.current_span() == None
+    assert serverly.tracing.start_span("nothing") == None
+    assert serverly.tracing.traceparent() == None
+    with serverly.tracing.span("nothing") as s:
+        s.set_attribute("a", 1)
+
+
+def test_spans(tracing):
+    scope = {"method": "GET", "path": "/spans", "client": ("127.0.0.1", 1),
+             "headers": [(b"traceparent", PARENT.encode())]}
+    root = serverly.tracing.start_request(scope)
+    assert serverly.tracing.current_span() is root
+    assert root.trace_id == "0af7651916cd43dd8448eb211c80319c"
+    assert root.parent_id == "b7ad6b7169203331"
+    with pytest.raises(ValueError):
+        with serverly.tracing.span("child", rows=3) as child:
+            assert serverly.tracing.traceparent() == child.traceparent
+            raise ValueError("broken")
+    assert serverly.tracing.current_span() is root
+
+    @serverly.tracing.traced()
+    def decorated():
+        return serverly.tracing.current_span().name
+    assert decorated().endswith("decorated")
+    root.end()
+    root.end()
+    assert serverly.tracing.current_span() == None
+
+    spans = {s["name"]: s for s in tracing()}
+    assert len(spans) == 3
+    assert spans["GET"]["kind"] == serverly.tracing.SERVER
+    assert spans["GET"]["parentSpanId"] == "b7ad6b7169203331"
+    child = spans["child"]
+    assert child["traceId"] == root.trace_id and child["parentSpanId"] == root.span_id
+    assert child["status"] == {"code": 2, "message": "broken"}
+    assert {"key": "rows", "value": {"intValue": "3"}} in child["attributes"]
+    assert int(child["endTimeUnixNano"]) >= int(child["startTimeUnixNano"])
+
+
+def test_traced_request(tracing):
+    @serverly.serves("GET", "/traced")
+    def traced(request):  # sync, so run in the thread pool
+        with serverly.tracing.span("work"):
+            time.sleep(0.001)
+        return Response(body="ok")
+
+    code, headers, body = asgi_request("GET", "/traced", {"traceparent": PARENT})
+    assert code == 200
+    trace_id, span_id = headers["traceresponse"].split("-")[1:3]
+    assert trace_id == "0af7651916cd43dd8448eb211c80319c"
+    spans = {s["name"]: s for s in tracing()}
+    assert spans["GET traced"]["spanId"] == span_id
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in spans["GET traced"]["attributes"]
+    assert spans["route"]["parentSpanId"] == span_id
+    assert spans["work"]["parentSpanId"] == span_id
+
+
+def test_sampling(tracing):
+    @serverly.serves("GET", "/sampled")
+    async def sampled(request):
+        return Response(body="ok")
+
+    serverly.tracing.sample_rate = 0
+    code, headers, body = asgi_request("GET", "/sampled")
+    assert not "traceresponse" in headers
+    code, headers, body = asgi_request(
+        "GET", "/sampled", {"traceparent": PARENT[:-2] + "00"})
+    assert not "traceresponse" in headers
+    code, headers, body = asgi_request("GET", "/sampled", {"traceparent": PARENT})
+    assert "traceresponse" in headers
+    assert [s["name"] for s in tracing()] == ["route", "GET sampled"]
@@ -334,3 +334,163 @@ def test_clear_all():
     assert len(auth.get_all_tokens()) > 0
     auth.clear_all_tokens()
     assert len(auth.get_all_tokens()) == 0
+
+
+def test_console_static_files():
+    import gzip
+    import serverly.compression
+    import serverly.default_sites
+    import serverly.user.api as api
+    from test_serverly import asgi_request
+
+    existed = os.path.isdir("console")
+    api.use("console.all", "GET", "/console")
+    assert os.path.isdir("console") == existed  # nothing written to disk
+
+    code, headers, body = asgi_request(
+        "GET", "/console/static/js/consoleIndex.js")
+    assert code == 200
+    assert headers["content-type"] in ("application/javascript", "text/javascript")
+    assert headers["cache-control"] == "no-cache"
+    assert not b"SUPERPATH" in body and not b"$_console" in body
+    assert bytes(api._reversed_api["_console_api_renew_login"], "utf-8") in body
+    etag = headers["etag"]
+
+    html = api._get_content(serverly.default_sites.console_index)
+    version = api._get_console_static()[1]
+    assert "consoleIndex.js?v=" + version in html
+    code, headers, gzipped = asgi_request(
+        "GET", "/console/static/js/consoleIndex.js?v=" + version, {"Accept-Encoding": "gzip"})
+    assert headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert gzip.decompress(gzipped) == body
+    assert gzipped in serverly.compression._precompressed.values()
+
+    code, headers, _ = asgi_request(
+        "GET", "/console/static/js/consoleIndex.js", {"If-None-Match": etag})
+    assert code == 304
+
+    # built once, in the handler thread pool instead of on the event loop
+    import concurrent.futures
+    import inspect
+    assert not inspect.iscoroutinefunction(api._console_static_file)
+    api._console_static = None
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        built = list(executor.map(lambda _: api._get_console_static()[0], range(8)))
+    assert all(assets is built[0] for assets in built)
+
+
+def test_console_statistics_events():
+    import serverly.user.api as api
+    api.use("console.all", "GET", "/console")
+    assert api._reversed_api["_console_api_statistics_events"] == "/console/api/statistics/events"
+    js = api._get_console_static()[0]["/console/static/js/consoleStatistics.js"].body
+    assert b'"/console/api/statistics/events"' in js
+    stats = api._get_statistics()
+    assert "overall" in stats
+    assert not "overall" in serverly.statistics.endpoint_performance
+    assert api._statistics_channel.source == api._get_statistics
+
+    serverly.statistics.reset()
+    serverly.statistics.new_statistic("exposed", 0.01)
+    stats = api._get_statistics()  # console.api.statistics.get
+    assert stats["exposed"]["p99"] == stats["overall"]["p99"] == 10.0
+
+
+def test_metrics_endpoint():
+    import serverly.metrics
+    import serverly.user.api as api
+    from test_serverly import asgi_request
+    from test_metrics import samples
+
+    api.use("metrics", "GET", "/metrics")
+    serverly.metrics.clear()
+    checkouts = user.get_pool_statistics()["checkouts"]
+    user.get_all()
+    assert user.get_pool_statistics()["checkouts"] == checkouts + 1
+    code, headers, body = asgi_request("GET", "/metrics")
+    assert code == 200
+    assert headers["content-type"].startswith("application/openmetrics-text")
+    s = samples(body)
+    assert 'serverly_db_pool_connections{state="checked_out"}' in s
+    assert s["serverly_db_pool_checkouts_total"] == checkouts + 1
+
+
+def test_auth_stage():
+    import serverly.statistics
+
+    @auth.basic_auth
+    @serverly.user.requires_role("normal")
+    def protected(req: Request):
+        time.sleep(0.01)
+        return valid
+
+    req = g("basic", ("temporary", "temporary"), True)
+    req.timing = serverly.statistics.Timing()
+    compare(protected(req), valid)
+    req.timing.lap(serverly.statistics.HANDLER)
+    req.timing.stop()
+    durations = req.timing.durations
+    assert durations[serverly.statistics.AUTH] > 0
+    assert durations[serverly.statistics.HANDLER] >= 0.01
+    assert protected.__name__ == "protected"
+
+
+def test_auth_and_db_spans(tmp_path):
+    import json
+    import serverly.tracing
+
+    @auth.basic_auth
+    def protected(req: Request):
+        return valid
+
+    serverly.tracing.enabled = True
+    serverly.tracing.filename = str(tmp_path / "traces.jsonl")
+    try:
+        root = serverly.tracing.start_request(
+            {"method": "GET", "path": "/protected", "headers": []})
+        compare(protected(g("basic", ("temporary", "temporary"), True)), valid)
+        compare(protected(g("basic", ("temporary", "invalid"), True)), invalid_auth)
+        root.end()
+        serverly.tracing.flush()
+    finally:
+        serverly.tracing.enabled = False
+        serverly.tracing.filename = "traces.jsonl"
+    with open(tmp_path / "traces.jsonl") as f:
+        spans = [s for line in f for s in json.loads(
+            line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    auth_spans = [s for s in spans if s["name"] == "basic_auth"]
+    assert [a["attributes"] for a in auth_spans] == [
+        [{"key": "authorized", "value": {"boolValue": True}}],
+        [{"key": "authorized", "value": {"boolValue": False}}]]
+    assert all(s["parentSpanId"] == root.span_id for s in auth_spans)
+    queries = [s for s in spans if s["name"] == "db SELECT"]
+    assert len(queries) >= 2
+    assert all(s["parentSpanId"] in (a["spanId"] for a in auth_spans) for s in queries)
+
+
+def test_console_slow_requests():
+    import serverly.user.api as api
+    api.use("console.all", "GET", "/console")
+    assert api._reversed_api["_console_api_slow_requests"] == "/console/api/slowrequests"
+
+
+def test_console_profile():
+    import serverly.user.api as api
+    api.use("console.api.profile", "GET", "/console/api/profile")
+    assert api._reversed_api["_console_api_profile"] == "/console/api/profile"
+    user.register("profiler", "profiler", role="admin")
+
+    def profile(query: str):
+        request = g("basic", ("profiler", "profiler"), True)
+        request.path = parse.urlparse("/console/api/profile?" + query)
+        return api._console_api_profile(request)
+
+    response = profile("seconds=0.05&idle=1")
+    assert response.code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert all(line.rsplit(" ", 1)[1].isdigit()
+               for line in response.body.splitlines())
+    assert profile("seconds=0").code == 406
+    assert profile("seconds=1000").code == 406
+    assert profile("seconds=abc").code == 406
+    user.delete("profiler")
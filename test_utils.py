@@ -194,3 +194,34 @@ def test_get_bytes():
     assert get_bytes(
         {"helele": 42}, "application/octet-stream") == {"helele": 42}
     assert get_bytes(True) == True
+
+
+def test_http_date():
+    assert http_date(784111777) == "Sun, 06 Nov 1994 08:49:37 GMT"
+    assert parse_http_date("Sun, 06 Nov 1994 08:49:37 GMT") == 784111777
+    assert parse_http_date("Sunday, 06-Nov-94 08:49:37 GMT") == 784111777
+    assert parse_http_date("yesterday") == None
+    assert parse_http_date(None) == None
+
+
+def test_is_not_modified():
+    etag = '"abc"'
+    date = "Sun, 06 Nov 1994 08:49:37 GMT"
+    response = {"etag": etag, "last-modified": date}
+    assert is_not_modified({"if-none-match": etag}, response)
+    assert is_not_modified({"if-none-match": 'W/"abc"'}, response)
+    assert is_not_modified({"if-none-match": '"x", "abc"'}, response)
+    assert is_not_modified({"if-none-match": "*"}, response)
+    assert not is_not_modified({"if-none-match": '"abcd"'}, response)
+    assert not is_not_modified({"if-none-match": etag}, {})
+    # If-None-Match takes precedence
+    assert not is_not_modified(
+        {"if-none-match": '"x"', "if-modified-since": date}, response)
+    assert is_not_modified({"if-modified-since": date}, response)
+    assert is_not_modified(
+        {"if-modified-since": "Mon, 07 Nov 1994 08:49:37 GMT"}, response)
+    assert not is_not_modified(
+        {"if-modified-since": "Sat, 05 Nov 1994 08:49:37 GMT"}, response)
+    assert not is_not_modified({"if-modified-since": "invalid"}, response)
+    assert not is_not_modified({}, response)
+    assert content_etag(b"hello") == content_etag(b"hello") != content_etag(b"hello!")
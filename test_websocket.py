@@ -0,0 +1,165 @@
+import asyncio
+import json
+
+import serverly
+import serverly.websocket
+from serverly.objects import Response
+
+
+class Client:
+    """Fake ASGI WebSocket client: what the server receives is put into `incoming`, what it sends is collected in `sent`."""
+
+    def __init__(self, path: str, headers: dict = {}, extensions: dict = {}):
+        self.scope = {"type": "websocket", "path": path, "query_string": b"", "client": ("127.0.0.1", 12345),
+                      "headers": [[bytes(k.lower(), "utf-8"), bytes(v, "utf-8")] for k, v in headers.items()],
+                      "subprotocols": ["chat"], "extensions": extensions}
+        self.incoming = asyncio.Queue()
+        self.sent = []
+        self.incoming.put_nowait({"type": "websocket.connect"})
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    def say(self, text: str):
+        self.incoming.put_nowait(
+            {"type": "websocket.receive", "text": text})
+
+    def disconnect(self, code: int = 1001):
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": code})
+
+    def serve(self):
+        return asyncio.ensure_future(serverly._uvicorn_server(self.scope, self.receive, self.send))
+
+    def texts(self):
+        return [m["text"] for m in self.sent if m["type"] == "websocket.send"]
+
+
+def test_websocket_echo():
+    @serverly.serves("websocket", "/ws/echo")
+    async def echo(ws):
+        await ws.accept(ws.subprotocols[0])
+        async for message in ws:
+            await ws.send({"echo": message})
+
+    async def run():
+        client = Client("/ws/echo")
+        client.say("hello")
+        client.say("world")
+        client.disconnect()
+        await asyncio.wait_for(client.serve(), 1)
+        assert client.sent[0]["type"] == "websocket.accept"
+        assert client.sent[0]["subprotocol"] == "chat"
+        assert [json.loads(t) for t in client.texts()] == [
+            {"echo": "hello"}, {"echo": "world"}]
+        assert client.sent[-1]["type"] != "websocket.close"  # closed by client
+        assert len(serverly.websocket.connections) == 0
+    asyncio.run(run())
+
+
+def test_websocket_close():
+    @serverly.serves("websocket", "/ws/once")
+    async def once(ws):
+        await ws.send(b"\x00\x01")
+
+    @serverly.serves("websocket", "/ws/broken")
+    async def broken(ws):
+        await ws.accept()
+        raise ValueError("nope")
+
+    async def run():
+        client = Client("/ws/once")
+        await asyncio.wait_for(client.serve(), 1)
+        assert [m["type"] for m in client.sent] == [
+            "websocket.accept", "websocket.send", "websocket.close"]
+        assert client.sent[1]["bytes"] == b"\x00\x01"
+        assert client.sent[2]["code"] == 1000
+
+        client = Client("/ws/broken")
+        await asyncio.wait_for(client.serve(), 1)
+        assert client.sent[-1] == {"type": "websocket.close",
+                                   "code": 1011, "reason": ""}
+    asyncio.run(run())
+
+
+def test_websocket_deny():
+    def auth(func):  # like serverly.user.auth's decorators
+        def wrapper(request):
+            if request.headers.get("authorization", None) != "Bearer secret":
+                return Response(401, {"www-authenticate": "bearer"}, "Unauthorized")
+            return func(request)
+        wrapper.__name__ = func.__name__
+        return wrapper
+
+    async def protected(ws):
+        await ws.send("welcome")
+    serverly.register_function("websocket", "/ws/protected", auth(protected))
+
+    async def run():
+        client = Client("/ws/protected", extensions={
+                        "websocket.http.response": {}})
+        await asyncio.wait_for(client.serve(), 1)
+        assert client.sent[0]["type"] == "websocket.http.response.start"
+        assert client.sent[0]["status"] == 401
+        assert [b"www-authenticate", b"bearer"] in client.sent[0]["headers"]
+        assert client.sent[1] == {
+            "type": "websocket.http.response.body", "body": b"Unauthorized"}
+
+        client = Client("/ws/protected")  # server doesn't support denial responses
+        await asyncio.wait_for(client.serve(), 1)
+        assert client.sent == [
+            {"type": "websocket.close", "code": 1008, "reason": ""}]
+
+        client = Client("/ws/protected", {"Authorization": "Bearer secret"})
+        await asyncio.wait_for(client.serve(), 1)
+        assert client.texts() == ["welcome"]
+
+        client = Client("/ws/notfound", extensions={
+                        "websocket.http.response": {}})
+        await asyncio.wait_for(client.serve(), 1)
+        assert client.sent[0]["status"] == 404
+    asyncio.run(run())
+
+
+def test_websocket_not_served_over_http():
+    from test_serverly import asgi_request
+
+    @serverly.serves("websocket", "/ws/http")
+    async def ws_only(ws):
+        await ws.accept()
+
+    code, headers, body = asgi_request("WEBSOCKET", "/ws/http")
+    assert code == 404
+
+
+def test_broadcast():
+    @serverly.serves("websocket", "/ws/room")
+    async def room(ws):
+        await ws.accept()
+        ws.join("room")
+        async for message in ws:
+            await serverly.websocket.broadcast(message, "room", exclude=ws)
+
+    async def run():
+        a, b, c = Client("/ws/room"), Client("/ws/room"), Client("/ws/room")
+        servers = [a.serve(), b.serve(), c.serve()]
+        await asyncio.sleep(0.05)
+        assert len(serverly.websocket.group("room")) == 3
+        a.say("hi")
+        await asyncio.sleep(0.05)
+        assert a.texts() == [] and b.texts() == ["hi"] and c.texts() == ["hi"]
+
+        c.disconnect()
+        await asyncio.sleep(0.05)
+        assert len(serverly.websocket.group("room")) == 2
+        assert await serverly.websocket.broadcast({"n": 1}) == 2
+        assert await serverly.websocket.broadcast("x", "nobody") == 0
+
+        a.disconnect()
+        b.disconnect()
+        await asyncio.wait_for(asyncio.gather(*servers), 1)
+        assert serverly.websocket.group("room") == set()
+        assert len(serverly.websocket.connections) == 0
+    asyncio.run(run())